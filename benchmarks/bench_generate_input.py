@@ -0,0 +1,52 @@
+"""
+Benchmark input deck generation through `check_settings` and the generic
+printer, against the compiled model of `elsepa.compiled`.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_generate_input
+"""
+
+import timeit
+
+import numpy as np
+
+from cslib import units
+from cslib.settings import Settings
+
+from elsepa.generate_input import generate_elscata_input
+
+
+cases = [
+    ('1 energy', 1),
+    ('40 energies', 40),
+    ('1000 energies', 1000),
+]
+
+
+def make_settings(n):
+    return Settings(IZ=79, MUFFIN=1, RMUF=1.44e-8 * units.cm,
+                    EV=np.logspace(1, 5, n) * units.eV)
+
+
+def bench(settings, compiled, number):
+    t = timeit.repeat(
+        lambda: generate_elscata_input(settings, compiled=compiled),
+        number=number, repeat=5)
+    return min(t) / number
+
+
+if __name__ == "__main__":
+    print("{:25} {:>12} {:>12} {:>8}".format(
+        "case", "old (ms)", "new (ms)", "speedup"))
+    for name, n in cases:
+        settings = make_settings(n)
+        a = generate_elscata_input(settings, compiled=False)
+        b = generate_elscata_input(settings, compiled=True)
+        assert a == b
+
+        number = max(10, 2000 // n)
+        old = bench(settings, False, number)
+        new = bench(settings, True, number)
+        print("{:25} {:12.3f} {:12.3f} {:8.1f}".format(
+            name, old * 1e3, new * 1e3, old / new))
@@ -0,0 +1,60 @@
+"""
+Benchmark the time it takes to import parts of `elsepa` in a fresh
+interpreter, as short-lived worker processes do, and check that the
+`docker` module is not loaded unless it is needed.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_import
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+
+from .fake_elscata import root
+
+
+modules = [
+    'elsepa',
+    'elsepa.parse_output',
+    'elsepa.generate_input',
+    'elsepa.run',
+    'elsepa.batch',
+    'elsepa.executable',
+]
+
+probe = """
+import sys, time, json
+t = time.perf_counter()
+import {module}
+t = time.perf_counter() - t
+print(json.dumps({{'time': t, 'docker': 'docker' in sys.modules}}))
+"""
+
+
+def import_time(module, repeat=10):
+    """Import `module` in `repeat` fresh interpreters.
+
+    :return:
+        Tuple of the minimum and median import time in seconds, and
+        whether `docker` was loaded.
+    """
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, '-c', probe.format(module=module)],
+            cwd=root, check=True, stdout=subprocess.PIPE).stdout
+        r = json.loads(out.decode())
+        times.append(r['time'])
+    return min(times), statistics.median(times), r['docker']
+
+
+if __name__ == "__main__":
+    print("{:25} {:>10} {:>10} {:>8}".format(
+        "module", "min (ms)", "med (ms)", "docker"))
+    for module in modules:
+        t_min, t_med, docker = import_time(module)
+        print("{:25} {:10.1f} {:10.1f} {:>8}".format(
+            module, t_min * 1e3, t_med * 1e3, 'yes' if docker else 'no'))
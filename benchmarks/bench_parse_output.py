@@ -0,0 +1,66 @@
+"""
+Benchmark the ELSCATA output parser against the original line-by-line
+implementation, on synthetic files of realistic size.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_parse_output
+"""
+
+import timeit
+from itertools import takewhile
+
+import numpy as np
+
+from cslib import DataFrame
+
+from elsepa.parse_output import (parse_most_elscata_output, extract_header)
+from .synthetic import (dcs_file, tcstable_file)
+
+
+def parse_line_by_line(lines):
+    """The parser as it was before it was vectorized."""
+    lines = iter(lines)
+
+    def is_comment(l):
+        return l.startswith(" #") and not l.startswith(" #---")
+
+    comments = [line[2:] for line in takewhile(is_comment, lines)]
+    header = extract_header(comments)
+
+    def is_data(row):
+        return len(row) == len(header)
+
+    values = (tuple(float(v) for v in l.split()) for l in lines)
+    raw_data = list(filter(is_data, values))
+    data = np.array(raw_data, dtype=[(h[0], float) for h in header])
+
+    return DataFrame(data, units=[h[1] for h in header], comments=comments)
+
+
+cases = [
+    ('dcs, 606 angles', dcs_file(n_angles=606)),
+    ('dcs, 5000 angles', dcs_file(n_angles=5000)),
+    ('tcstable, 40 energies', tcstable_file(np.logspace(1, 5, 40))),
+    ('tcstable, 1000 energies', tcstable_file(np.logspace(1, 5, 1000))),
+]
+
+
+def bench(parser, text, number):
+    lines = text.split('\n')
+    t = timeit.repeat(lambda: parser(lines), number=number, repeat=5)
+    return min(t) / number
+
+
+if __name__ == "__main__":
+    print("{:25} {:>12} {:>12} {:>8}".format(
+        "case", "old (ms)", "new (ms)", "speedup"))
+    for name, text in cases:
+        a = parse_line_by_line(text.split('\n'))
+        b = parse_most_elscata_output(text.split('\n'))
+        assert np.array_equal(np.asarray(a), np.asarray(b))
+
+        old = bench(parse_line_by_line, text, 20)
+        new = bench(parse_most_elscata_output, text, 20)
+        print("{:25} {:12.3f} {:12.3f} {:8.1f}".format(
+            name, old * 1e3, new * 1e3, old / new))
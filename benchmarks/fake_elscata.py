@@ -0,0 +1,66 @@
+"""
+Stand-in for ELSCATA
+====================
+
+A fake ELSCATA executable that reads an input deck from standard input
+and writes canned output files of realistic size: a `dcs_*.dat` file for
+every `EV` line and a `tcstable.dat`. This lets the whole pipeline be
+benchmarked without the Fortran code.
+
+`make_executable` writes a small script that runs `main` with the Python
+interpreter running the benchmarks; pass its path to `NativeBackend`.
+"""
+
+import os
+import stat
+import sys
+
+from .synthetic import (dcs_file, tcstable_file)
+
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+script = """#!{python}
+import sys
+sys.path.insert(0, {root!r})
+from benchmarks.fake_elscata import main
+main(n_angles={n_angles})
+"""
+
+
+def dcs_name(energy):
+    """Name of the `dcs_*` file for an energy (eV), as ELSCATA writes
+    it."""
+    return 'dcs_' + '{:.3e}'.format(energy).replace('.', 'p') \
+        .replace('+', '')
+
+
+def write_outputs(input_deck, path='.', n_angles=606):
+    """Write the output files for an input deck into directory `path`."""
+    energies = [float(l.split()[1]) for l in input_deck.splitlines()
+                if l.startswith('EV')]
+
+    for e in energies:
+        with open(os.path.join(path, dcs_name(e) + '.dat'), 'w') as f:
+            f.write(dcs_file(e, n_angles))
+
+    with open(os.path.join(path, 'tcstable.dat'), 'w') as f:
+        f.write(tcstable_file(energies))
+
+
+def main(n_angles=606):
+    write_outputs(sys.stdin.read(), n_angles=n_angles)
+
+
+def make_executable(path, n_angles=606):
+    """Write the fake executable into directory `path`.
+
+    :return:
+        Path of the executable.
+    """
+    filename = os.path.join(path, 'elscata')
+    with open(filename, 'w') as f:
+        f.write(script.format(python=sys.executable, root=root,
+                              n_angles=n_angles))
+    os.chmod(filename, os.stat(filename).st_mode | stat.S_IXUSR)
+    return filename
@@ -0,0 +1,226 @@
+"""
+Benchmark suite
+===============
+
+Measure latency and throughput of the stages of an ELSCATA run: input
+generation, output parsing, `Archive` packing and unpacking, and complete
+runs of `elscata` and `elscata_many` through the `NativeBackend`, using
+the stand-in executable of `benchmarks.fake_elscata`.
+
+Run from the repository root::
+
+    python -m benchmarks.suite -o bench.json
+
+Results are written as JSON. Given a previous result with `--baseline`,
+cases whose median time got slower by more than `--tolerance` are
+reported, and the exit code is 1.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import timeit
+
+import numpy as np
+
+from cslib import units
+from cslib.settings import Settings
+
+from elsepa.backend import NativeBackend
+from elsepa.batch import elscata_many
+from elsepa.executable import Archive
+from elsepa.generate_input import generate_elscata_input
+from elsepa.parse_output import (
+    parse_most_elscata_output, join_double_header)
+from elsepa.run import elscata
+
+from .fake_elscata import (make_executable, dcs_name)
+from .synthetic import (dcs_file, tcstable_file)
+
+
+def make_settings(n_energies=40, iz=79):
+    return Settings(
+        IZ=iz, MNUCL=3, MELEC=4, MUFFIN=0, IELEC=-1, MEXCH=1, MCPOL=2,
+        MABS=1, IHEF=1,
+        EV=np.logspace(1, 5, n_energies) * units.eV)
+
+
+def measure(f, number, repeat=5, items=1):
+    """Time `f`, called `number` times in each of `repeat` rounds.
+
+    :param items:
+        Number of items (rows, files, jobs) handled by each call, to
+        compute the throughput.
+
+    :return:
+        Dictionary with the `min`, `median` and `mean` time per call in
+        seconds, and the `throughput` in items per second.
+    """
+    t = [x / number for x in timeit.repeat(f, number=number, repeat=repeat)]
+    return {'min': min(t), 'median': statistics.median(t),
+            'mean': statistics.mean(t), 'items': items,
+            'throughput': items / statistics.median(t)}
+
+
+def input_cases(quick):
+    settings = make_settings()
+    yield 'generate_elscata_input, 40 energies', \
+        lambda: generate_elscata_input(settings), 1, 100
+
+
+def parse_cases(quick):
+    for name, text, items in [
+            ('dcs, 606 angles', dcs_file(n_angles=606), 606),
+            ('tcstable, 1000 energies',
+             tcstable_file(np.logspace(1, 5, 1000)), 1000)]:
+        lines = text.split('\n')
+        yield 'parse ' + name, \
+            lambda lines=lines: parse_most_elscata_output(lines), items, 20
+
+    header = dcs_file().split('\n')[5:7]
+    yield 'join_double_header', \
+        lambda: list(join_double_header(header[0][2:], header[1][2:])), \
+        1, 1000
+
+
+def archive_cases(quick):
+    files = {dcs_name(e): dcs_file(e) for e in np.logspace(1, 5, 40)}
+
+    def pack():
+        archive = Archive('w')
+        for name, text in files.items():
+            archive.add_text_file(name + '.dat', text)
+        return archive.close().buffer
+
+    data = pack()
+
+    def unpack():
+        archive = Archive('r', data)
+        return [archive.get_text_file(info.name) for info in archive]
+
+    yield 'Archive pack, 40 dcs files', pack, len(files), 10
+    yield 'Archive unpack, 40 dcs files', unpack, len(files), 10
+
+
+class CountingBackend(NativeBackend):
+    """`NativeBackend` counting the runs it is asked for."""
+    runs = 0
+    _lock = threading.Lock()
+
+    def run(self, input_deck: str, outputs=None):
+        with self._lock:
+            self.runs += 1
+        return super(CountingBackend, self).run(input_deck, outputs)
+
+
+def end_to_end_cases(quick, path):
+    backend = CountingBackend(make_executable(path))
+    settings = make_settings(10 if quick else 40)
+    n_files = len(settings['EV']) + 1
+
+    def run():
+        result = elscata(settings, backend=backend)
+        return [result[name] for name in result]
+
+    yield 'elscata, native stand-in', run, n_files, 1
+
+    # distinct elements, so that no job is deduplicated
+    n_jobs = 8 if quick else 64
+    jobs = [make_settings(len(settings['EV']), iz=1 + i)
+            for i in range(n_jobs)]
+
+    def run_many():
+        backend.runs = 0
+        for r in elscata_many(jobs, backend=backend):
+            if r.error is not None:
+                raise r.error
+        if backend.runs != n_jobs:
+            raise RuntimeError('elscata_many ran {} of {} jobs'.format(
+                backend.runs, n_jobs))
+
+    yield 'elscata_many, {} jobs'.format(n_jobs), run_many, n_jobs, 1
+
+
+def run_suite(quick=False):
+    """Run all benchmarks.
+
+    :return:
+        Dictionary with a `meta` entry describing the machine and a
+        `results` entry mapping case names to the output of `measure`.
+    """
+    repeat = 3 if quick else 5
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='elsepa-bench-') as path:
+        cases = [input_cases(quick), parse_cases(quick),
+                 archive_cases(quick), end_to_end_cases(quick, path)]
+        for group in cases:
+            for name, f, items, number in group:
+                if quick:
+                    number = max(1, number // 10)
+                results[name] = measure(f, number, repeat, items)
+                print('{:40} {:12.4f} ms {:12.1f} /s'.format(
+                    name, results[name]['median'] * 1e3,
+                    results[name]['throughput']), file=sys.stderr)
+
+    meta = {'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'quick': quick}
+    return {'meta': meta, 'results': results}
+
+
+def compare(baseline, current, tolerance=0.2):
+    """Find cases whose median time grew by more than a fraction
+    `tolerance` since `baseline`.
+
+    :return:
+        List of `(name, old median, new median)` tuples.
+    """
+    regressions = []
+    for name, new in current['results'].items():
+        old = baseline['results'].get(name)
+        if old is not None and new['median'] > old['median'] * (1 + tolerance):
+            regressions.append((name, old['median'], new['median']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run the pyelsepa benchmark suite.')
+    parser.add_argument('-o', '--output', help='write results to this file')
+    parser.add_argument('--baseline', help='results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed slowdown (default: 0.2)')
+    parser.add_argument('--quick', action='store_true',
+                        help='fewer and smaller runs, for smoke testing')
+    args = parser.parse_args(argv)
+
+    current = run_suite(args.quick)
+    text = json.dumps(current, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, args.tolerance)
+        for name, old, new in regressions:
+            print('regression: {}: {:.4f} ms -> {:.4f} ms'.format(
+                name, old * 1e3, new * 1e3), file=sys.stderr)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
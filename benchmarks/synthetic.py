@@ -0,0 +1,53 @@
+"""
+Synthetic ELSCATA output
+========================
+
+Generate output files in the layout written by ELSCATA, with made-up
+numbers, so that parsing can be benchmarked without running the Fortran
+code.
+"""
+
+import numpy as np
+
+
+dcs_header = """ # Elastic scattering of electrons by atoms (synthetic data)
+ # Z = 80,  E = {energy:.4E} eV
+ #
+ # Total elastic cross section = {tcs:.6E} cm**2
+ #
+ #  Angle        MU          DCS           DCS         Sherman
+ #  (deg)                (cm**2/sr)    (a0**2/sr)     function
+ #-------------------------------------------------------------------
+"""
+
+tcstable_header = """ # Total cross sections (synthetic data)
+ #
+ #  Energy      Total cs      1st tcs       2nd tcs
+ #   (eV)       (cm**2)       (cm**2)       (cm**2)
+ #-----------------------------------------------------
+"""
+
+
+def dcs_file(energy=1000.0, n_angles=606):
+    """Text of a `dcs_*.dat` file with `n_angles` rows."""
+    theta = np.linspace(0, 180, n_angles)
+    mu = (1 - np.cos(np.radians(theta))) / 2
+    dcs = 1e-16 * np.exp(-theta / 20)
+    rows = np.column_stack([theta, mu, dcs, dcs / 2.8002852e-17,
+                            np.sin(np.radians(theta)) / 10])
+    lines = [dcs_header.format(energy=energy, tcs=dcs.sum())]
+    lines.extend(
+        " {:11.5E}  {:12.6E}  {:12.6E}  {:12.6E}  {:12.5E}\n".format(*r)
+        for r in rows)
+    return ''.join(lines)
+
+
+def tcstable_file(energies):
+    """Text of a `tcstable.dat` file with a row for each energy."""
+    energies = np.asarray(energies, dtype=float)
+    lines = [tcstable_header]
+    lines.extend(
+        " {:11.5E}  {:12.6E}  {:12.6E}  {:12.6E}\n".format(
+            e, 1e-14 / e, 5e-15 / e, 2e-15 / e)
+        for e in energies)
+    return ''.join(lines)
@@ -1,5 +1,28 @@
-from cslib.units import units
-from cslib.settings import Settings
-from .run import elscata
+import importlib
 
-__all__ = ['units', 'elscata', 'Settings']
+# The exported names are imported on first access, so that `import elsepa`
+# is fast, and parts of the package can be used without the others.
+_exports = {
+    'units':        ('cslib.units', 'units'),
+    'Settings':     ('cslib.settings', 'Settings'),
+    'elscata':      ('elsepa.run', 'elscata'),
+    'elscatm':      ('elsepa.run', 'elscatm'),
+    'elscata_many': ('elsepa.batch', 'elscata_many')
+}
+
+__all__ = ['units', 'elscata', 'elscatm', 'elscata_many', 'Settings']
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError(
+            "module 'elsepa' has no attribute '{}'".format(name))
+
+    module, attr = _exports[name]
+    value = getattr(importlib.import_module(module), attr)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,242 @@
+"""
+Asyncio interface
+=================
+
+The Docker API client is blocking. To run ELSCATA from an `asyncio`
+event loop, the calls to Docker are run in the default executor of the
+loop (a bounded thread pool), while the number of jobs in flight is
+capped by a semaphore.
+
+Jobs are run with the same backend as `elscata` would use. With the
+default Docker backend every job gets a container of its own, and
+cancelling the job kills and removes its container. Other backends, like
+a `NativeBackend` or a `DockerBackend` with a pool, are run in the
+executor; cancelling those stops the waiting, but not the run.
+"""
+
+import asyncio
+import functools
+import os
+import weakref
+
+from .executable import DockerContainer
+from .generate_input import (canonical_elscata_input, Settings)
+from .backend import (DockerBackend, get_backend, run_elscata_input)
+from .instrument import (RunStats, collect, stage)
+from .run import run_cached
+
+
+max_jobs = os.cpu_count() or 1
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def set_max_jobs(n: int):
+    """Set the maximum number of ELSCATA jobs that `elscata_async` runs
+    at the same time. Only affects event loops that have not run a job
+    yet."""
+    global max_jobs
+    max_jobs = n
+
+
+def _job_semaphore():
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(max_jobs)
+    return _semaphores[loop]
+
+
+async def _blocking(f, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, functools.partial(f, *args, **kwargs))
+
+
+class AsyncDockerContainer(object):
+    """Asynchronous counterpart of `DockerContainer`. All methods are
+    coroutines that run the blocking Docker call in an executor.
+
+    The object is an asynchronous context manager, creating and starting
+    the container upon entry and killing and removing it upon exit. This
+    also happens when the task is cancelled.
+    """
+    def __init__(self, image, working_dir=None):
+        self.image = image
+        self.working_dir = working_dir
+        self.container = None
+
+    async def create(self):
+        future = asyncio.ensure_future(
+            _blocking(DockerContainer, self.image, self.working_dir))
+        try:
+            self.container = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # the container may still be created after we are cancelled;
+            # removing it blocks, so it is done in the executor
+            loop = asyncio.get_running_loop()
+
+            def remove(f):
+                if not f.cancelled() and f.exception() is None:
+                    loop.run_in_executor(None, functools.partial(
+                        f.result().remove, force=True))
+            future.add_done_callback(remove)
+            raise
+
+    async def put_archive(self, archive, path="."):
+        return await _blocking(self.container.put_archive, archive, path)
+
+    async def get_archive(self, path):
+        return await _blocking(self.container.get_archive, path)
+
+    async def run(self, cmd, **kwargs):
+        return await _blocking(self.container.run, cmd, **kwargs)
+
+    async def sh(self, *cmds, check=False):
+        return await _blocking(self.container.sh, *cmds, check=check)
+
+    async def start(self):
+        return await _blocking(self.container.start)
+
+    async def destroy(self):
+        """Kill and remove the container."""
+        def kill_and_remove():
+            try:
+                self.container.kill()
+            finally:
+                self.container.remove(force=True)
+
+        await asyncio.shield(_blocking(kill_and_remove))
+
+    async def __aenter__(self):
+        await self.create()
+        try:
+            await self.start()
+        except BaseException:
+            await self.destroy()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_st):
+        await self.destroy()
+
+
+async def _retrying(retry, f, *args):
+    """Await `f(*args)`, retrying according to the `RetryPolicy` given
+    in `retry`, if any."""
+    attempt = 0
+    while True:
+        try:
+            return await f(*args)
+        except Exception as error:
+            if retry is None or attempt + 1 >= retry.attempts or \
+                    not retry.retry_on(error):
+                raise
+        await asyncio.sleep(retry.wait_time(attempt))
+        attempt += 1
+
+
+def _collecting(stats, f, *args):
+    """Call `f(*args)`, collecting its measurements into `stats`."""
+    with collect(stats):
+        return f(*args)
+
+
+def _cache_lookup(cache, key):
+    with stage('cache_lookup'):
+        return cache.get(key)
+
+
+def _cache_store(cache, key, result):
+    with stage('cache_store'):
+        cache.put(key, result)
+
+
+async def _run_in_container(backend, input_deck, outputs, stats):
+    async with AsyncDockerContainer(backend.image,
+                                    working_dir='/opt/elsepa') as elsepa:
+        return await _blocking(
+            _collecting, stats, run_elscata_input, elsepa.container,
+            input_deck, outputs, backend.program, backend.timeout)
+
+
+def _run_with_backend(backend, input_deck, cache, outputs, retry):
+    with collect():
+        return run_cached(backend, input_deck, cache, outputs, retry)
+
+
+def _own_containers(backend):
+    """Whether every job of `backend` gets a container of its own, which
+    we can create and kill from the event loop."""
+    return isinstance(backend, DockerBackend) and backend.pool is None \
+        and backend.scheduler is None
+
+
+async def elscata_async(settings: Settings, outputs=None, image=None,
+                        pool=None, cache=None, backend=None, retry=None,
+                        timeout=None):
+    """Run ELSCATA without blocking the event loop. At most `max_jobs`
+    jobs run at the same time; further calls wait for a free slot.
+
+    :param settings:
+        Settings following `Elscata_model`. They are not modified.
+
+    :param outputs:
+        Glob patterns selecting the output files, see `elscata`.
+
+    :param image:
+        Name of a Docker image to run the job in, instead of the default
+        backend.
+
+    :param pool:
+        Optional `ContainerPool` to run the job in, see `elscata`.
+
+    :param cache:
+        Optional `ResultCache`, see `elscata`.
+
+    :param backend:
+        Backend to run ELSCATA with, see `elsepa.backend`. Defaults to
+        `get_backend(pool)`, as for `elscata`.
+
+    :param retry:
+        Optional `RetryPolicy`, see `elscata`.
+
+    :param timeout:
+        Time limit in seconds for the run, for a Docker backend created
+        from `image` or `pool`. A given `backend` uses its own `timeout`.
+
+    :return:
+        `ElsepaResult` with the output files. Timings of the run are in
+        its `stats` attribute, see `elsepa.instrument`.
+    """
+    input_deck = canonical_elscata_input(settings)
+    if backend is None:
+        if image is not None or timeout is not None:
+            backend = DockerBackend(image or 'elsepa', pool=pool,
+                                    timeout=timeout)
+        else:
+            backend = get_backend(pool)
+
+    async with _job_semaphore():
+        if not _own_containers(backend):
+            return await _blocking(
+                _run_with_backend, backend, input_deck, cache, outputs,
+                retry)
+
+        stats = RunStats()
+        if cache is not None:
+            identity = await _blocking(backend.identity)
+            key = cache.key(input_deck, identity, outputs)
+            result = await _blocking(
+                _collecting, stats, _cache_lookup, cache, key)
+            if result is not None:
+                stats.cached = True
+                result.stats = stats
+                return result
+
+        result = await _retrying(
+            retry, _run_in_container, backend, input_deck, outputs, stats)
+        result.stats = stats
+
+        if cache is not None:
+            await _blocking(
+                _collecting, stats, _cache_store, cache, key, result)
+        return result
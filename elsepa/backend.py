@@ -0,0 +1,510 @@
+"""
+Backends
+========
+
+A backend knows how to run an ELSEPA program (`elscata` for atoms and
+ions, `elscatm` for molecules) on an input deck. The `DockerBackend`
+runs the program inside the `elsepa` Docker image, the `NativeBackend`
+runs a locally compiled `elscata` executable, for instance on compute
+nodes without a Docker daemon.
+
+Unless a backend is passed explicitly, the default backend is used. This
+can be set for each program with `set_default_backend`, or through the
+environment variable `ELSEPA_BACKEND` (either `docker` or `native`). The
+native backend looks for the executable given by `ELSEPA_EXECUTABLE`, or
+else for `elscata` in the `PATH`; for `elscatm` it uses
+`ELSCATM_EXECUTABLE` or `elscatm`.
+
+Many small decks can be run with `run_batch`, which the Docker backend
+does in a single container with one round-trip for the inputs, one for
+the execution and one for the outputs, see `run_elscata_batch`.
+
+Both backends check that the program succeeded, and raise an
+`ElsepaError` with its output if it did not. A `timeout` in seconds can
+be given, after which the program is killed and an `ElsepaTimeout` is
+raised.
+"""
+
+import glob
+import hashlib
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from .executable import (DockerContainer, Archive, SimpleExecutable, image_id)
+from .instrument import (stage, count_bytes, record_exit_code)
+from .errors import (ElsepaError, ElsepaTimeout)
+from .parse_output import (is_selected, output_parsers)
+from .result import ElsepaResult
+from .pool import ContainerPool
+
+
+def collect_outputs_command(outputs):
+    """Shell command moving the selected output files into `result`.
+
+    :param outputs:
+        List of glob patterns of file names, without the `.dat`
+        extension. If `None` or empty, all files are selected.
+    """
+    if not outputs:
+        return 'mkdir result && mv *.dat result'
+
+    names = ' -o '.join('-name ' + shlex.quote(p + '.dat') for p in outputs)
+    return 'mkdir result && find . -maxdepth 1 -type f \\( {} \\) ' \
+           '-exec mv {{}} result \\;'.format(names)
+
+
+# exit codes of `timeout`, when it stopped the program with TERM or KILL
+timeout_exit_codes = (124, 137)
+
+
+def run_elscata_input(elsepa, input_deck: str, outputs=None,
+                      program='elscata', timeout=None):
+    """Run ELSCATA, or another ELSEPA program, on a given input deck in a
+    Docker container.
+
+    :param elsepa:
+        A started `DockerContainer` or a `ScratchDirectory` from a
+        `ContainerPool`. The input, output and `result` directory are
+        written relative to its working directory.
+
+    :param input_deck:
+        Contents of the `input.dat` file.
+
+    :param outputs:
+        Glob patterns selecting the output files to retrieve and parse,
+        for instance `['tcstable']`. Other files never leave the
+        container. If `None`, all files are retrieved.
+
+    :param program:
+        Name of the program in `/opt/elsepa`.
+
+    :param timeout:
+        Time limit in seconds, or `None`.
+
+    :return:
+        `ElsepaResult` with the output files.
+
+    :raises ElsepaError:
+        If the program exits with a non-zero code or writes no output
+        files.
+    """
+    elsepa.put_archive(
+        Archive('w')
+        .add_text_file('input.dat', input_deck)
+        .close())
+
+    command = '/opt/elsepa/{} < input.dat'.format(program)
+    if timeout is not None:
+        command = 'timeout -k 5 {} {}'.format(timeout, command)
+
+    try:
+        with stage('execute'):
+            elsepa.sh(command, "ls *.dat | grep -qv '^input.dat$'",
+                      collect_outputs_command(outputs), check=True)
+    except subprocess.CalledProcessError as e:
+        output = e.output.decode(errors='replace')
+        if timeout is not None and e.returncode in timeout_exit_codes:
+            raise ElsepaTimeout(program, timeout, output, input_deck) \
+                from None
+        raise ElsepaError(program, e.returncode, output, input_deck) \
+            from None
+
+    raw = {}
+    with stage('get_archive'):
+        for info, f in elsepa.stream_archive('result'):
+            if f is None:
+                continue
+
+            name = re.match("result/(.*)\\.dat", info.name).group(1)
+            raw[name] = f.read()
+    count_bytes(received=sum(len(b) for b in raw.values()))
+
+    return ElsepaResult(raw, parsers=output_parsers[program])
+
+
+# Run by `run_elscata_batch` for every job, with the job directory as `$1`.
+# The exit code of the program is kept in a file, so that one failing job
+# does not stop the others.
+batch_job_script = """cd "$1" || exit 1
+{command} > stdout.txt 2>&1
+echo $? > exit_code
+ls *.dat | grep -qv '^input.dat$' && {collect}
+exit 0
+"""
+
+
+def run_elscata_batch(elsepa, input_decks, outputs=None, program='elscata',
+                      timeout=None, parallel=1):
+    """Run ELSCATA on many input decks in one Docker container, with a
+    single round-trip for each of the input, the execution and the
+    output. The decks are uploaded in one archive, each in a directory
+    `batch/<n>` of its own, run with one `exec`, and the `result`
+    directories of all jobs are fetched back in one archive.
+
+    :param elsepa:
+        A started `DockerContainer` or a `ScratchDirectory` from a
+        `ContainerPool`, in which no batch was run before.
+
+    :param input_decks:
+        List of contents of the `input.dat` files.
+
+    :param parallel:
+        Number of jobs run at the same time inside the container.
+
+    The other arguments are as for `run_elscata_input`; the `timeout`
+    applies to each job separately.
+
+    :return:
+        List of `(result, error)` pairs in the order of `input_decks`.
+        For a job that failed, `result` is `None` and `error` is the
+        `ElsepaError`; otherwise `error` is `None`.
+    """
+    archive = Archive('w')
+    for i, input_deck in enumerate(input_decks):
+        archive.add_text_file('batch/{}/input.dat'.format(i), input_deck)
+    archive.add_text_file('batch/jobs', ''.join(
+        'batch/{}\n'.format(i) for i in range(len(input_decks))))
+    elsepa.put_archive(archive.close())
+
+    command = '/opt/elsepa/{} < input.dat'.format(program)
+    if timeout is not None:
+        command = 'timeout -k 5 {} {}'.format(timeout, command)
+    script = batch_job_script.format(
+        command=command, collect=collect_outputs_command(outputs))
+
+    with stage('execute'):
+        elsepa.sh('xargs -n 1 -P {} sh -c {} sh < batch/jobs'.format(
+                  int(parallel), shlex.quote(script)), check=True)
+
+    files = [{} for _ in input_decks]
+    with stage('get_archive'):
+        for info, f in elsepa.stream_archive('batch'):
+            m = re.match("batch/([0-9]+)/(exit_code|stdout.txt|result/.*)$",
+                         info.name)
+            if f is None or m is None:
+                continue
+            files[int(m.group(1))][m.group(2)] = f.read()
+    count_bytes(received=sum(len(b) for job in files for b in job.values()))
+
+    results = []
+    for input_deck, job in zip(input_decks, files):
+        output = job.get('stdout.txt', b'').decode(errors='replace')
+        exit_code = int(job.get('exit_code', b'1'))
+        raw = {name[7:-4]: b for name, b in job.items()
+               if name.startswith('result/') and name.endswith('.dat')}
+
+        if timeout is not None and exit_code in timeout_exit_codes:
+            error = ElsepaTimeout(program, timeout, output, input_deck)
+        elif exit_code != 0 or not raw:
+            error = ElsepaError(program, exit_code or 1, output, input_deck)
+        else:
+            results.append((
+                ElsepaResult(raw, parsers=output_parsers[program]), None))
+            continue
+        results.append((None, error))
+
+    return results
+
+
+_image_ids = {}
+_image_ids_lock = threading.Lock()
+
+
+def cached_image_id(client, image):
+    """The `image_id` of `image`, looked up once per Docker client in
+    this process, so that cache hits need no call to Docker. Call
+    `clear_image_ids` after rebuilding an image."""
+    key = (client, image)
+    with _image_ids_lock:
+        if key in _image_ids:
+            return _image_ids[key]
+    identity = image_id(client, image)
+    with _image_ids_lock:
+        return _image_ids.setdefault(key, identity)
+
+
+def clear_image_ids():
+    """Forget the image IDs looked up by `cached_image_id`."""
+    with _image_ids_lock:
+        _image_ids.clear()
+
+
+class DockerBackend(object):
+    """Run ELSCATA in a Docker container.
+
+    .. py::attribute:: image
+        (string) Name of the Docker image.
+
+    .. py::attribute:: program
+        (string) Name of the ELSEPA program to run, `elscata` or
+        `elscatm`.
+
+    .. py::attribute:: pool
+        (ContainerPool or None) If given, jobs are run in the warm
+        containers of this pool, otherwise every job gets a container
+        of its own.
+
+    .. py::attribute:: timeout
+        (float or None) Time limit for a single run, in seconds.
+
+    .. py::attribute:: scheduler
+        (Scheduler or None) If given, every container is pinned to a core
+        and limited in memory by the scheduler, and only started when
+        the scheduler admits it. See `elsepa.scheduler`.
+    """
+    def __init__(self, image='elsepa', pool=None, program='elscata',
+                 timeout=None, scheduler=None):
+        self.image = pool.image if pool is not None else image
+        self.pool = pool
+        self.program = program
+        self.timeout = timeout
+        self.scheduler = scheduler
+        self._identity = None
+
+    def identity(self):
+        """Identify the build of ELSCATA, by the Docker image ID, see
+        `cached_image_id`."""
+        if self._identity is None:
+            self._identity = cached_image_id(
+                DockerContainer.client, self.image)
+        return self._identity
+
+    def run(self, input_deck: str, outputs=None):
+        """Run ELSCATA on an input deck.
+
+        :param outputs:
+            Glob patterns selecting the output files, see
+            `run_elscata_input`.
+
+        :return:
+            `ElsepaResult` with the output files.
+        """
+        with self._container() as elsepa:
+            return run_elscata_input(
+                elsepa, input_deck, outputs, self.program, self.timeout)
+
+    def run_batch(self, input_decks, outputs=None, parallel=1):
+        """Run ELSCATA on many input decks in a single container, see
+        `run_elscata_batch`.
+
+        :return:
+            List of `(result, error)` pairs in the order of
+            `input_decks`.
+        """
+        with self._container() as elsepa:
+            return run_elscata_batch(
+                elsepa, input_decks, outputs, self.program, self.timeout,
+                parallel)
+
+    @contextmanager
+    def _container(self):
+        """Context manager giving a started container, or a scratch
+        directory in a container of the pool, to run a job in."""
+        if self.pool is not None:
+            with self.pool.job() as elsepa:
+                yield elsepa
+
+        elif self.scheduler is not None:
+            with self.scheduler.job() as allocation, \
+                    DockerContainer(self.image, working_dir='/opt/elsepa',
+                                    cpuset=str(allocation.cpu),
+                                    mem_limit=allocation.memory) as elsepa:
+                yield elsepa
+
+        else:
+            with DockerContainer(self.image, working_dir='/opt/elsepa') \
+                    as elsepa:
+                yield elsepa
+
+    @contextmanager
+    def pooled(self, size):
+        """Context manager giving a backend suitable for running `size`
+        jobs at the same time. If this backend has no pool, a temporary
+        one is created."""
+        if self.pool is not None:
+            yield self
+            return
+
+        with ContainerPool(self.image, size=size,
+                           scheduler=self.scheduler) as pool:
+            backend = DockerBackend(pool=pool, program=self.program,
+                                    timeout=self.timeout)
+            backend._identity = self._identity
+            yield backend
+
+
+class NativeBackend(object):
+    """Run a locally compiled ELSCATA executable. Every job is run in a
+    temporary directory of its own, so that jobs can run concurrently
+    from several threads.
+
+    .. py::attribute:: executable
+        (SimpleExecutable) The ELSEPA program.
+
+    .. py::attribute:: program
+        (string) Which ELSEPA program this is, `elscata` or `elscatm`;
+        this selects the output parsers.
+
+    .. py::attribute:: timeout
+        (float or None) Time limit for a single run, in seconds.
+
+    .. py::attribute:: scheduler
+        (Scheduler or None) If given, a run only starts when the
+        scheduler admits it.
+    """
+    def __init__(self, path='elscata', program='elscata', timeout=None,
+                 scheduler=None):
+        resolved = shutil.which(path)
+        if resolved is None:
+            raise FileNotFoundError(
+                "Could not find {} executable: {}".format(program, path))
+
+        self.program = program
+        self.timeout = timeout
+        self.scheduler = scheduler
+        self.executable = SimpleExecutable(
+            name=program, path=os.path.abspath(resolved),
+            description="Elastic scattering of electrons and positrons "
+                        "by atoms, positive ions and molecules.")
+        self._identity = None
+
+    def identity(self):
+        """Identify the build of ELSCATA, by a hash of the executable."""
+        if self._identity is None:
+            with open(self.executable.path, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            self._identity = 'sha256:' + digest
+        return self._identity
+
+    def run(self, input_deck: str, outputs=None):
+        """Run ELSCATA on an input deck.
+
+        :param outputs:
+            Glob patterns selecting the output files to parse, or `None`
+            to parse all of them.
+
+        :return:
+            `ElsepaResult` with the output files.
+
+        :raises ElsepaError:
+            If the program exits with a non-zero code or writes no
+            output files.
+        """
+        if self.scheduler is not None:
+            with self.scheduler.job():
+                return self._run(input_deck, outputs)
+        return self._run(input_deck, outputs)
+
+    def _run(self, input_deck, outputs):
+        with tempfile.TemporaryDirectory(prefix='elsepa-') as tmp:
+            input_file = os.path.join(tmp, 'input.dat')
+            with stage('put_archive'), open(input_file, 'w') as f:
+                f.write(input_deck)
+            count_bytes(sent=len(input_deck.encode()))
+
+            with stage('execute'), open(input_file) as f:
+                try:
+                    process = self.executable.run(
+                        stdin=f, stdout=subprocess.PIPE,
+                        stderr=subprocess.STDOUT, cwd=tmp,
+                        timeout=self.timeout)
+                except subprocess.TimeoutExpired as e:
+                    raise ElsepaTimeout(
+                        self.program, self.timeout,
+                        (e.output or b'').decode(errors='replace'),
+                        input_deck) from None
+            record_exit_code(process.returncode)
+
+            files = sorted(glob.glob(os.path.join(tmp, '*.dat')))
+            if process.returncode != 0 or files == [input_file]:
+                raise ElsepaError(
+                    self.program, process.returncode,
+                    process.stdout.decode(errors='replace'), input_deck)
+
+            raw = {}
+            with stage('get_archive'):
+                for path in files:
+                    name = os.path.basename(path)[:-4]
+                    if not is_selected(name, outputs):
+                        continue
+                    with open(path, 'rb') as f:
+                        raw[name] = f.read()
+            count_bytes(received=sum(len(b) for b in raw.values()))
+
+            return ElsepaResult(raw, parsers=output_parsers[self.program])
+
+    def run_batch(self, input_decks, outputs=None, parallel=1):
+        """Run ELSCATA on many input decks. Local runs have no round-trips
+        to save, so this just runs the decks one by one, or `parallel`
+        at a time.
+
+        :return:
+            List of `(result, error)` pairs in the order of
+            `input_decks`.
+        """
+        def job(input_deck):
+            try:
+                return self.run(input_deck, outputs), None
+            except ElsepaError as error:
+                return None, error
+
+        with ThreadPoolExecutor(max_workers=max(1, parallel)) as executor:
+            return list(executor.map(job, input_decks))
+
+    @contextmanager
+    def pooled(self, size):
+        yield self
+
+
+_default_backends = {}
+
+
+def set_default_backend(backend, program='elscata'):
+    """Set the backend used for `program` when none is given explicitly.
+    Passing `None` restores the selection through environment
+    variables."""
+    if backend is None:
+        _default_backends.pop(program, None)
+    else:
+        _default_backends[program] = backend
+
+
+native_executables = {
+    'elscata': 'ELSEPA_EXECUTABLE',
+    'elscatm': 'ELSCATM_EXECUTABLE'
+}
+
+
+def get_backend(pool=None, program='elscata'):
+    """Get the backend to run an ELSEPA program with.
+
+    :param pool:
+        If given, a `DockerBackend` running in this `ContainerPool` is
+        returned.
+
+    :param program:
+        Either `elscata` or `elscatm`. A default backend set with
+        `set_default_backend` for this program takes precedence over the
+        environment variables.
+    """
+    if pool is not None:
+        return DockerBackend(pool=pool, program=program)
+
+    if program in _default_backends:
+        return _default_backends[program]
+
+    name = os.environ.get('ELSEPA_BACKEND', 'docker')
+    if name == 'docker':
+        return DockerBackend(program=program)
+    if name == 'native':
+        path = os.environ.get(native_executables[program], program)
+        return NativeBackend(path, program=program)
+
+    raise ValueError("Unknown ELSEPA backend: {}".format(name))
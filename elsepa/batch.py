@@ -0,0 +1,214 @@
+"""
+Batch runs
+==========
+
+Run ELSCATA for many settings at once, spreading the jobs over a pool of
+warm containers.
+
+Settings are turned into canonical input decks first. Settings that give
+the same deck as a job that is still pending are not run again, but get
+the result of that job.
+"""
+
+import os
+from collections import (namedtuple, deque)
+from concurrent.futures import (
+    Future, ThreadPoolExecutor, wait, FIRST_COMPLETED)
+
+from .backend import get_backend
+from .generate_input import (canonical_elscata_input, canonical_elscatm_input)
+from .instrument import (RunStats, collect, stage)
+from .planner import lpt_order
+from .run import run_cached
+
+
+BatchResult = namedtuple('BatchResult', ['index', 'settings', 'result', 'error'])
+BatchResult.__doc__ = """Outcome of a single job in a batch. Exactly one of
+`result` and `error` is not `None`. The `index` gives the position of the
+settings in the input iterable."""
+
+canonical_inputs = {
+    'elscata': canonical_elscata_input,
+    'elscatm': canonical_elscatm_input
+}
+
+
+def plan_jobs(settings_list, cost_model):
+    """Order jobs longest first by the estimates of `cost_model`.
+    Settings that cannot be estimated are put last.
+
+    :return:
+        List of `(index, settings)` pairs.
+    """
+    def cost(settings):
+        try:
+            return cost_model.predict(settings)
+        except Exception:
+            return 0.0
+
+    costs = [cost(s) for s in settings_list]
+    return [(i, settings_list[i]) for i in lpt_order(costs)]
+
+
+def elscata_many(settings_iter, workers=None, ordered=True, pool=None,
+                 max_pending=None, cache=None, backend=None, outputs=None,
+                 program='elscata', stats=None, retry=None,
+                 cost_model=None):
+    """Run ELSCATA for each settings object in `settings_iter`.
+
+    Results are streamed back as they become available. A job that fails
+    does not stop the batch; its exception, usually an `ElsepaError`, is
+    returned in the `error` field of the corresponding `BatchResult`.
+
+    Settings that give the same canonical input deck as a job that has
+    not been yielded yet share its run, and get the same result object.
+    Duplicates further apart are recognised by passing a `cache`.
+
+    :param settings_iter:
+        Iterable of settings following `Elscata_model`. This is consumed
+        lazily, so it may be a generator for very large sweeps.
+
+    :param workers:
+        Number of jobs running at the same time. Defaults to the number
+        of cores.
+
+    :param ordered:
+        If `True`, results are yielded in the order of `settings_iter`,
+        otherwise in the order in which they complete.
+
+    :param pool:
+        `ContainerPool` to run the jobs in. If not given and the Docker
+        backend is used, a pool with `workers` containers is created for
+        the duration of the batch.
+
+    :param max_pending:
+        Maximum number of jobs that are submitted but not yet yielded.
+        Input is not read ahead any further. Defaults to twice the number
+        of workers.
+
+    :param cache:
+        Optional `ResultCache`, passed on to `elscata`.
+
+    :param backend:
+        Backend to run with. Defaults to `get_backend(pool, program)`.
+
+    :param outputs:
+        Selection of output files, passed on to `elscata`.
+
+    :param program:
+        Set to `elscatm` to run molecules, with settings following
+        `Elscatm_model`.
+
+    :param stats:
+        Optional `BatchStats`. The measurements of every finished job
+        are added to it, see `elsepa.instrument`.
+
+    :param retry:
+        Optional `RetryPolicy` for jobs failing with transient errors.
+        Set a `timeout` on the backend to stop jobs that hang.
+
+    :param cost_model:
+        Optional `CostModel`, for `elscata` only; with another `program`
+        a `ValueError` is raised. The settings are read all at once and
+        run longest job first, see `elsepa.planner`; if
+        `ordered` is `True`, results are yielded in that order. The
+        `index` of each result still refers to `settings_iter`. The run
+        times of the jobs are recorded in the model.
+
+    :return:
+        Generator of `BatchResult` objects.
+    """
+    if cost_model is not None and program != 'elscata':
+        raise ValueError("A cost model can only be used with elscata, "
+                         "not with {}.".format(program))
+
+    return _elscata_many(
+        settings_iter, workers, ordered, pool, max_pending, cache, backend,
+        outputs, program, stats, retry, cost_model)
+
+
+def _elscata_many(settings_iter, workers, ordered, pool, max_pending, cache,
+                  backend, outputs, program, stats, retry, cost_model):
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+    if backend is None:
+        backend = get_backend(pool, program)
+    canonical_input = canonical_inputs[program]
+
+    def job(settings, input_deck, run_stats):
+        recorded = False
+        try:
+            with collect(run_stats):
+                result = run_cached(backend, input_deck, cache, outputs,
+                                    retry)
+            if stats is not None:
+                stats.add(result.stats)
+            recorded = True
+            if cost_model is not None:
+                cost_model.observe(settings, result)
+        except Exception as error:
+            if stats is not None and not recorded:
+                stats.add(None)
+            return None, error
+        return result, None
+
+    def failed(error):
+        future = Future()
+        future.set_result((None, error))
+        return future
+
+    # entries are (index, settings, input deck, future)
+    pending = deque()
+    running = {}
+
+    def batch_result(index, settings, input_deck, future):
+        if running.get(input_deck) is future and \
+                not any(e[3] is future for e in pending):
+            del running[input_deck]
+        result, error = future.result()
+        return BatchResult(index, settings, result, error)
+
+    def drain(n):
+        """Yield finished results until at most `n` jobs are pending."""
+        while len(pending) > n:
+            if ordered:
+                yield batch_result(*pending.popleft())
+                continue
+
+            done, _ = wait({e[3] for e in pending},
+                           return_when=FIRST_COMPLETED)
+            for entry in [e for e in pending if e[3] in done]:
+                pending.remove(entry)
+                yield batch_result(*entry)
+
+    def submit(index, settings):
+        run_stats = RunStats()
+        try:
+            with stage('generate_input', run_stats):
+                input_deck = canonical_input(settings)
+        except Exception as error:
+            return (index, settings, None, failed(error))
+
+        if input_deck not in running:
+            running[input_deck] = executor.submit(
+                job, settings, input_deck, run_stats)
+        return (index, settings, input_deck, running[input_deck])
+
+    if cost_model is not None:
+        jobs = plan_jobs(list(settings_iter), cost_model)
+    else:
+        jobs = enumerate(settings_iter)
+
+    with backend.pooled(workers) as backend, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for index, settings in jobs:
+                pending.append(submit(index, settings))
+                yield from drain(max_pending - 1)
+
+            yield from drain(0)
+
+        finally:
+            # don't run queued jobs if the generator is closed early
+            for entry in pending:
+                entry[3].cancel()
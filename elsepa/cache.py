@@ -0,0 +1,136 @@
+"""
+Result cache
+============
+
+ELSCATA is deterministic: the same input deck run by the same build of
+the program gives the same output. The `ResultCache` stores parsed
+results on disk, keyed by a hash of the input deck and the identity of
+the build (the Docker image ID), so that repeated runs are only done once.
+
+Each entry is a single compressed `.npz` file holding the structured
+arrays of the output files, together with their units and comments.
+Entries are written to a temporary file and moved in place atomically,
+so that several processes can share one cache directory. When the cache
+grows beyond its size limit, the least recently used entries are
+removed.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from .result import ElsepaResult
+from .storage import (dataframe_meta, make_dataframe)
+
+
+class ResultCache(object):
+    """On-disk cache of ELSCATA results.
+
+    .. py::attribute:: path
+        (string) Directory where the cache entries are stored.
+
+    .. py::attribute:: max_size
+        (int or None) Maximum total size of the cache in bytes. If
+        `None`, the cache grows without bounds.
+    """
+    suffix = '.npz'
+
+    def __init__(self, path, max_size=2**30):
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def key(input_deck: str, image: str, outputs=None) -> str:
+        """Compute the cache key.
+
+        :param input_deck:
+            Contents of the ELSCATA input file.
+        :param image:
+            Identity of the ELSCATA build, as given by the `identity`
+            method of the backend; for Docker this is the image ID.
+        :param outputs:
+            Selection of output files, see `elscata`.
+        """
+        h = hashlib.sha256()
+        h.update(image.encode())
+        h.update(b'\0')
+        if outputs is not None:
+            h.update('\0'.join(sorted(outputs)).encode())
+        h.update(b'\0')
+        h.update(input_deck.encode())
+        return h.hexdigest()
+
+    def _filename(self, key):
+        return os.path.join(self.path, key + self.suffix)
+
+    def get(self, key):
+        """Retrieve a result from the cache.
+
+        :return:
+            `ElsepaResult`, or `None` if the key is not in the cache.
+        """
+        filename = self._filename(key)
+        try:
+            with np.load(filename, allow_pickle=False) as f:
+                meta = json.loads(str(f['__meta__']))
+                result = {name: make_dataframe(f[name], m)
+                          for name, m in meta.items()}
+            os.utime(filename)
+        except FileNotFoundError:
+            return None
+
+        return ElsepaResult(parsed=result)
+
+    def put(self, key, result):
+        """Store a result in the cache.
+
+        :param result:
+            Mapping of `DataFrame` objects, as returned by `elscata`.
+        """
+        meta = {name: dataframe_meta(df) for name, df in result.items()}
+        arrays = {name: np.asarray(df) for name, df in result.items()}
+
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(
+                    f, __meta__=np.array(json.dumps(meta)), **arrays)
+            os.replace(tmp, self._filename(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+        self.evict()
+
+    def __contains__(self, key):
+        return os.path.exists(self._filename(key))
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits within
+        `max_size`."""
+        if self.max_size is None:
+            return
+
+        entries = []
+        for entry in os.scandir(self.path):
+            if not entry.name.endswith(self.suffix):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
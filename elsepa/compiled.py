@@ -0,0 +1,130 @@
+"""
+Compiled models
+===============
+
+Checking settings with `check_settings` evaluates a tree of composed
+predicates for every field, and `print_in` converts quantities one value
+at a time. For sweeps generating millions of input decks this overhead
+dominates. A `CompiledModel` does the same work with a flat list of
+simple checks, converts the energy list with a single unit conversion,
+and writes the deck from precomputed line prefixes.
+
+The flat checks are *sufficient* conditions: settings they accept are
+accepted by the predicates of the model as well, while anything unusual
+(a `numpy` integer, say, or an unknown field) is left to
+`check_settings`, which then gives the usual error. The generated deck
+is identical to that of the generic generator.
+"""
+
+
+def integer(lo=None, hi=None, values=None):
+    """Check for a Python `int` in `[lo, hi)`, or in `values`."""
+    def check(v):
+        if type(v) is not int:
+            return False
+        if values is not None:
+            return v in values
+        return (lo is None or lo <= v) and (hi is None or v < hi)
+    return check
+
+
+def number(lo=None, hi=None):
+    """Check for a Python `int` or `float` in `[lo, hi)`."""
+    def check(v):
+        if type(v) is not int and type(v) is not float:
+            return False
+        return (lo is None or lo <= v) and (hi is None or v < hi)
+    return check
+
+
+def quantity(unit, array=False):
+    """Check for a quantity with the same dimensions as `unit`. If
+    `array` is true, the magnitude should be a non-empty array."""
+    dimensionality = (1 * unit).dimensionality
+
+    def check(v):
+        if getattr(v, 'dimensionality', None) != dimensionality:
+            return False
+        if array:
+            shape = getattr(v.magnitude, 'shape', ())
+            return len(shape) == 1 and shape[0] > 0
+        return getattr(v.magnitude, 'shape', ()) == ()
+    return check
+
+
+def optional(check):
+    """Also accept `None`."""
+    return lambda v: v is None or check(v)
+
+
+class CompiledModel(object):
+    """Fast validation and input generation for a settings model.
+
+    .. py::attribute:: model
+        (Model) The model, giving the order of the fields, their
+        descriptions, units and which are obligatory.
+
+    .. py::attribute:: rules
+        (dict) Flat check for every field of the model.
+
+    .. py::attribute:: energy_field
+        (string or None) Field holding a list of energies, written one
+        per line. If its generator was made by `print_in`, the whole
+        list is converted in one go.
+    """
+    def __init__(self, model, rules, energy_field='EV'):
+        missing = set(model) - set(rules)
+        if missing:
+            raise ValueError("No rules for fields: {}".format(missing))
+
+        self.model = model
+        self.rules = rules
+        self.energy_field = energy_field
+
+        self._checks = [(k, rules[k], t.obligatory) for k, t in model.items()]
+        self._fields = set(model)
+        self._lines = [(k, "{:7}".format(k), t.description, t.generator)
+                       for k, t in model.items()]
+
+    def check(self, settings) -> bool:
+        """Check settings with the flat rules. A `False` result does not
+        mean the settings are invalid, only that the full check is
+        needed."""
+        for k in settings:
+            if k not in self._fields:
+                return False
+
+        for k, check, obligatory in self._checks:
+            if k not in settings:
+                if obligatory:
+                    return False
+                continue
+            if not check(settings[k]):
+                return False
+
+        return True
+
+    def write(self, settings) -> str:
+        """Write the input deck for settings accepted by `check`."""
+        out = []
+        for k, prefix, description, tr in self._lines:
+            if k not in settings:
+                continue
+            v = settings[k]
+
+            if k == self.energy_field:
+                unit = getattr(tr, 'unit', None)
+                if unit is not None:
+                    energies = v.to(unit).magnitude
+                else:
+                    energies = [tr(e) for e in v]
+                out.append(prefix + format(energies[0], ' .4e') + ' ' +
+                           description)
+                out.extend(prefix + format(e, ' .4e') for e in energies[1:])
+
+            elif v is not None:
+                out.append(prefix + format(tr(v), '< 12') + description)
+
+        out.append('')
+        return '\n'.join(out)
+
@@ -0,0 +1,331 @@
+"""
+Cross-section database
+======================
+
+Monte Carlo codes need cross sections at arbitrary energies, many times
+over. The `CrossSectionDatabase` runs ELSCATA once on a grid of elements
+and energies, and answers queries by interpolation in the differential
+and total cross sections.
+
+The results are kept in an `EnergyGridStore` in the database directory,
+one configuration per element, so the grid can be extended at any time
+with `fill` and only missing points are computed. For lookups, the
+results of an element are read into the arrays
+
+* `energy` (eV), sorted,
+* `angle` (deg), the angular grid of ELSCATA,
+* `dcs` (cm**2/sr), of shape `(len(energy), len(angle))`,
+* `tcs` (cm**2), the elastic cross section from `tcstable`.
+
+A database holds results for a single potential model: all settings
+other than `IZ` and `EV` are fixed when it is created, and kept in the
+file `database.json` together with their `physics_key`, the identity of
+the backend that filled the database, the elements it holds and the
+columns to read the cross sections from. Opening
+the database with other settings, or filling it with another build of
+ELSCATA, raises a `ValueError`.
+"""
+
+import copy
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from cslib import units
+
+from .backend import get_backend
+from .incremental import (EnergyGridStore, physics_key)
+from .parse_output import (dataframe_units, dcs_energy)
+from .sweep import (settings_to_json, settings_from_json)
+
+
+def model_key(settings):
+    """The `physics_key` of the potential model in `settings`, without
+    regard to the element, the energies or the build of ELSCATA."""
+    s = copy.copy(settings)
+    s['IZ'] = 1
+    return physics_key(s, '')
+
+
+def _write_json(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class CrossSectionDatabase(object):
+    """Precomputed elastic cross sections with interpolating lookup.
+
+    .. py::attribute:: path
+        (string) Directory of the database.
+
+    .. py::attribute:: settings
+        (Settings) Potential model, applied to every run. It must be
+        given when the database is created; when an existing database is
+        opened, it is read from disk if not given.
+
+    .. py::attribute:: dcs_column
+        (string) Column of the `dcs_*` files holding the DCS, by default
+        the one the database was created with, or `DCS[0]`.
+
+    .. py::attribute:: tcs_column
+        (string or None) Column of `tcstable` holding the total elastic
+        cross section, by default the one the database was created with.
+        If `None`, the second column is used.
+    """
+    def __init__(self, path, settings=None, dcs_column=None,
+                 tcs_column=None):
+        self.path = path
+        self._tables = {}
+        self._icdf = {}
+        self._store = EnergyGridStore(path)
+
+        meta = self._read_meta()
+        if settings is None:
+            if meta is None:
+                raise ValueError(
+                    "No database in {}; settings are needed to create one."
+                    .format(path))
+            settings = settings_from_json(meta['settings'])
+
+        self.settings = copy.copy(settings)
+        for k in ('IZ', 'EV'):
+            if k in self.settings:
+                del self.settings[k]
+
+        if meta is not None:
+            dcs_column = dcs_column or meta['dcs_column']
+            tcs_column = tcs_column or meta['tcs_column']
+        self.dcs_column = dcs_column or 'DCS[0]'
+        self.tcs_column = tcs_column
+
+        key = model_key(self.settings)
+        if meta is None:
+            self._meta = {'physics_key': key, 'identity': None,
+                          'elements': [],
+                          'settings': settings_to_json(self.settings),
+                          'dcs_column': self.dcs_column,
+                          'tcs_column': self.tcs_column}
+            _write_json(self._meta_filename(), self._meta)
+        elif meta['physics_key'] != key:
+            raise ValueError(
+                "Settings differ from those the database in {} was created "
+                "with.".format(path))
+        else:
+            self._meta = meta
+
+    def _meta_filename(self):
+        return os.path.join(self.path, 'database.json')
+
+    def _read_meta(self):
+        if not os.path.exists(self._meta_filename()):
+            return None
+        with open(self._meta_filename()) as f:
+            return json.load(f)
+
+    def _check_identity(self, backend):
+        """Record the build of ELSCATA filling the database, and make sure
+        it is the same as before."""
+        identity = backend.identity()
+        if self._meta['identity'] is None:
+            self._meta['identity'] = identity
+            _write_json(self._meta_filename(), self._meta)
+        elif self._meta['identity'] != identity:
+            raise ValueError(
+                "The database in {} was filled with another build of "
+                "ELSCATA ({}).".format(self.path, self._meta['identity']))
+
+    def _settings(self, iz, energies=(1.0,)):
+        s = copy.copy(self.settings)
+        s['IZ'] = iz
+        s['EV'] = np.asarray(energies, dtype=float) * units.eV
+        return s
+
+    def _key(self, iz):
+        return physics_key(self._settings(iz), self._meta['identity'])
+
+    def elements(self):
+        """List the elements present in the database."""
+        return list(self._meta['elements'])
+
+    def table(self, iz):
+        """Get the arrays stored for an element, as a dictionary with the
+        keys `energy`, `angle`, `dcs` and `tcs`."""
+        if iz not in self._tables:
+            if iz not in self._meta['elements']:
+                raise KeyError(iz)
+            energy, angle, dcs, tcs = self._extract(
+                self._store.load(self._key(iz)))
+            self._tables[iz] = {'energy': energy, 'angle': angle,
+                                'dcs': dcs, 'tcs': tcs}
+        return self._tables[iz]
+
+    def energies(self, iz):
+        """Energies (eV) stored for an element."""
+        if iz not in self._meta['elements']:
+            return np.zeros(0)
+        return self.table(iz)['energy']
+
+    def _extract(self, result):
+        """Get `(energy, angle, dcs, tcs)` arrays from an ELSCATA result."""
+        tcstable = result['tcstable']
+        names = np.asarray(tcstable).dtype.names
+        tcs_column = self.tcs_column or names[1]
+        tcs_unit = dataframe_units(tcstable)[names.index(tcs_column)]
+        energy = np.asarray(tcstable)[names[0]]
+        tcs = np.asarray(tcstable)[tcs_column] * \
+            (1 * tcs_unit).to(units.cm**2).magnitude
+
+        dcs_names = sorted((name for name in result
+                            if name.startswith('dcs_')), key=dcs_energy)
+        angle = None
+        dcs = []
+        for name in dcs_names:
+            df = result[name]
+            data = np.asarray(df)
+            names = data.dtype.names
+            unit = dataframe_units(df)[names.index(self.dcs_column)]
+            if angle is None:
+                angle = np.array(data[names[0]])
+            dcs.append(data[self.dcs_column] *
+                       (1 * unit).to(units.cm**2 / units.sr).magnitude)
+
+        order = np.argsort(energy)
+        return energy[order], angle, np.array(dcs), tcs[order]
+
+    def fill(self, elements, energies, workers=None, **kwargs):
+        """Make sure the database contains all combinations of `elements`
+        and `energies`. Missing points are computed with
+        `EnergyGridStore.elscata`, one job per element, in parallel.
+
+        :param elements:
+            Iterable of atomic numbers.
+        :param energies:
+            Energies as a `pint` quantity array.
+        :param workers:
+            Number of jobs running at the same time. Defaults to the
+            number of cores.
+        :param kwargs:
+            Passed on to `elscata`, for instance `backend`, `pool` or
+            `cache`. Only complete results can be stored, so `outputs`
+            cannot be given.
+        """
+        if 'outputs' in kwargs:
+            raise TypeError("A database stores all outputs, so `outputs` "
+                            "cannot be given.")
+
+        backend = kwargs.pop('backend', None) or \
+            get_backend(kwargs.pop('pool', None))
+        self._check_identity(backend)
+
+        energies = np.sort(energies.to(units.eV).magnitude)
+        elements = sorted(set(elements))
+        workers = workers or os.cpu_count() or 1
+
+        with backend.pooled(min(workers, len(elements) or 1)) as b, \
+                ThreadPoolExecutor(max_workers=workers) as executor:
+            for _ in executor.map(
+                    lambda iz: self._store.elscata(
+                        self._settings(iz, energies), backend=b, **kwargs),
+                    elements):
+                pass
+
+        for iz in elements:
+            self._tables.pop(iz, None)
+        self._icdf = {k: v for k, v in self._icdf.items()
+                      if k[0] not in elements}
+        self._meta['elements'] = sorted(
+            set(self._meta['elements']) | set(elements))
+        _write_json(self._meta_filename(), self._meta)
+
+    def tcs(self, iz, energy):
+        """Total elastic cross section (cm**2), interpolated log-log in
+        energy.
+
+        :param energy:
+            Energies (eV), scalar or array.
+        """
+        t = self.table(iz)
+        return np.exp(np.interp(np.log(energy), np.log(t['energy']),
+                                np.log(t['tcs'])))
+
+    def dcs(self, iz, energy, angle):
+        """Differential cross section (cm**2/sr). The logarithm of the
+        DCS is interpolated bilinearly in the logarithm of the energy and
+        in the angle; the angular grid starts at zero, so a logarithm
+        cannot be taken there. Values outside the grid are clamped to its
+        edges.
+
+        :param energy:
+            Energies (eV).
+        :param angle:
+            Angles (deg), broadcast against `energy`.
+        """
+        t = self.table(iz)
+        log_dcs = np.log(t['dcs'])
+        i0, i1, w = _bracket(np.log(t['energy']), np.log(energy))
+        j0, j1, u = _bracket(t['angle'], angle)
+
+        return np.exp(
+            (1 - w) * (1 - u) * log_dcs[i0, j0] +
+            w * (1 - u) * log_dcs[i1, j0] +
+            (1 - w) * u * log_dcs[i0, j1] +
+            w * u * log_dcs[i1, j1])
+
+    def icdf_table(self, iz, n=1024):
+        """Inverse cumulative distribution of the scattering angle, for
+        each energy in the database.
+
+        :param n:
+            Number of equally spaced probabilities in `[0, 1]`.
+
+        :return:
+            Array of shape `(len(energies), n)`, where row `k` gives the
+            angles (deg) at which the cumulative probability of
+            scattering at the `k`-th energy reaches `linspace(0, 1, n)`.
+        """
+        t = self.table(iz)
+        theta = np.radians(t['angle'])
+        pdf = t['dcs'] * 2 * np.pi * np.sin(theta)
+        cdf = np.concatenate([
+            np.zeros((len(pdf), 1)),
+            np.cumsum((pdf[:, 1:] + pdf[:, :-1]) / 2 * np.diff(theta),
+                      axis=1)], axis=1)
+        cdf /= cdf[:, -1:]
+
+        p = np.linspace(0, 1, n)
+        return np.array([np.interp(p, c, t['angle']) for c in cdf])
+
+    def sample_angle(self, iz, energy, xi, n=1024):
+        """Sample scattering angles (deg) from uniform random numbers `xi`
+        in `[0, 1)`, using the inverse-CDF tables interpolated linearly in
+        the logarithm of the energy."""
+        t = self.table(iz)
+        if (iz, n) not in self._icdf:
+            self._icdf[iz, n] = self.icdf_table(iz, n)
+        icdf = self._icdf[iz, n]
+
+        i0, i1, w = _bracket(np.log(t['energy']), np.log(energy))
+        k0, k1, v = _bracket(np.linspace(0, 1, n), xi)
+        return (1 - w) * ((1 - v) * icdf[i0, k0] + v * icdf[i0, k1]) + \
+            w * ((1 - v) * icdf[i1, k0] + v * icdf[i1, k1])
+
+
+def _bracket(grid, x):
+    """Find indices `i0`, `i1` and weight `w` such that `x` lies at
+    fraction `w` between `grid[i0]` and `grid[i1]`, clamped to the grid.
+    """
+    x = np.asarray(x, dtype=float)
+    i0 = np.clip(np.searchsorted(grid, x) - 1, 0, max(len(grid) - 2, 0))
+    i1 = np.minimum(i0 + 1, len(grid) - 1)
+    dx = np.where(i1 > i0, grid[i1] - grid[i0], 1)
+    w = np.clip((x - grid[i0]) / dx, 0, 1)
+    return i0, i1, w
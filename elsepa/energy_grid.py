@@ -0,0 +1,90 @@
+"""
+Energy grid splitting
+=====================
+
+ELSCATA treats every energy in the `EV` list independently: each energy
+gets its own `dcs_*` file and its own row in `tcstable`. A long energy
+grid can therefore be split into chunks that are run in parallel, and
+the outputs merged back into the result a single run would have given.
+"""
+
+import copy
+
+import numpy as np
+
+from cslib import DataFrame
+
+from .parse_output import dataframe_units
+from .planner import balanced_chunks
+from .result import ElsepaResult
+
+
+def split_energies(settings, n_chunks: int, costs=None):
+    """Split the `EV` list of `settings` into at most `n_chunks`
+    contiguous chunks of nearly equal size.
+
+    :param costs:
+        Optional estimated cost of each energy, for instance from
+        `CostModel.energy_costs`. If given, the chunks are of nearly
+        equal cost instead of equal size, see `balanced_chunks`.
+
+    :return:
+        List of settings objects, identical to `settings` except for the
+        `EV` field.
+    """
+    energies = settings['EV']
+    if costs is not None:
+        chunks = balanced_chunks(costs, n_chunks)
+    else:
+        chunks = [(idx[0], idx[-1] + 1) for idx in
+                  np.array_split(np.arange(len(energies)), n_chunks)
+                  if len(idx) > 0]
+
+    result = []
+    for start, stop in chunks:
+        s = copy.copy(settings)
+        s['EV'] = energies[start:stop]
+        result.append(s)
+
+    return result
+
+
+def concat_dataframes(dfs):
+    """Concatenate the rows of `DataFrame` objects with the same columns.
+    Units and comments are taken from the first."""
+    first = dfs[0]
+    data = np.concatenate([np.asarray(df) for df in dfs])
+    return DataFrame(data, units=dataframe_units(first),
+                     comments=first.comments)
+
+
+def take_rows(df, index):
+    """Take the rows of a `DataFrame` at the positions in `index`."""
+    return DataFrame(np.asarray(df)[index], units=dataframe_units(df),
+                     comments=df.comments)
+
+
+def merge_results(results):
+    """Merge the results of runs over consecutive chunks of an energy
+    grid, as given by `split_energies`.
+
+    The `dcs_*` files are collected, and the rows of `tcstable` are
+    concatenated in the order of the chunks. Other outputs do not depend
+    on the grid (`scfield`) or belong to the last energy (`scatamp`), so
+    they are taken from the last run.
+
+    :param results:
+        List of results, in the order of the energy grid.
+    :return:
+        Merged `ElsepaResult`. Files that were not parsed yet in the
+        separate results are still parsed lazily.
+    """
+    merged = ElsepaResult()
+    for r in results:
+        merged.update(r)
+
+    tables = [r['tcstable'] for r in results if 'tcstable' in r]
+    if tables:
+        merged['tcstable'] = concat_dataframes(tables)
+
+    return merged
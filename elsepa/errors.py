@@ -0,0 +1,155 @@
+"""
+Errors and retries
+==================
+
+When ELSCATA stops on an inconsistent input it exits with a non-zero
+code, and writes the offending quantity as the last line on the screen.
+This is turned into an `ElsepaError`, carrying the exit code, the output
+of the program and the input deck. A run that takes longer than its
+timeout is killed and raises an `ElsepaTimeout`.
+
+Such failures are deterministic: running the same input again gives the
+same error. Failures of the Docker daemon or the connection to it are
+often transient, however. A `RetryPolicy` retries a job when it fails
+with an error it considers transient, waiting a little longer after
+every attempt.
+"""
+
+import sys
+import time
+
+from .instrument import stage
+
+
+class ElsepaError(Exception):
+    """An ELSEPA program failed.
+
+    .. py::attribute:: program
+        (string) Name of the program, `elscata` or `elscatm`.
+
+    .. py::attribute:: exit_code
+        (int or None) Exit code of the program.
+
+    .. py::attribute:: output
+        (string) What the program wrote to standard output and standard
+        error.
+
+    .. py::attribute:: input_deck
+        (string) The input that was given to the program.
+    """
+    def __init__(self, program, exit_code, output, input_deck=None):
+        self.program = program
+        self.exit_code = exit_code
+        self.output = output
+        self.input_deck = input_deck
+        super(ElsepaError, self).__init__(self.message())
+
+    def message(self):
+        return "{} exited with code {}:\n{}".format(
+            self.program, self.exit_code, self.tail())
+
+    def tail(self, n=10):
+        """The last `n` lines of output, where ELSEPA reports what went
+        wrong."""
+        return '\n'.join(self.output.rstrip().splitlines()[-n:])
+
+
+class ElsepaTimeout(ElsepaError):
+    """An ELSEPA program did not finish in time, and was killed.
+
+    .. py::attribute:: timeout
+        (float) The time limit in seconds.
+    """
+    def __init__(self, program, timeout, output='', input_deck=None):
+        self.timeout = timeout
+        super(ElsepaTimeout, self).__init__(
+            program, None, output, input_deck)
+
+    def message(self):
+        return "{} did not finish within {} s".format(
+            self.program, self.timeout)
+
+
+def is_transient(error):
+    """Check whether an error is likely to go away when trying again: a
+    lost connection to the Docker daemon, or an error on the side of the
+    daemon (HTTP status 5xx)."""
+    if isinstance(error, ConnectionError):
+        return True
+
+    # errors of `docker` and `requests` can only occur once these modules
+    # are loaded, so we need not import them here
+    requests = sys.modules.get('requests.exceptions')
+    if requests is not None and \
+            isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+
+    docker = sys.modules.get('docker.errors')
+    if docker is not None and isinstance(error, docker.APIError):
+        return error.is_server_error()
+
+    return False
+
+
+def is_docker_error(error):
+    """Check whether an error comes from Docker or the connection to it,
+    rather than from the job: after such an error, a container can no
+    longer be trusted."""
+    if isinstance(error, ConnectionError):
+        return True
+
+    requests = sys.modules.get('requests.exceptions')
+    if requests is not None and \
+            isinstance(error, requests.RequestException):
+        return True
+
+    docker = sys.modules.get('docker.errors')
+    return docker is not None and isinstance(error, docker.DockerException)
+
+
+class RetryPolicy(object):
+    """Retry a failed job with exponential backoff.
+
+    .. py::attribute:: attempts
+        (int) Maximum number of attempts, including the first.
+
+    .. py::attribute:: delay
+        (float) Seconds to wait before the first retry.
+
+    .. py::attribute:: backoff
+        (float) Factor by which the delay grows after every retry.
+
+    .. py::attribute:: max_delay
+        (float) Upper limit to the delay.
+
+    .. py::attribute:: retry_on
+        (function) Predicate telling whether an exception is worth
+        retrying, by default `is_transient`.
+    """
+    def __init__(self, attempts=3, delay=1.0, backoff=2.0, max_delay=60.0,
+                 retry_on=is_transient):
+        self.attempts = attempts
+        self.delay = delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.retry_on = retry_on
+
+    def call(self, f, *args, **kwargs):
+        """Call `f(*args, **kwargs)`, retrying if it raises an exception
+        accepted by `retry_on`. After the last attempt the exception is
+        raised."""
+        for attempt in range(self.attempts):
+            try:
+                return f(*args, **kwargs)
+            except Exception as error:
+                if attempt + 1 >= self.attempts or \
+                        not self.retry_on(error):
+                    raise
+
+            with stage('retry_wait'):
+                time.sleep(self.wait_time(attempt))
+
+    def wait_time(self, attempt):
+        """Seconds to wait after the given attempt failed, counting
+        from zero."""
+        return min(self.delay * self.backoff**attempt, self.max_delay)
@@ -2,18 +2,38 @@ import subprocess
 import os
 import posixpath
 import sys
+import json
+import tarfile
+import io
+import time
+import threading
+from importlib.util import find_spec
 
-try:
-    import docker
-    import json
-    import tarfile
-    import io
-    import time
+from .instrument import (stage, count_bytes, record_exit_code, current)
 
-except ImportError:
-    has_docker = False
-else:
-    has_docker = True
+# The `docker` module is only imported when a client is needed: importing
+# it is slow, and creating a client contacts the daemon.
+has_docker = find_spec('docker') is not None
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> 'docker.APIClient':
+    """Get the Docker API client shared by all containers. It is created
+    on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            import docker
+            _client = docker.APIClient(version='auto')
+    return _client
+
+
+class SharedClient(object):
+    """Descriptor giving the shared Docker client, see `get_client`."""
+    def __get__(self, obj, cls):
+        return get_client()
 
 
 class SimpleExecutable(object):
@@ -53,28 +73,24 @@ class SimpleExecutable(object):
         :type args_obj: Any
 
         :param **kwargs:
-            Keyword arguments are passed to `subprocess.run`.
+            Keyword arguments are passed to `subprocess.run`. The
+            program is run in :py:attribute:`working_dir`, unless `cwd`
+            is given here.
 
         :return:
             CompletedProcess object.
         """
         if self.working_dir:
-            orig_wd = os.getcwd()
-            os.chdir(self.working_dir)
+            kwargs.setdefault('cwd', self.working_dir)
 
         args = [self.path]
         if self.parameters:
             args.extend(self.parameters(args_obj))
 
-        result = subprocess.run(args, **kwargs)
+        return subprocess.run(args, **kwargs)
 
-        if self.working_dir:
-            os.chdir(orig_wd)
-
-        return result
 
-
-def build_image(client: docker.APIClient, path: str, name: str):
+def build_image(client: 'docker.APIClient', path: str, name: str):
     """Build the Docker image as per Dockerfile present in <path>.
     If the docker image with given name is newer than the Dockerfile,
     nothing is done.
@@ -97,6 +113,18 @@ def build_image(client: docker.APIClient, path: str, name: str):
             print(line, end='', file=sys.stderr, flush=True)
 
 
+def image_id(client: 'docker.APIClient', name: str) -> str:
+    """Get the ID of a Docker image. This changes every time the image is
+    rebuilt, so it identifies the exact ELSEPA build that is being run.
+
+    :param client:
+        Docker client
+    :param name:
+        Name of the image
+    """
+    return client.inspect_image(name)['Id']
+
+
 class Archive(object):
     """Easy interface to `tarfile`.
 
@@ -149,6 +177,29 @@ class Archive(object):
         return self.file.getvalue()
 
 
+class ChunkReader(io.RawIOBase):
+    """Read-only file object on top of an iterator of `bytes` chunks, as
+    returned by streaming calls to the Docker API."""
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.chunk = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.chunk:
+            try:
+                self.chunk = memoryview(next(self.chunks))
+            except StopIteration:
+                return 0
+
+        n = min(len(b), len(self.chunk))
+        b[:n] = self.chunk[:n]
+        self.chunk = self.chunk[n:]
+        return n
+
+
 class DockerContainer(object):
     """Easy interface to Docker API.
 
@@ -160,17 +211,31 @@ class DockerContainer(object):
     The object is a context manager for the created Docker container,
     in that it starts the container upon entry and exterminates the
     same container upon exit.
+
+    All containers share one Docker client, which is only created when
+    the first container is.
+
+    The container can be limited to the cores given in `cpuset` (for
+    instance `'0'` or `'0-3'`) and to `mem_limit` bytes of memory.
     """
 
-    client = docker.APIClient(version='auto')
+    client = SharedClient()
 
-    def __init__(self, image, working_dir=None):
+    def __init__(self, image, working_dir=None, cpuset=None, mem_limit=None):
         self.image = image
         self.working_dir = working_dir
-
-        container = self.client.create_container(
-            image=image, detach=True, stdin_open=True,
-            working_dir=working_dir)
+        self.cpuset = cpuset
+        self.mem_limit = mem_limit
+
+        kwargs = {}
+        if cpuset is not None or mem_limit is not None:
+            kwargs['host_config'] = self.client.create_host_config(
+                cpuset_cpus=cpuset, mem_limit=mem_limit)
+
+        with stage('container_create'):
+            container = self.client.create_container(
+                image=image, detach=True, stdin_open=True,
+                working_dir=working_dir, **kwargs)
         self.container_id = container['Id']
 
     def put_archive(self, archive, path="."):
@@ -188,8 +253,10 @@ class DockerContainer(object):
         if self.working_dir is not None:
             path = posixpath.join(self.working_dir, path)
 
-        self.client.put_archive(
-            self.container_id, path, archive.buffer)
+        with stage('put_archive'):
+            self.client.put_archive(
+                self.container_id, path, archive.buffer)
+        count_bytes(sent=len(archive.buffer))
 
     def get_archive(self, path):
         """Get a file or directory from the container and make it into
@@ -202,13 +269,40 @@ class DockerContainer(object):
 
         return Archive('r', strm.read())
 
-    def run(self, cmd, **kwargs):
+    def stream_archive(self, path):
+        """Get a file or directory from the container without loading
+        the whole archive in memory.
+
+        :return:
+            Generator of `(TarInfo, file object)` pairs, where the file
+            object is `None` if the entry is not a regular file. The
+            archive is read as a stream, so each file has to be read
+            before the next pair is requested.
+        """
+        if self.working_dir is not None and not posixpath.isabs(path):
+            path = posixpath.join(self.working_dir, path)
+
+        strm, stat = self.client.get_archive(
+            self.container_id, path)
+        if not hasattr(strm, 'read'):
+            strm = io.BufferedReader(ChunkReader(strm))
+
+        with tarfile.open(fileobj=strm, mode='r|') as tar:
+            for info in tar:
+                f = tar.extractfile(info) if info.isfile() else None
+                yield info, f
+
+    def run(self, cmd, check=False, **kwargs):
         """Run a command.
 
         :param cmd:
             Command to be run and arguments as a list.
         :type cmd: List[str]
 
+        :param check:
+            If `True`, raise `subprocess.CalledProcessError` if the
+            command exits with a non-zero code.
+
         :param kwargs:
             Forwarded to Docker-py `exec_create` function call.
 
@@ -220,18 +314,30 @@ class DockerContainer(object):
             container=self.container_id,
             cmd=cmd, **kwargs)
 
-        return self.client.exec_start(exec_id=exe['Id'])
+        output = self.client.exec_start(exec_id=exe['Id'])
+        if check or current() is not None:
+            exit_code = self.client.exec_inspect(exe['Id'])['ExitCode']
+            record_exit_code(exit_code)
+            if check and exit_code != 0:
+                raise subprocess.CalledProcessError(exit_code, cmd, output)
+        return output
 
-    def sh(self, *cmds):
+    def sh(self, *cmds, check=False):
         """Run a command with `sh -c`."""
-        return self.run(['sh', '-c', ' && '.join(cmds)])
+        return self.run(['sh', '-c', ' && '.join(cmds)], check=check)
 
     def start(self):
-        self.client.start(container=self.container_id)
+        with stage('container_start'):
+            self.client.start(container=self.container_id)
 
     def kill(self):
         self.client.kill(self.container_id)
 
+    def is_running(self):
+        """Check whether the container is still up."""
+        state = self.client.inspect_container(self.container_id)['State']
+        return state['Running']
+
     def remove(self, force=False):
         self.client.remove_container(self.container_id, force=force)
 
@@ -240,5 +346,6 @@ class DockerContainer(object):
         return self
 
     def __exit__(self, exc_type, exc_value, exc_st):
-        self.kill()
-        self.remove()
+        with stage('teardown'):
+            self.kill()
+            self.remove()
@@ -42,6 +42,7 @@ format::
     C ----+----1----+----2----+----3----+----4----+----5----+----6----+----7
 """
 
+import copy
 import io
 
 from cslib.predicates import (
@@ -53,10 +54,14 @@ from cslib.settings import (
 
 from cslib import (units)
 
+from .compiled import (
+    CompiledModel, integer, number, quantity, optional)
+
 
 def print_in(unit):
     def _print_in(v):
         return v.to(unit).magnitude
+    _print_in.unit = unit
     return _print_in
 
 
@@ -98,15 +103,47 @@ Elscata_model = Model([
 ])
 
 
-def generate_elscata_input(settings: Settings):
+# Flat checks equivalent to those of `Elscata_model`, see `elsepa.compiled`
+Elscata_compiled = CompiledModel(Elscata_model, {
+    'IZ':     integer(),
+    'MNUCL':  integer(1, 5),
+    'NELEC':  optional(integer()),
+    'MELEC':  integer(1, 6),
+    'MUFFIN': integer(values=(0, 1)),
+    'RMUF':   optional(quantity(units.cm)),
+    'IELEC':  integer(values=(-1, +1)),
+    'MEXCH':  integer(0, 4),
+    'MCPOL':  integer(0, 3),
+    'VPOLA':  optional(quantity(units.cm**3)),
+    'VPOLB':  number(),
+    'MABS':   integer(values=(0, 1)),
+    'VABSA':  number(),
+    'VABSD':  quantity(units.eV),
+    'IHEF':   number(0, 3),
+    'EV':     quantity(units.eV, array=True)
+})
+
+
+def generate_elscata_input(settings: Settings, compiled=True):
+    """Generate the ELSCATA input deck for `settings`.
+
+    :param compiled:
+        Use the fast path of `Elscata_compiled` where possible. The
+        output is the same either way.
+    """
     # pass through model
-    check_settings(settings, Elscata_model)
+    fast = compiled and Elscata_compiled.check(settings)
+    if not fast:
+        check_settings(settings, Elscata_model)
     # settings = apply_defaults_and_check(settings, Elscata_model)
 
     # apply hooks
     if 'NELEC' not in settings:
         settings.NELEC = settings.IZ
 
+    if fast:
+        return Elscata_compiled.write(settings)
+
     # print input file
     f = io.StringIO()
     for k, t in Elscata_model.items():
@@ -125,3 +162,99 @@ def generate_elscata_input(settings: Settings):
             print("{:7}{:< 12}{}".format(k, tr(v), t.description), file=f)
 
     return f.getvalue()
+
+
+# Settings that differ only in ways ELSCATA ignores give the same results:
+# omitted fields take their default value, `NELEC` defaults to `IZ`, and
+# quantities are converted to the units of the input file before being
+# printed. Writing every field explicitly gives a canonical input deck, so
+# that such settings can be recognised as the same job.
+
+
+def apply_defaults(settings: Settings, model: Model):
+    """Copy `settings`, filling in the defaults of `model` for fields
+    that are not given."""
+    s = copy.copy(settings)
+    for k, t in model.items():
+        if k not in s and t.default is not None:
+            s[k] = t.default
+    return s
+
+
+def canonical_elscata_input(settings: Settings):
+    """Generate the input deck for `settings` in canonical form, with all
+    defaults written out. Settings for which ELSCATA does the same thing
+    give the same deck. The `settings` object is not modified."""
+    s = apply_defaults(settings, Elscata_model)
+    if 'IZ' in s and s.get('NELEC') is None:
+        s['NELEC'] = s['IZ']
+    return generate_elscata_input(s)
+
+
+# ELSCATM computes scattering by molecules, in the independent-atom
+# approximation. Its input file uses the same keywords as ELSCATA for the
+# potential model and the energies, but instead of a single `IZ` the
+# molecule is given atom by atom, each on an `IZ` line with the atomic
+# number followed by the coordinates of the atom (cm)::
+#
+#     IZ     8    0.0000e+00  0.0000e+00  0.0000e+00  atomic number, ...
+#     IZ     1    7.5700e-09  5.8600e-09  0.0000e+00  atomic number, ...
+#     ...
+#     EV      1.0000e+02 output kinetic energies (eV)
+#
+# `test_docker.test_elscatm_deck_layout` checks this layout against the
+# `h2o.in` example that comes with ELSEPA.
+
+
+def is_atom_list(atoms):
+    """Check that `atoms` is a non-empty list of `(IZ, position)` pairs,
+    where the position is a length quantity array of three coordinates."""
+    try:
+        return len(atoms) > 0 and all(
+            is_integer(iz) and is_length(pos) and len(pos) == 3
+            for iz, pos in atoms)
+    except (TypeError, ValueError):
+        return False
+
+
+Elscatm_model = Model([
+    ('ATOMS',  Type("atoms as list of (IZ, position)", default=None,
+                    check=Predicate(is_atom_list), obligatory=True,
+                    generator=print_in(units.cm)))
+] + [(k, Elscata_model[k]) for k in [
+    'MNUCL', 'MELEC', 'IELEC', 'MEXCH', 'MCPOL', 'VPOLB', 'MABS', 'VABSA',
+    'VABSD', 'IHEF', 'EV']])
+
+
+def generate_elscatm_input(settings: Settings):
+    check_settings(settings, Elscatm_model)
+
+    f = io.StringIO()
+    for k, t in Elscatm_model.items():
+        if k not in settings:
+            continue
+
+        v = settings[k]
+        tr = t.generator
+
+        if k == 'ATOMS':
+            for iz, pos in v:
+                print("{:7}{:<4}{: .4e} {: .4e} {: .4e}  {}".format(
+                    'IZ', iz, *tr(pos),
+                    "atomic number, coordinates (cm)"), file=f)
+
+        elif k == 'EV':
+            print("{:7}{: .4e} {}".format(k, tr(v[0]), t.description), file=f)
+            for i in v[1:]:
+                print("{:7}{: .4e}".format(k, tr(i)), file=f)
+
+        elif v is not None:
+            print("{:7}{:< 12}{}".format(k, tr(v), t.description), file=f)
+
+    return f.getvalue()
+
+
+def canonical_elscatm_input(settings: Settings):
+    """Generate the input deck for ELSCATM in canonical form, see
+    `canonical_elscata_input`."""
+    return generate_elscatm_input(apply_defaults(settings, Elscatm_model))
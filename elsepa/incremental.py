@@ -0,0 +1,191 @@
+"""
+Incremental energy grids
+========================
+
+ELSCATA computes every energy of the `EV` list independently, so an
+energy grid can be refined without recomputing the points that are known
+already. The `EnergyGridStore` keeps, for every physics configuration,
+the union of all energies computed so far; a request for a grid runs
+ELSCATA only for the missing energies, and merges the new `dcs_*` files
+and `tcstable` rows into the stored set.
+
+A physics configuration is given by all fields of `Elscata_model` other
+than `EV`, in canonical form (see `canonical_elscata_input`), together
+with the build of ELSCATA that is used. Results are stored in the
+memory-mapped format of `elsepa.storage`.
+"""
+
+import copy
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from cslib import units
+
+from .backend import get_backend
+from .energy_grid import (concat_dataframes, take_rows)
+from .generate_input import canonical_elscata_input
+from .parse_output import (dataframe_units, dcs_energy)
+from .result import ElsepaResult
+from .run import elscata
+from .storage import (save_result, load_result)
+
+
+def physics_key(settings, identity):
+    """Key identifying the physics configuration of `settings`: a hash
+    of the canonical input deck without its `EV` lines, and of the
+    `identity` of the backend."""
+    s = copy.copy(settings)
+    s['EV'] = np.array([1.0]) * units.eV
+    deck = ''.join(line for line in
+                   canonical_elscata_input(s).splitlines(True)
+                   if not line.startswith('EV'))
+
+    h = hashlib.sha256()
+    h.update(identity.encode())
+    h.update(b'\0')
+    h.update(deck.encode())
+    return h.hexdigest()
+
+
+def tcstable_energies(result):
+    """Energies (eV) of the rows of `tcstable` in a result."""
+    tcstable = result['tcstable']
+    data = np.asarray(tcstable)
+    unit = dataframe_units(tcstable)[0]
+    return data[data.dtype.names[0]] * (1 * unit).to(units.eV).magnitude
+
+
+def _match(energies, grid, rtol=1e-4):
+    """Index of each of `energies` in `grid`, or -1 if not present."""
+    index = np.full(len(energies), -1)
+    for i, e in enumerate(energies):
+        j = np.flatnonzero(np.isclose(grid, e, rtol=rtol))
+        if len(j):
+            index[i] = j[0]
+    return index
+
+
+def merge_grids(stored, new):
+    """Merge the results of runs over disjoint sets of energies. The
+    rows of `tcstable` are sorted by energy.
+
+    :param stored:
+        Result over the energies computed before, or `None`.
+    :param new:
+        Result over the new energies. Other outputs, like `scfield`, are
+        taken from this one.
+    """
+    merged = ElsepaResult()
+    if stored is not None:
+        merged.update(stored)
+    merged.update(new)
+
+    tables = [r['tcstable'] for r in (stored, new)
+              if r is not None and 'tcstable' in r]
+    table = concat_dataframes(tables)
+    merged['tcstable'] = take_rows(
+        table, np.argsort(tcstable_energies({'tcstable': table}),
+                          kind='stable'))
+    return merged
+
+
+def select_energies(result, energies):
+    """Take the part of a result that belongs to the given energies (eV):
+    their `dcs_*` files, and the rows of `tcstable` in the order of
+    `energies`. Other outputs are kept as they are."""
+    selected = ElsepaResult()
+    for name in result:
+        if name == 'tcstable':
+            continue
+        if name.startswith('dcs_') and \
+                np.all(_match([dcs_energy(name)], energies, 1e-3) < 0):
+            continue
+        selected[name] = result[name]
+
+    index = _match(energies, tcstable_energies(result))
+    selected['tcstable'] = take_rows(result['tcstable'], index)
+    return selected
+
+
+class EnergyGridStore(object):
+    """Results of ELSCATA by physics configuration, extended on demand.
+
+    Each configuration is stored in a subdirectory of `path`, named by
+    its `physics_key`.
+
+    .. py::attribute:: path
+        (string) Directory of the store.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._locks = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def load(self, key):
+        """Load the stored result for a physics key, or `None`."""
+        path = os.path.join(self.path, key)
+        if not os.path.exists(path):
+            return None
+        return load_result(path)
+
+    def energies(self, settings, backend=None):
+        """Energies (eV) stored for the physics configuration of
+        `settings`."""
+        if backend is None:
+            backend = get_backend()
+        stored = self.load(physics_key(settings, backend.identity()))
+        if stored is None:
+            return np.zeros(0)
+        return np.sort(tcstable_energies(stored))
+
+    def elscata(self, settings, backend=None, pool=None, **kwargs):
+        """Run ELSCATA for the energies in `settings` that are not stored
+        yet, and add them to the store.
+
+        :param kwargs:
+            Passed on to `elscata`, for instance `cache` or `chunks`.
+            Only complete results can be stored, so `outputs` cannot be
+            given.
+
+        :return:
+            `ElsepaResult` holding the `dcs_*` files and `tcstable` rows
+            of the requested energies, as a single run of `elscata`
+            would. Its `stats` are those of the run for the missing
+            energies, or `None` if nothing had to be computed.
+        """
+        if 'outputs' in kwargs:
+            raise TypeError("Only complete results can be stored, so "
+                            "`outputs` cannot be given.")
+
+        if backend is None:
+            backend = get_backend(pool)
+        key = physics_key(settings, backend.identity())
+        requested = settings['EV'].to(units.eV).magnitude
+
+        with self._key_lock(key):
+            stored = self.load(key)
+            have = tcstable_energies(stored) if stored is not None \
+                else np.zeros(0)
+            missing = [e for e, i in zip(requested, _match(requested, have))
+                       if i < 0]
+
+            stats = None
+            if missing:
+                s = copy.copy(settings)
+                s['EV'] = np.array(sorted(set(missing))) * units.eV
+                new = elscata(s, backend=backend, **kwargs)
+                stats = new.stats
+                stored = merge_grids(stored, new)
+                save_result(stored, os.path.join(self.path, key))
+
+        result = select_energies(stored, requested)
+        result.stats = stats
+        return result
@@ -0,0 +1,236 @@
+"""
+Instrumentation
+===============
+
+Every run of `elscata` records how long each of its stages took, how many
+bytes were sent to and received from ELSCATA, and the exit codes of the
+commands that were run. The record is a `RunStats` object, available as
+the `stats` attribute of the result.
+
+The stages are, depending on the backend:
+
+* `generate_input`: checking the settings and writing the input deck,
+* `cache_lookup` and `cache_store`, if a cache is used,
+* `pool_wait`: waiting for a container of a `ContainerPool`,
+* `scheduler_wait`: waiting for a free core, see `elsepa.scheduler`,
+* `container_create`, `container_start` and `teardown`: life cycle of
+  the container or scratch directory,
+* `put_archive`, `execute` and `get_archive`: sending the input, running
+  ELSCATA and retrieving the output,
+* `parse`: parsing output files, which happens lazily when a file is
+  first accessed.
+
+Stages may nest: storing a result in the cache parses its files, so the
+time of `cache_store` includes that of `parse`.
+
+Functions added with `add_hook` are called after every stage, which can
+be used to feed an external monitoring system. `BatchStats` aggregates
+the records of many runs, for instance those of `elscata_many`.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class RunStats(object):
+    """Measurements of a single run.
+
+    .. py::attribute:: stages
+        (dict) Wall-clock time in seconds spent in each stage, in the
+        order in which the stages were first entered.
+
+    .. py::attribute:: bytes_sent
+        (int) Size of the input sent to ELSCATA.
+
+    .. py::attribute:: bytes_received
+        (int) Size of the output files retrieved.
+
+    .. py::attribute:: exit_codes
+        (list) Exit codes of the commands run for this job.
+
+    .. py::attribute:: cached
+        (bool) Whether the result was taken from a cache.
+    """
+    def __init__(self):
+        self.stages = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.exit_codes = []
+        self.cached = False
+
+    @property
+    def total(self):
+        """Total time of all stages."""
+        return sum(self.stages.values())
+
+    def add_stage(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add(self, other):
+        """Add the measurements of another run to these, for instance of
+        the chunks of an energy grid. The `cached` flag is left as is.
+
+        :return:
+            self
+        """
+        for name, seconds in other.stages.items():
+            self.add_stage(name, seconds)
+        self.bytes_sent += other.bytes_sent
+        self.bytes_received += other.bytes_received
+        self.exit_codes.extend(other.exit_codes)
+        return self
+
+    def __repr__(self):
+        return 'RunStats({}, sent={}, received={}, exit_codes={})'.format(
+            ', '.join('{}={:.3g}s'.format(*kv) for kv in self.stages.items()),
+            self.bytes_sent, self.bytes_received, self.exit_codes)
+
+
+_local = threading.local()
+_hooks = []
+
+
+def add_hook(hook):
+    """Call `hook(name, seconds, stats)` after every stage of every run,
+    from the thread in which the stage ran. The `stats` argument is the
+    `RunStats` of the run, or `None` if the stage ran outside of one."""
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def current():
+    """The `RunStats` being collected in this thread, or `None`."""
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if stack else None
+
+
+@contextmanager
+def collect(stats=None):
+    """Context manager collecting the measurements made in this thread
+    into a `RunStats` object, which it yields."""
+    if stats is None:
+        stats = RunStats()
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+
+    _local.stack.append(stats)
+    try:
+        yield stats
+    finally:
+        _local.stack.pop()
+
+
+@contextmanager
+def stage(name, stats=None):
+    """Context manager timing a stage.
+
+    :param stats:
+        `RunStats` to record into. Defaults to the one being collected
+        in this thread, if any.
+    """
+    if stats is None:
+        stats = current()
+
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - t0
+        if stats is not None:
+            stats.add_stage(name, seconds)
+        for hook in list(_hooks):
+            hook(name, seconds, stats)
+
+
+def count_bytes(sent=0, received=0):
+    """Record bytes transferred in the current run."""
+    stats = current()
+    if stats is not None:
+        stats.bytes_sent += sent
+        stats.bytes_received += received
+
+
+def record_exit_code(code):
+    """Record the exit code of a command in the current run."""
+    stats = current()
+    if stats is not None:
+        stats.exit_codes.append(code)
+
+
+class BatchStats(object):
+    """Aggregated measurements of many runs.
+
+    .. py::attribute:: runs
+        (list) `RunStats` of the runs added.
+
+    .. py::attribute:: errors
+        (int) Number of failed runs.
+    """
+    def __init__(self):
+        self.runs = []
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def add(self, stats):
+        """Add the `RunStats` of a run, or `None` for a failed run."""
+        with self._lock:
+            if stats is None:
+                self.errors += 1
+            else:
+                self.runs.append(stats)
+
+    def summary(self):
+        """Statistics of the time spent in each stage.
+
+        :return:
+            Dictionary from stage names to dictionaries with the keys
+            `count`, `total`, `mean`, `median`, `p95` and `max`, in
+            seconds.
+        """
+        import numpy as np
+
+        with self._lock:
+            runs = list(self.runs)
+
+        times = {}
+        for r in runs:
+            for name, seconds in r.stages.items():
+                times.setdefault(name, []).append(seconds)
+
+        result = {}
+        for name, t in times.items():
+            t = np.array(t)
+            result[name] = {
+                'count': len(t), 'total': t.sum(), 'mean': t.mean(),
+                'median': np.median(t), 'p95': np.percentile(t, 95),
+                'max': t.max()}
+        return result
+
+    def report(self):
+        """Human readable table of `summary`, with the stages that take
+        most time first."""
+        summary = self.summary()
+        grand_total = sum(s['total'] for s in summary.values()) or 1.0
+
+        lines = ['{:<18} {:>6} {:>10} {:>10} {:>10} {:>10} {:>6}'.format(
+            'stage', 'count', 'mean', 'median', 'p95', 'max', '%')]
+        for name, s in sorted(summary.items(),
+                              key=lambda kv: -kv[1]['total']):
+            lines.append(
+                '{:<18} {:>6} {:>10.4f} {:>10.4f} {:>10.4f} {:>10.4f} '
+                '{:>6.1f}'.format(
+                    name, s['count'], s['mean'], s['median'], s['p95'],
+                    s['max'], 100 * s['total'] / grand_total))
+
+        with self._lock:
+            runs = list(self.runs)
+        lines.append('{} runs ({} cached), {} errors, {} bytes sent, '
+                     '{} bytes received'.format(
+                         len(runs), sum(r.cached for r in runs), self.errors,
+                         sum(r.bytes_sent for r in runs),
+                         sum(r.bytes_received for r in runs)))
+        return '\n'.join(lines)
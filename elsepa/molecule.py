@@ -0,0 +1,113 @@
+"""
+Molecules and compounds
+=======================
+
+ELSCATM handles molecules with a given geometry. For compounds where the
+geometry does not matter, or is not known, cross sections can be built
+from atomic cross sections with the additivity rule: the cross section of
+the compound is the sum of those of its atoms.
+
+In both cases many molecules share elements. The atomic runs are
+therefore deduplicated over the whole batch and run in parallel with
+`elscata_many`.
+"""
+
+import copy
+from collections import Counter
+
+import numpy as np
+
+from cslib import DataFrame
+
+from .batch import elscata_many
+from .generate_input import (Elscata_model, Settings)
+from .parse_output import dataframe_units
+
+
+def composition(molecule):
+    """Get the composition of a molecule.
+
+    :param molecule:
+        Either settings following `Elscatm_model`, a list of
+        `(IZ, position)` pairs as in its `ATOMS` field, or a dictionary
+        mapping `IZ` to the number of atoms.
+    :return:
+        Dictionary mapping `IZ` to the number of atoms.
+    """
+    if isinstance(molecule, dict) and 'ATOMS' in molecule:
+        molecule = molecule['ATOMS']
+    if isinstance(molecule, dict):
+        return dict(molecule)
+    return dict(Counter(iz for iz, _ in molecule))
+
+
+def atomic_results(molecules, settings: Settings, known=None, **kwargs):
+    """Compute ELSCATA results for every element that occurs in
+    `molecules`. Each element is run only once, and all runs are done in
+    parallel.
+
+    :param molecules:
+        Iterable of molecules, in any form accepted by `composition`.
+
+    :param settings:
+        Settings for the potential model and the energies. Fields that
+        are not in `Elscata_model`, and `IZ` and `NELEC`, are ignored.
+
+    :param known:
+        Dictionary of results that are already available, by `IZ`. These
+        elements are not run again.
+
+    :param kwargs:
+        Passed on to `elscata_many`, for instance `cache` or `backend`.
+
+    :return:
+        Dictionary mapping `IZ` to the `elscata` result.
+    """
+    known = dict(known or {})
+    elements = sorted(set(iz for m in molecules for iz in composition(m))
+                      - set(known))
+
+    physics = Settings(**{
+        k: copy.copy(settings[k]) for k in Elscata_model
+        if k in settings and k not in ('IZ', 'NELEC')})
+
+    def jobs():
+        for iz in elements:
+            s = copy.copy(physics)
+            s['IZ'] = iz
+            yield s
+
+    for r in elscata_many(jobs(), **kwargs):
+        if r.error is not None:
+            raise r.error
+        known[elements[r.index]] = r.result
+
+    return known
+
+
+def additive_tcstable(molecule, atomic):
+    """Total cross sections of a molecule or compound by the additivity
+    rule. All atomic results should be computed for the same energies.
+
+    :param molecule:
+        Molecule, in any form accepted by `composition`.
+
+    :param atomic:
+        Dictionary mapping `IZ` to `elscata` results, as given by
+        `atomic_results`.
+
+    :return:
+        `DataFrame` with the same columns as the atomic `tcstable`, where
+        all columns but the first (the energy) are summed over the atoms.
+    """
+    comp = sorted(composition(molecule).items())
+    tables = [(n, np.asarray(atomic[iz]['tcstable'])) for iz, n in comp]
+    first = atomic[comp[0][0]]['tcstable']
+
+    data = np.array(tables[0][1], copy=True)
+    for name in data.dtype.names[1:]:
+        data[name] = sum(n * t[name] for n, t in tables)
+
+    description = ' + '.join('{} x Z={}'.format(n, iz) for iz, n in comp)
+    return DataFrame(data, units=dataframe_units(first),
+                     comments=['additivity rule: ' + description])
@@ -2,23 +2,27 @@ from cslib import units, DataFrame
 
 import numpy as np
 import re
-from itertools import takewhile
-from collections import OrderedDict, Counter
+from fnmatch import fnmatchcase
+from itertools import (takewhile, islice)
+from collections import OrderedDict, Counter, namedtuple
+from functools import lru_cache
 
 
 def arg_first(pred, s):
     return next(i for i, v in enumerate(s) if pred(v))
 
 
+name_with_unit = re.compile(r"([^\(]*)\(([^\)]*)\)")
+
+
 def extract_units(s):
-    """Get name and units from a string. The string should be formatted
+    r"""Get name and units from a string. The string should be formatted
     as `<name>(<units>)`, where both `<name>` and `<units>` should not
     contain parentheses. The `<units>` part is then parsed by the `pint`
     module into the correct `pint` units.
 
-    If the string fails to match the Regex `([^\\(]*)\(([^\\)]*)\)`, the
+    If the string fails to match the Regex `([^\(]*)\(([^\)]*)\)`, the
     same string is returned with `dimensionless` units."""
-    name_with_unit = re.compile("([^\\(]*)\(([^\\)]*)\)")
     m = name_with_unit.match(s)
     if m:
         return m.group(1).strip(), units.parse_units(m.group(2))
@@ -32,41 +36,113 @@ def join_double_header(l1_, l2_):
     m = max(len(l1_), len(l2_))
     l1 = l1_.ljust(m+1)
     l2 = l2_.ljust(m+1)
-    c = list(zip(l1, l2))
 
-    x1 = x2 = 0
-    while True:
-        x1 = x2 + arg_first(lambda v: v[0] != ' ' or v[1] != ' ', c[x2:])
-        x2 = x1 + arg_first(lambda v: v[0] == ' ' and v[1] == ' ', c[x1:])
-        yield ' '.join([l1[x1:x2].strip(), l2[x1:x2].strip()])
+    x1 = None
+    for x, (a, b) in enumerate(zip(l1, l2)):
+        blank = a == ' ' and b == ' '
+        if x1 is None and not blank:
+            x1 = x
+        elif x1 is not None and blank:
+            yield ' '.join([l1[x1:x].strip(), l2[x1:x].strip()])
+            x1 = None
+
+
+def augment_names(names):
+    """Number the names that occur more than once, as `name[0]`,
+    `name[1]` and so on, so that all column names are unique."""
+    count = Counter(names)
+    q = {n: 0 for n in count}
+
+    def do_augment_name(name):
+        if count[name] > 1:
+            aug_name = '{name}[{i}]'.format(name=name, i=q[name])
+            q[name] += 1
+            return aug_name
+        else:
+            return name
+
+    return [do_augment_name(n) for n in names]
+
+
+HeaderSchema = namedtuple('HeaderSchema', ['names', 'units', 'dtype'])
+HeaderSchema.__doc__ = """Columns of an ELSCATA output file: a tuple of
+unique column names, a tuple of their units, and the structured `numpy`
+dtype of the data."""
+
+
+@lru_cache(maxsize=256)
+def header_schema(line1, line2):
+    """Get the `HeaderSchema` from the last two comment lines of an
+    output file. All `dcs_*` files share the same header, so the result
+    is cached: parsing the header and the units is done once for all
+    files of a batch."""
+    if line1.strip() == '':
+        h = [a.strip() for a in line2.split('  ') if a]
+    else:
+        h = list(join_double_header(line1, line2))
+
+    header = [extract_units(i) for i in h]
+    names = tuple(augment_names([n for n, _ in header]))
+    return HeaderSchema(names, tuple(u for _, u in header),
+                        np.dtype([(n, float) for n in names]))
 
 
 def extract_header(comments):
     """Extract header information from the last two lines in `comments`,
     where `comments` should be a list of strings."""
-    if comments[-2].strip() == '':
-        h = [a.strip() for a in comments[-1].split('  ') if a]
-    else:
-        h = list(join_double_header(comments[-2], comments[-1]))
+    schema = header_schema(comments[-2], comments[-1])
+    return list(zip(schema.names, schema.units))
 
-    header = [extract_units(i) for i in h]
 
-    def augment_name(names):
-        count = Counter(names)
-        q = {n: 0 for n in count}
+def dataframe_units(df):
+    """Get the units of the columns in a `DataFrame` as a list, in the
+    same order as the columns."""
+    if isinstance(df.units, dict):
+        return [df.units[name] for name in df.dtype.names]
+    return list(df.units)
 
-        def do_augment_name(name):
-            if count[name] > 1:
-                aug_name = '{name}[{i}]'.format(name=name, i=q[name])
-                q[name] += 1
-                return aug_name
-            else:
-                return name
 
-        return do_augment_name
+def _read_block(lines, n_columns):
+    if not any(l.strip() for l in lines):
+        return np.zeros((0, n_columns))
 
-    augment = augment_name(n for n, _ in header)
-    return [(augment(name), unit) for name, unit in header]
+    try:
+        values = np.loadtxt(lines, dtype=float, comments=None, ndmin=2)
+    except ValueError:
+        values = None
+
+    if values is None or values.shape[1:] != (n_columns,):
+        rows = (tuple(float(v) for v in l.split()) for l in lines)
+        values = np.array([r for r in rows if len(r) == n_columns],
+                          dtype=float).reshape(-1, n_columns)
+
+    return values
+
+
+def read_table(lines, n_columns, block_size=4096):
+    """Read rows of `n_columns` numbers from `lines` into a 2D array.
+    Rows with a different number of values are skipped.
+
+    The lines are read in blocks of `block_size`, so that only one block
+    of text is held in memory at a time. The common case of a clean block
+    of numbers is read in one go by `np.loadtxt`; only if that fails do we
+    go through the lines of the block one by one.
+
+    :param lines: An iterable yielding strings.
+    :return: Array of shape `(n_rows, n_columns)`."""
+    lines = iter(lines)
+    blocks = []
+    while True:
+        block = list(islice(lines, block_size))
+        if not block:
+            break
+        blocks.append(_read_block(block, n_columns))
+
+    if not blocks:
+        return np.zeros((0, n_columns))
+    if len(blocks) == 1:
+        return blocks[0]
+    return np.concatenate(blocks)
 
 
 def parse_most_elscata_output(lines):
@@ -79,18 +155,14 @@ def parse_most_elscata_output(lines):
     def is_comment(l):
         return l.startswith(" #") and not l.startswith(" #---")
 
-    comments = [line[2:] for line in takewhile(is_comment, lines)]
-    header = extract_header(comments)
-
-    def is_data(row):
-        return len(row) == len(header)
+    comments = [line[2:].rstrip('\n')
+                for line in takewhile(is_comment, lines)]
+    schema = header_schema(comments[-2], comments[-1])
 
-    values = (tuple(float(v) for v in l.split()) for l in lines)
-    # stupid NumPy doesn't recognize generators
-    raw_data = list(filter(is_data, values))
-    data = np.array(raw_data, dtype=[(h[0], float) for h in header])
+    values = read_table(lines, len(schema.names))
+    data = np.ascontiguousarray(values).view(dtype=schema.dtype).reshape(-1)
 
-    return DataFrame(data, units=[h[1] for h in header], comments=comments)
+    return DataFrame(data, units=list(schema.units), comments=comments)
 
 
 class RegexDict(OrderedDict):
@@ -115,3 +187,31 @@ elsepa_output_parsers = RegexDict([
     ("scfield",  parse_most_elscata_output),
     ("tcstable", parse_most_elscata_output)
 ])
+
+elscatm_output_parsers = RegexDict([
+    ("input",    None),
+    ("dcs_.*",   parse_most_elscata_output),
+    ("tcstable", parse_most_elscata_output),
+    (".*",       None)
+])
+
+output_parsers = {
+    'elscata': elsepa_output_parsers,
+    'elscatm': elscatm_output_parsers
+}
+
+
+def dcs_energy(name):
+    """Get the energy (eV) from the name of a `dcs_*` output file. ELSCATA
+    writes the energy in the name with a `p` for the decimal point, for
+    instance `dcs_1p000e03` for 1 keV."""
+    return float(name[4:].replace('p', '.'))
+
+
+def is_selected(name, outputs):
+    """Check whether the output file `name` (without `.dat` extension)
+    matches one of the glob patterns in `outputs`, for instance
+    `['tcstable', 'dcs_*']`. If `outputs` is `None` or empty, every file
+    is selected."""
+    return not outputs or any(fnmatchcase(name, p) for p in outputs)
+
@@ -0,0 +1,223 @@
+"""
+Cost model and planner
+======================
+
+The run time of ELSCATA varies a lot between jobs: it grows with the
+energy, and depends on the atomic number and on the options of the
+potential model. When a batch is run in the order it is given, a few
+slow jobs at the end keep one core busy while the others are idle.
+
+The `CostModel` estimates the run time of a job from its settings. Every
+energy of the `EV` list is treated independently, with a cost that is
+linear in the features
+
+    1, log(E / eV), IZ, MUFFIN, MCPOL, MABS, IHEF
+
+plus a fixed cost per run. The weights are fitted with least squares to
+the measured `execute` times of earlier runs, which the model collects
+from the `stats` of results (see `elsepa.instrument`), and can keep in a
+history file across sessions. Until there is enough history, every
+energy is assumed to cost the same.
+
+The planner functions use these estimates: `lpt_order` puts the longest
+jobs first, `lpt_schedule` assigns jobs to workers the same way, and
+`balanced_chunks` splits an energy grid into contiguous chunks of nearly
+equal cost. `elscata`, `elscata_many` and `Sweep.submit` take a
+`cost_model` argument to use them, and feed their timings back into it.
+"""
+
+import heapq
+import json
+import os
+import threading
+
+import numpy as np
+
+from cslib import units
+
+from .generate_input import (Elscata_model, apply_defaults)
+
+
+features = ['IZ', 'MUFFIN', 'MCPOL', 'MABS', 'IHEF']
+
+
+def energy_features(settings):
+    """Features of every energy of a job, as an array with one row per
+    energy: a constant, the logarithm of the energy in eV, and the
+    fields in `features`."""
+    s = apply_defaults(settings, Elscata_model)
+    energies = np.atleast_1d(s['EV'].to(units.eV).magnitude)
+    fields = [float(s[k]) for k in features]
+    return np.column_stack([
+        np.ones(len(energies)), np.log(energies),
+        np.tile(fields, (len(energies), 1))])
+
+
+def job_features(settings):
+    """Features of a job: a constant for the cost per run, and the sums
+    over its energies of `energy_features`."""
+    return np.concatenate([[1.0], energy_features(settings).sum(axis=0)])
+
+
+class CostModel(object):
+    """Estimate run times of ELSCATA jobs from recorded timings.
+
+    .. py::attribute:: path
+        (string or None) JSON lines file keeping the timing history. If
+        it exists, the history is read from it, and new timings are
+        appended.
+
+    .. py::attribute:: min_samples
+        (int) Number of recorded runs needed before the model is fitted.
+        With fewer, the cost of a job is its number of energies.
+    """
+    def __init__(self, path=None, min_samples=20):
+        self.path = path
+        self.min_samples = min_samples
+        self.weights = None
+
+        self._samples = []
+        self._fitted = 0
+        self._lock = threading.Lock()
+
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        r = json.loads(line)
+                        self._samples.append(
+                            (np.array(r['features']), r['seconds']))
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, settings, seconds):
+        """Add the measured run time of a job to the history."""
+        x = job_features(settings)
+        with self._lock:
+            self._samples.append((x, seconds))
+            if self.path is not None:
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps({'features': x.tolist(),
+                                        'seconds': seconds}) + '\n')
+
+    def observe(self, settings, result):
+        """Record the run time of a job from the `stats` of its result.
+        Results taken from a cache, or without timings, are ignored."""
+        stats = getattr(result, 'stats', None)
+        if stats is None or stats.cached or 'execute' not in stats.stages:
+            return
+        self.record(settings, stats.stages['execute'])
+
+    def fit(self):
+        """Fit the weights to the history, if there is enough of it.
+        This is done automatically when estimates are asked for.
+
+        :return:
+            The weights, or `None` if there are too few samples.
+        """
+        with self._lock:
+            samples = list(self._samples)
+        if len(samples) < self.min_samples:
+            return None
+
+        x = np.array([s[0] for s in samples])
+        y = np.array([s[1] for s in samples])
+        weights, _, _, _ = np.linalg.lstsq(x, y, rcond=None)
+
+        with self._lock:
+            self.weights = weights
+            self._fitted = len(samples)
+        return weights
+
+    def _weights(self):
+        if len(self._samples) != self._fitted:
+            self.fit()
+        return self.weights
+
+    def energy_costs(self, settings):
+        """Estimated cost of each energy of a job, in seconds, or in
+        units of one energy if the model is not fitted yet. Estimates
+        are kept positive."""
+        weights = self._weights()
+        x = energy_features(settings)
+        if weights is None:
+            return np.ones(len(x))
+
+        costs = x @ weights[1:]
+        floor = max(1e-6, 1e-3 * np.abs(costs).max())
+        return np.maximum(costs, floor)
+
+    def predict(self, settings):
+        """Estimated run time of a job, in seconds, or its number of
+        energies if the model is not fitted yet."""
+        weights = self._weights()
+        costs = self.energy_costs(settings).sum()
+        if weights is None:
+            return costs
+        return max(weights[0], 0.0) + costs
+
+
+def lpt_order(costs):
+    """Order of jobs with the longest first (longest processing time
+    rule). Jobs of equal cost keep their order.
+
+    :return:
+        List of indices into `costs`.
+    """
+    return sorted(range(len(costs)), key=lambda i: -costs[i])
+
+
+def lpt_schedule(costs, workers):
+    """Assign jobs to workers, taking the longest job first and giving
+    each job to the worker with the least work so far.
+
+    :return:
+        Tuple of a list with the job indices of each worker, in the order
+        they should be run, and the estimated makespan.
+    """
+    heap = [(0.0, w) for w in range(workers)]
+    assignment = [[] for _ in range(workers)]
+    for i in lpt_order(costs):
+        load, w = heapq.heappop(heap)
+        assignment[w].append(i)
+        heapq.heappush(heap, (load + costs[i], w))
+    return assignment, max(load for load, _ in heap)
+
+
+def _greedy_chunks(costs, capacity):
+    """Start a new chunk whenever the next energy would exceed
+    `capacity`; returns the start index of every chunk."""
+    starts = [0]
+    load = 0.0
+    for i, c in enumerate(costs):
+        if load + c > capacity and load > 0:
+            starts.append(i)
+            load = 0.0
+        load += c
+    return starts
+
+
+def balanced_chunks(costs, n_chunks):
+    """Split a list of costs into at most `n_chunks` contiguous chunks,
+    minimizing the cost of the largest chunk.
+
+    :return:
+        List of `(start, stop)` index pairs.
+    """
+    costs = np.asarray(costs, dtype=float)
+    if len(costs) == 0:
+        return []
+
+    lo, hi = costs.max(), costs.sum()
+    for _ in range(60):
+        if hi - lo <= 1e-9 * hi:
+            break
+        mid = (lo + hi) / 2
+        if len(_greedy_chunks(costs, mid)) <= n_chunks:
+            hi = mid
+        else:
+            lo = mid
+
+    starts = _greedy_chunks(costs, hi)
+    return list(zip(starts, starts[1:] + [len(costs)]))
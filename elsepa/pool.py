@@ -0,0 +1,268 @@
+"""
+Warm container pool
+===================
+
+Creating, starting, killing and removing a Docker container takes much
+longer than a small ELSCATA run. The `ContainerPool` keeps a number of
+long-lived containers running, and hands out a fresh scratch directory
+inside one of them for every job.
+"""
+
+import logging
+import os
+import posixpath
+import queue
+import shlex
+import threading
+import uuid
+from contextlib import contextmanager
+
+from .errors import is_docker_error
+from .executable import DockerContainer
+from .instrument import stage
+
+
+log = logging.getLogger(__name__)
+
+
+class ScratchDirectory(object):
+    """A directory inside a running `DockerContainer`, exposing the same
+    interface as the container itself. Relative paths are taken relative
+    to the scratch directory, and shell commands are run from there."""
+    def __init__(self, container, path):
+        self.container = container
+        self.path = path
+
+    def put_archive(self, archive, path="."):
+        self.container.put_archive(
+            archive, posixpath.join(self.path, path))
+
+    def get_archive(self, path):
+        return self.container.get_archive(
+            posixpath.join(self.path, path))
+
+    def stream_archive(self, path):
+        return self.container.stream_archive(
+            posixpath.join(self.path, path))
+
+    def run(self, cmd, **kwargs):
+        """Run a command from within the scratch directory.
+
+        :param cmd:
+            Command to be run and arguments as a list.
+        :type cmd: List[str]
+        """
+        return self.container.run(
+            ['sh', '-c', 'cd {} && exec "$@"'.format(shlex.quote(self.path)),
+             'sh'] + list(cmd), **kwargs)
+
+    def sh(self, *cmds, check=False):
+        """Run a command with `sh -c` from within the scratch directory."""
+        return self.container.sh('cd ' + shlex.quote(self.path), *cmds,
+                                 check=check)
+
+
+class ContainerPool(object):
+    """A pool of warm Docker containers.
+
+    Containers are started once and reused for many jobs. Each job gets
+    its own scratch directory, that is removed when the job is done. A
+    container that fails during a job, or is found not to be running
+    anymore, is thrown away and replaced by a fresh one.
+
+    A job that fails with an error of its own, like an `ElsepaError` for
+    a bad input deck, leaves its container in the pool. A container is
+    only replaced after an error of Docker or of the connection to it,
+    or when it is found not to be running anymore.
+
+    The pool is a context manager: it starts its containers upon entry
+    and exterminates them upon exit.
+
+    .. py::attribute:: image
+        (string) Name of the Docker image.
+
+    .. py::attribute:: size
+        (int) Number of containers kept warm.
+
+    .. py::attribute:: scratch_root
+        (string) Directory inside the containers under which the
+        per-job scratch directories are created.
+
+    .. py::attribute:: scheduler
+        (Scheduler or None) If given, every container is pinned to a core
+        of its own and limited to the memory per job of the scheduler,
+        and jobs are accounted for in its utilization. The size of the
+        pool is at most the capacity of the scheduler.
+    """
+    # seconds between checks for missing containers, while waiting for one
+    wait_interval = 1.0
+
+    def __init__(self, image='elsepa', size=None, working_dir='/opt/elsepa',
+                 scratch_root='/tmp/elsepa-jobs', scheduler=None):
+        self.image = image
+        self.size = size or os.cpu_count() or 1
+        self.working_dir = working_dir
+        self.scratch_root = scratch_root
+        self.scheduler = scheduler
+        if scheduler is not None:
+            self.size = min(size or scheduler.capacity, scheduler.capacity)
+
+        self._idle = queue.Queue()
+        self._containers = []
+        self._cpus = {}
+        self._missing = []
+        self._lock = threading.Lock()
+        self._started = False
+
+    def _new_container(self, cpu=None):
+        if cpu is None:
+            container = DockerContainer(
+                self.image, working_dir=self.working_dir)
+        else:
+            container = DockerContainer(
+                self.image, working_dir=self.working_dir, cpuset=str(cpu),
+                mem_limit=self.scheduler.memory_per_job)
+        self._cpus[container] = cpu
+        self._containers.append(container)
+        try:
+            container.start()
+        except Exception:
+            self._discard(container)
+            raise
+        return container
+
+    def _discard(self, container):
+        """Remove a container from the pool. Errors are logged, not
+        raised: the container is not used anymore either way.
+
+        :return:
+            The core the container was pinned to, or `None`.
+        """
+        if container in self._containers:
+            self._containers.remove(container)
+        cpu = self._cpus.pop(container, None)
+        try:
+            container.kill()
+        except Exception:
+            pass
+        try:
+            container.remove(force=True)
+        except Exception:
+            log.exception("Could not remove container %s",
+                          getattr(container, 'container_id', container))
+        return cpu
+
+    def start(self):
+        """Start all containers in the pool. Calling this more than once
+        has no effect."""
+        with self._lock:
+            if self._started:
+                return
+            cpus = self.scheduler.cpus if self.scheduler is not None \
+                else [None] * self.size
+            try:
+                for i in range(self.size):
+                    self._idle.put(self._new_container(cpus[i]))
+            except BaseException:
+                # `__exit__` is not called when `__enter__` raises
+                self._close()
+                raise
+            self._started = True
+
+    def close(self):
+        """Kill and remove all containers in the pool."""
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        for container in list(self._containers):
+            self._discard(container)
+        self._idle = queue.Queue()
+        self._missing = []
+        self._started = False
+
+    def recycle(self, container):
+        """Replace a container by a fresh one.
+
+        :return:
+            The new container, or `None` if it could not be created. The
+            pool then creates it when the next job is started.
+        """
+        with self._lock:
+            cpu = self._discard(container)
+            try:
+                return self._new_container(cpu)
+            except Exception:
+                log.exception("Could not replace container")
+                self._missing.append(cpu)
+                return None
+
+    def _replenish(self):
+        """Create the containers that could not be replaced before. Errors
+        are raised, failing the job that asked for a container."""
+        with self._lock:
+            while self._missing:
+                self._idle.put(self._new_container(self._missing[-1]))
+                self._missing.pop()
+
+    def _acquire(self):
+        """Wait for an idle container. Containers that could not be
+        replaced are created meanwhile, also when they went missing while
+        we were waiting."""
+        while True:
+            self._replenish()
+            try:
+                return self._idle.get(timeout=self.wait_interval)
+            except queue.Empty:
+                continue
+
+    @contextmanager
+    def job(self):
+        """Claim a container for the duration of one job. Blocks until a
+        container is available.
+
+        :return:
+            Context manager yielding a `ScratchDirectory`.
+        """
+        self.start()
+        with stage('pool_wait'):
+            container = self._acquire()
+        scratch = ScratchDirectory(
+            container, posixpath.join(self.scratch_root, uuid.uuid4().hex))
+
+        healthy = True
+        try:
+            with stage('container_start'):
+                container.sh('mkdir -p ' + shlex.quote(scratch.path))
+            if self.scheduler is not None:
+                with self.scheduler.job(cpu=self._cpus[container]):
+                    yield scratch
+            else:
+                yield scratch
+        except Exception as error:
+            healthy = not is_docker_error(error)
+            raise
+        finally:
+            if healthy:
+                healthy = self._clean(container, scratch)
+            if not healthy:
+                container = self.recycle(container)
+            if container is not None:
+                self._idle.put(container)
+
+    def _clean(self, container, scratch):
+        """Remove the scratch directory of a job, and check that the
+        container is still fit for the next one."""
+        try:
+            with stage('teardown'):
+                container.sh('rm -rf ' + shlex.quote(scratch.path))
+            return container.is_running()
+        except Exception:
+            return False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_st):
+        self.close()
@@ -0,0 +1,125 @@
+"""
+Lazy results
+============
+
+Parsing all output files of a run is wasted effort if only some of them
+are used. The `ElsepaResult` mapping keeps the raw contents of the output
+files, and parses a file only when it is first accessed.
+"""
+
+import io
+from collections.abc import MutableMapping
+
+from .parse_output import elsepa_output_parsers
+from .instrument import stage
+
+
+class ElsepaResult(MutableMapping):
+    """Mapping from output file names (without the `.dat` extension) to
+    parsed `DataFrame` objects. Only files for which a parser is given in
+    `parsers` appear as keys; the raw text of other files,
+    like `input`, is still available through `raw`.
+
+    A file is parsed on first access, after which the parsed result is
+    kept next to the raw contents. Both stay in memory until `release`
+    is called for the file; call it once you are done with a file.
+    Checking whether a file is present with `in` does not parse it.
+
+    .. py::attribute:: stats
+        (RunStats or None) Measurements of the run that gave this
+        result, see `elsepa.instrument`. Parsing time is added to it.
+    """
+    def __init__(self, raw=None, parsed=None, parsers=elsepa_output_parsers):
+        """
+        :param raw:
+            Dictionary of file names to `bytes` with their contents.
+        :param parsed:
+            Dictionary of file names to already parsed results.
+        :param parsers:
+            `RegexDict` giving the parser for each file name, by default
+            `elsepa_output_parsers`.
+        """
+        self._raw = dict(raw or {})
+        self._parsed = dict(parsed or {})
+        self.parsers = parsers
+        self.stats = None
+
+    def _keys(self):
+        keys = [name for name in self._raw
+                if self.parsers[name] is not None]
+        keys.extend(name for name in self._parsed if name not in self._raw)
+        return keys
+
+    def __getitem__(self, name):
+        if name in self._parsed:
+            return self._parsed[name]
+
+        if name not in self._raw:
+            raise KeyError(name)
+
+        parser = self.parsers[name]
+        if parser is None:
+            raise KeyError(name)
+
+        lines = io.TextIOWrapper(io.BytesIO(self._raw[name]), encoding='utf-8')
+        with stage('parse', self.stats):
+            value = self._parsed[name] = parser(lines)
+        return value
+
+    def __setitem__(self, name, value):
+        self._raw.pop(name, None)
+        self._parsed[name] = value
+
+    def __delitem__(self, name):
+        if name not in self._raw and name not in self._parsed:
+            raise KeyError(name)
+
+        self._raw.pop(name, None)
+        self._parsed.pop(name, None)
+
+    def __contains__(self, name):
+        if name in self._parsed:
+            return True
+        return name in self._raw and self.parsers[name] is not None
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self):
+        return len(self._keys())
+
+    def __repr__(self):
+        return 'ElsepaResult({})'.format(', '.join(
+            '{}{}'.format(name, '' if name in self._parsed else ' (raw)')
+            for name in self._keys()))
+
+    def raw(self, name, encoding='utf-8') -> str:
+        """Get the contents of an output file as text. This is available
+        until the file is released, also after it has been parsed."""
+        return self._raw[name].decode(encoding)
+
+    def is_parsed(self, name) -> bool:
+        """Check whether an output file has been parsed yet."""
+        return name in self._parsed
+
+    def release(self, *names):
+        """Free the memory held for the given files, both raw and parsed.
+        The files are removed from the result."""
+        for name in names:
+            self._raw.pop(name, None)
+            self._parsed.pop(name, None)
+
+    def update(self, other=(), **kwargs):
+        """Like `dict.update`, but copying raw files from another
+        `ElsepaResult` without parsing them."""
+        if isinstance(other, ElsepaResult):
+            for name in other._raw:
+                self._parsed.pop(name, None)
+            self._raw.update(other._raw)
+            for name, value in other._parsed.items():
+                if name not in other._raw:
+                    self._raw.pop(name, None)
+                self._parsed[name] = value
+            other = ()
+
+        super(ElsepaResult, self).update(other, **kwargs)
@@ -1,32 +1,137 @@
-from elsepa.generate_input import (generate_elscata_input, Settings)
-from elsepa.parse_output import (elsepa_output_parsers)
-from elsepa.executable import (DockerContainer, Archive)
+from elsepa.generate_input import (
+    canonical_elscata_input, canonical_elscatm_input, Settings)
+from elsepa.backend import get_backend
+from elsepa.energy_grid import (split_energies, merge_results)
+from elsepa.instrument import (RunStats, collect, current, stage)
 
-import re
+from concurrent.futures import ThreadPoolExecutor
 
 
-def elscata(settings: Settings):
-    with DockerContainer('elsepa', working_dir='/opt/elsepa') as elsepa:
-        elsepa.put_archive(
-            Archive('w')
-            .add_text_file('input.dat', generate_elscata_input(settings))
-            .close())
+def elscata(settings: Settings, pool=None, cache=None, chunks=None,
+            backend=None, outputs=None, retry=None, cost_model=None):
+    """Run ELSCATA.
 
-        elsepa.sh('./elscata < input.dat',
-                  'mkdir result && mv *.dat result')
+    :param settings:
+        Settings following `Elscata_model`.
 
-        result_tar = elsepa.get_archive('result')
-        result = {}
+    :param pool:
+        Optional `ContainerPool`. If given, the job is run in one of its
+        warm containers, otherwise a new container is created for this
+        run alone.
 
-        for info in result_tar:
-            if not info.isfile():
-                continue
+    :param cache:
+        Optional `ResultCache`. If the same input deck was run before
+        with the same build of ELSCATA, the result is taken from the
+        cache. The deck is written in canonical form, see
+        `canonical_elscata_input`, so equivalent settings share entries.
 
-            name = re.match("result/(.*)\\.dat", info.name).group(1)
-            parser = elsepa_output_parsers[name]
+    :param chunks:
+        If larger than one, the `EV` list is split into this many chunks
+        that are run in parallel. The merged result is the same as that
+        of a single run.
 
-            if parser:
-                lines = result_tar.get_text_file(info).split('\n')
-                result[name] = parser(lines)
+    :param backend:
+        Backend to run ELSCATA with, see `elsepa.backend`. Defaults to
+        `get_backend(pool)`.
+
+    :param outputs:
+        Glob patterns of the output files to retrieve and parse, without
+        the `.dat` extension, for instance `['tcstable', 'dcs_*']`. If
+        `None`, all output files are returned.
+
+    :param retry:
+        Optional `RetryPolicy`, to try again when a run fails with a
+        transient error. Failures of ELSCATA itself raise an
+        `ElsepaError`.
+
+    :param cost_model:
+        Optional `CostModel`. The time of the run is recorded in it, and
+        `chunks` are split into parts of nearly equal estimated cost.
+
+    :return:
+        `ElsepaResult` mapping output file names to `DataFrame` objects.
+        The files are parsed when they are first accessed. Timings of
+        the run are in its `stats` attribute, see `elsepa.instrument`.
+    """
+    if backend is None:
+        backend = get_backend(pool)
+
+    if chunks is not None and chunks > 1 and len(settings['EV']) > 1:
+        costs = cost_model.energy_costs(settings) \
+            if cost_model is not None else None
+        parts = split_energies(settings, chunks, costs)
+        with ThreadPoolExecutor(max_workers=len(parts)) as executor:
+            results = list(executor.map(
+                lambda s: elscata(s, cache=cache, backend=backend,
+                                  outputs=outputs, retry=retry,
+                                  cost_model=cost_model),
+                parts))
+        merged = merge_results(results)
+        merged.stats = RunStats()
+        for r in results:
+            merged.stats.add(r.stats)
+        merged.stats.cached = all(r.stats.cached for r in results)
+        return merged
+
+    with collect():
+        with stage('generate_input'):
+            input_deck = canonical_elscata_input(settings)
+        result = run_cached(backend, input_deck, cache, outputs, retry)
+
+    if cost_model is not None:
+        cost_model.observe(settings, result)
+    return result
+
+
+def elscatm(settings: Settings, pool=None, cache=None, backend=None,
+            outputs=None, retry=None):
+    """Run ELSCATM, for scattering by molecules.
+
+    :param settings:
+        Settings following `Elscatm_model`.
+
+    :param backend:
+        Backend to run ELSCATM with. Defaults to
+        `get_backend(pool, program='elscatm')`.
+
+    The other arguments are the same as for `elscata`.
+
+    :return:
+        `ElsepaResult` mapping output file names to `DataFrame` objects.
+    """
+    if backend is None:
+        backend = get_backend(pool, program='elscatm')
+
+    with collect():
+        with stage('generate_input'):
+            input_deck = canonical_elscatm_input(settings)
+        return run_cached(backend, input_deck, cache, outputs, retry)
+
+
+def run_cached(backend, input_deck, cache=None, outputs=None, retry=None):
+    """Run an input deck with a backend, looking up and storing the
+    result in `cache` if it is given, and retrying according to the
+    `RetryPolicy` given in `retry`. The `RunStats` being collected, if
+    any, is attached to the result."""
+    stats = current()
+    if cache is not None:
+        with stage('cache_lookup'):
+            key = cache.key(input_deck, backend.identity(), outputs)
+            result = cache.get(key)
+        if result is not None:
+            if stats is not None:
+                stats.cached = True
+            result.stats = stats
+            return result
+
+    if retry is not None:
+        result = retry.call(backend.run, input_deck, outputs)
+    else:
+        result = backend.run(input_deck, outputs)
+    result.stats = stats
+
+    if cache is not None:
+        with stage('cache_store'):
+            cache.put(key, result)
 
     return result
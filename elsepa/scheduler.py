@@ -0,0 +1,219 @@
+"""
+Resource scheduler
+==================
+
+ELSCATA is a single-threaded Fortran program. Running more jobs at once
+than there are cores, or letting the kernel move them between cores,
+makes them compete for the same caches and slows every one of them down.
+The `Scheduler` hands out one core, and a share of the memory, to each
+job, and only admits a new job when a core and enough memory are free.
+
+The Docker backend pins each container to its core, and limits its
+memory, through the `cpuset_cpus` and `mem_limit` settings of its host
+config. A `ContainerPool` with a scheduler pins each of its containers
+to a core of its own. The native backend only admits its processes
+through the scheduler, and leaves their placement to the kernel.
+
+The scheduler keeps track of how long each core was busy, so that the
+utilization of a batch can be reported with `Scheduler.report`.
+"""
+
+import os
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from .instrument import stage
+
+
+def available_cpus():
+    """The cores this process may run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _cgroup_memory_limit():
+    for path in ('/sys/fs/cgroup/memory.max',
+                 '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit():
+            return int(value)
+    return None
+
+
+def available_memory():
+    """Memory in bytes available for new processes, taking the memory
+    limit of the cgroup into account, or `None` if unknown."""
+    memory = None
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    memory = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        try:
+            memory = os.sysconf('SC_PAGE_SIZE') * \
+                os.sysconf('SC_AVPHYS_PAGES')
+        except (ValueError, OSError, AttributeError):
+            pass
+
+    limit = _cgroup_memory_limit()
+    if limit is not None:
+        memory = limit if memory is None else min(memory, limit)
+    return memory
+
+
+Allocation = namedtuple('Allocation', ['cpu', 'memory', 'start'])
+Allocation.__doc__ = """Resources given to a job: the core `cpu` it is
+pinned to, its `memory` limit in bytes (or `None`), and the time at which
+it was admitted."""
+
+
+Utilization = namedtuple(
+    'Utilization', ['cpus', 'elapsed', 'busy', 'jobs', 'peak', 'waited'])
+Utilization.__doc__ = """Usage of the resources of a `Scheduler` since it
+was created or reset: the number of `cpus`, the `elapsed` wall-clock
+time, the `busy` time per core (a dictionary), the number of `jobs`
+admitted, the `peak` number of jobs running at once, and the total time
+jobs `waited` for admission, all times in seconds."""
+
+
+class Scheduler(object):
+    """Admit jobs when a core and enough memory are free.
+
+    .. py::attribute:: cpus
+        (list) Cores to run jobs on. Defaults to `available_cpus()`.
+
+    .. py::attribute:: memory
+        (int or None) Memory in bytes that all jobs together may use.
+        Defaults to `available_memory()`. If `None`, memory is not
+        limited.
+
+    .. py::attribute:: memory_per_job
+        (int or None) Memory in bytes given to each job, unless another
+        amount is asked for. This is also the limit set on Docker
+        containers.
+    """
+    def __init__(self, cpus=None, memory=None, memory_per_job=512 * 2**20):
+        self.cpus = list(cpus) if cpus is not None else available_cpus()
+        self.memory = memory if memory is not None else available_memory()
+        self.memory_per_job = memory_per_job
+
+        self._free = list(self.cpus)
+        self._memory_used = 0
+        self._condition = threading.Condition()
+        self.reset()
+
+    @property
+    def capacity(self):
+        """Number of jobs that can run at the same time."""
+        n = len(self.cpus)
+        if self.memory is not None and self.memory_per_job:
+            n = min(n, max(1, self.memory // self.memory_per_job))
+        return n
+
+    def reset(self):
+        """Start measuring utilization anew."""
+        with self._condition:
+            self._t0 = time.monotonic()
+            self._busy = {cpu: 0.0 for cpu in self.cpus}
+            self._jobs = 0
+            self._peak = 0
+            self._waited = 0.0
+
+    def _admissible(self, cpu, memory):
+        if cpu is None and not self._free:
+            return False
+        if cpu is not None and cpu not in self._free:
+            return False
+        if self.memory is None or not memory:
+            return True
+        # a job that needs more than there is may run on an idle host
+        return self._memory_used + memory <= self.memory or \
+            len(self._free) == len(self.cpus)
+
+    def acquire(self, memory=None, cpu=None):
+        """Wait until a core and `memory` bytes are free, and claim them.
+
+        :param memory:
+            Memory needed by the job, defaults to `memory_per_job`.
+
+        :param cpu:
+            Ask for this core in particular, rather than any free one.
+
+        :return:
+            An `Allocation`, to be given back with `release`.
+        """
+        if memory is None:
+            memory = self.memory_per_job
+        if cpu is not None and cpu not in self.cpus:
+            raise ValueError("CPU {} is not managed by this scheduler"
+                             .format(cpu))
+
+        t0 = time.monotonic()
+        with stage('scheduler_wait'), self._condition:
+            self._condition.wait_for(lambda: self._admissible(cpu, memory))
+            if cpu is None:
+                cpu = self._free[0]
+            self._free.remove(cpu)
+            self._memory_used += memory or 0
+
+            now = time.monotonic()
+            self._waited += now - t0
+            self._jobs += 1
+            self._peak = max(self._peak, len(self.cpus) - len(self._free))
+        return Allocation(cpu, memory, now)
+
+    def release(self, allocation):
+        """Give back the resources of a job."""
+        with self._condition:
+            self._free.append(allocation.cpu)
+            self._memory_used -= allocation.memory or 0
+            if allocation.cpu in self._busy:
+                self._busy[allocation.cpu] += \
+                    time.monotonic() - max(allocation.start, self._t0)
+            self._condition.notify_all()
+
+    @contextmanager
+    def job(self, memory=None, cpu=None):
+        """Context manager claiming resources for a job, see `acquire`.
+
+        :return:
+            Context manager yielding the `Allocation`.
+        """
+        allocation = self.acquire(memory, cpu)
+        try:
+            yield allocation
+        finally:
+            self.release(allocation)
+
+    def utilization(self):
+        """Usage of the resources so far, as a `Utilization` tuple. The
+        busy time counts jobs that have finished."""
+        with self._condition:
+            return Utilization(
+                len(self.cpus), time.monotonic() - self._t0,
+                dict(self._busy), self._jobs, self._peak, self._waited)
+
+    def report(self):
+        """Human readable summary of `utilization`."""
+        u = self.utilization()
+        elapsed = u.elapsed or 1.0
+        lines = ['{:<6} {:>10} {:>7}'.format('cpu', 'busy (s)', '%')]
+        for cpu, busy in sorted(u.busy.items()):
+            lines.append('{:<6} {:>10.3f} {:>7.1f}'.format(
+                cpu, busy, 100 * busy / elapsed))
+        lines.append(
+            '{} jobs on {} cores in {:.3f}s: {:.1f}% utilization, at most '
+            '{} at once, {:.3f}s waiting'.format(
+                u.jobs, u.cpus, u.elapsed,
+                100 * sum(u.busy.values()) / (elapsed * u.cpus),
+                u.peak, u.waited))
+        return '\n'.join(lines)
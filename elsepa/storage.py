@@ -0,0 +1,94 @@
+"""
+Result storage
+==============
+
+Save ELSCATA results in a binary format that can be memory mapped. A
+result is stored as a directory with one `.npy` file per output file,
+holding the structured array of the `DataFrame`, and a `meta.json` with
+the units and comments of each.
+
+Loading a result maps the arrays in memory with `np.load(mmap_mode='r')`
+instead of reading them: this takes next to no time, only the pages that
+are used are read from disk, and processes loading the same result share
+one copy in the page cache.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from cslib import (units, DataFrame)
+
+from .parse_output import dataframe_units
+from .result import ElsepaResult
+
+
+def dataframe_meta(df):
+    """Units and comments of a `DataFrame`, in a form that can be stored
+    as JSON."""
+    return {'units': [str(u) for u in dataframe_units(df)],
+            'comments': list(df.comments or [])}
+
+
+def make_dataframe(data, meta):
+    """Build a `DataFrame` from a structured array and the dictionary
+    given by `dataframe_meta`."""
+    return DataFrame(data, units=[units.parse_units(u) for u in meta['units']],
+                     comments=meta['comments'])
+
+
+def save_result(result, path):
+    """Save a result to the directory `path`, replacing it if it exists.
+    The directory is written next to its destination first, and moved in
+    place when complete.
+
+    :param result:
+        Mapping of output file names to `DataFrame` objects, as returned
+        by `elscata`.
+    """
+    path = os.path.abspath(path)
+    parent = os.path.dirname(path)
+    tmp = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    try:
+        meta = {}
+        for name, df in result.items():
+            np.save(os.path.join(tmp, name + '.npy'), np.asarray(df))
+            meta[name] = dataframe_meta(df)
+
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        if os.path.exists(path):
+            old = tempfile.mkdtemp(dir=parent, prefix='.old-')
+            os.rename(path, os.path.join(old, 'result'))
+            os.rename(tmp, path)
+            shutil.rmtree(old)
+        else:
+            os.rename(tmp, path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def load_result(path, mmap_mode='r'):
+    """Load a result saved with `save_result`.
+
+    :param mmap_mode:
+        Passed to `np.load`. With the default `'r'` the arrays are read
+        only memory maps of the files; use `None` to read them into
+        memory.
+
+    :return:
+        `ElsepaResult` of `DataFrame` objects.
+    """
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+
+    return ElsepaResult(parsed={
+        name: make_dataframe(
+            np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode),
+            m)
+        for name, m in meta.items()})
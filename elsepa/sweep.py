@@ -0,0 +1,666 @@
+"""
+Distributed sweeps
+==================
+
+Spread a sweep over many processes, on one machine or on several compute
+nodes, through a shared job queue.
+
+A job is described by a *job spec*, a JSON-serialisable dictionary with
+the settings (see `settings_to_json`), the program, the selection of
+output files and the generated input deck. The ID of a job is a hash of
+the program, the output selection and the canonical input deck, so that
+submitting the same sweep twice gives the same jobs.
+
+Two queues are available, with the same interface:
+
+* `SQLiteQueue` keeps the jobs in an SQLite database. This is the right
+  choice for many processes on one machine; on a shared filesystem it
+  only works if the filesystem supports file locking.
+* `DirectoryQueue` keeps every job as a file in a directory, and moves it
+  between the subdirectories `pending`, `running`, `done` and `failed`
+  with atomic renames. This works on any shared filesystem.
+
+Workers (`work`) claim jobs from the queue, run them with the default
+backend and write the results atomically into a results directory, in
+the format of `elsepa.storage`, before marking them as done. A claimed
+job carries a lease that the worker renews while it runs; if a worker
+dies, its job is handed out again when the lease expires. This counts
+as a failed attempt, so that a job that kills its worker is not retried
+forever. A job that fails with a timeout or a transient error (see
+`is_transient`) is tried again, up to `max_attempts` times; other
+errors, like an `ElsepaError` for a bad input deck, fail the job right
+away.
+
+The `Sweep` driver submits the jobs, reports progress and collects the
+results. After a crash of the driver or the workers, submitting the same
+sweep again picks up where it left off: finished jobs are not run again.
+
+Workers on other nodes are started with::
+
+    python -m elsepa.sweep worker <queue> <results>
+
+where `<queue>` is the path of the SQLite database (ending in `.db` or
+`.sqlite`) or of the queue directory.
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from cslib import units
+from cslib.settings import Settings
+
+from .backend import get_backend
+from .batch import (canonical_inputs, plan_jobs)
+from .errors import (ElsepaTimeout, is_transient)
+from .instrument import collect
+from .planner import CostModel
+from .storage import (save_result, load_result)
+
+
+def _to_json(value):
+    if hasattr(value, 'magnitude') and hasattr(value, 'units'):
+        return {'magnitude': _to_json(value.magnitude),
+                'units': str(value.units)}
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [_to_json(v) for v in value]
+    return value
+
+
+def _from_json(value):
+    if isinstance(value, dict) and set(value) == {'magnitude', 'units'}:
+        magnitude = value['magnitude']
+        if isinstance(magnitude, list):
+            magnitude = np.array(magnitude)
+        return units.Quantity(magnitude, value['units'])
+    if isinstance(value, list):
+        return [_from_json(v) for v in value]
+    return value
+
+
+def settings_to_json(settings):
+    """Convert settings to a dictionary that can be written as JSON.
+    Quantities are stored as their magnitude and units."""
+    return {k: _to_json(v) for k, v in settings.items()}
+
+
+def settings_from_json(data):
+    """Reconstruct settings stored with `settings_to_json`."""
+    return Settings(**{k: _from_json(v) for k, v in data.items()})
+
+
+def job_spec(settings, program='elscata', outputs=None):
+    """Describe a job to be put in a queue.
+
+    :return:
+        Dictionary with the keys `id`, `program`, `outputs`, `settings`
+        and `input_deck`.
+    """
+    input_deck = canonical_inputs[program](settings)
+
+    h = hashlib.sha256()
+    h.update(program.encode())
+    h.update(b'\0')
+    h.update(json.dumps(outputs).encode())
+    h.update(b'\0')
+    h.update(input_deck.encode())
+
+    return {'id': h.hexdigest(), 'program': program, 'outputs': outputs,
+            'settings': settings_to_json(settings),
+            'input_deck': input_deck}
+
+
+def open_queue(path, **kwargs):
+    """Open an `SQLiteQueue` if `path` ends with `.db` or `.sqlite`,
+    otherwise a `DirectoryQueue`."""
+    if path.endswith(('.db', '.sqlite')):
+        return SQLiteQueue(path, **kwargs)
+    return DirectoryQueue(path, **kwargs)
+
+
+class SQLiteQueue(object):
+    """Job queue in an SQLite database.
+
+    .. py::attribute:: path
+        (string) Location of the database file.
+
+    .. py::attribute:: lease
+        (float) Seconds after which a job claimed by a worker that did
+        not renew its lease is handed out again.
+
+    .. py::attribute:: max_attempts
+        (int) Number of times a job is tried before it is marked as
+        failed.
+    """
+    def __init__(self, path, lease=600.0, max_attempts=3):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+
+        with self._transaction() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    seq      INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id       TEXT UNIQUE NOT NULL,
+                    spec     TEXT NOT NULL,
+                    state    TEXT NOT NULL DEFAULT 'pending',
+                    worker   TEXT,
+                    claimed  REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error    TEXT)""")
+
+    def _connection(self):
+        # connections cannot be shared between threads or processes
+        key = (os.getpid(), threading.get_ident())
+        if getattr(self._local, 'key', None) != key:
+            self._local.key = key
+            self._local.db = sqlite3.connect(
+                self.path, timeout=60, isolation_level=None)
+        return self._local.db
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+    def __getstate__(self):
+        return {'path': self.path, 'lease': self.lease,
+                'max_attempts': self.max_attempts}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def submit(self, specs):
+        """Add jobs to the queue. Jobs that are already in the queue, in
+        whatever state, are left alone."""
+        with self._transaction() as db:
+            db.executemany(
+                "INSERT OR IGNORE INTO jobs (id, spec) VALUES (?, ?)",
+                ((s['id'], json.dumps(s)) for s in specs))
+
+    def claim(self, worker):
+        """Claim a pending job. Jobs whose lease has expired count as a
+        failed attempt, and are put back in the queue first, unless they
+        have been tried `max_attempts` times.
+
+        :return:
+            The job spec, or `None` if there is no job to claim.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            # a job that kills its worker must not be retried forever
+            db.execute(
+                "UPDATE jobs SET attempts = attempts + 1, "
+                "error = 'Lease of ' || worker || ' expired', "
+                "state = CASE WHEN attempts + 1 >= ? THEN 'failed' "
+                "ELSE 'pending' END "
+                "WHERE state = 'running' AND claimed < ?",
+                (self.max_attempts, now - self.lease))
+            row = db.execute(
+                "SELECT id, spec FROM jobs WHERE state = 'pending' "
+                "ORDER BY seq LIMIT 1").fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE jobs SET state = 'running', worker = ?, "
+                "claimed = ? WHERE id = ?", (worker, now, row[0]))
+        return json.loads(row[1])
+
+    def renew(self, job_id, worker):
+        """Renew the lease on a claimed job."""
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET claimed = ? WHERE id = ? AND worker = ? "
+                "AND state = 'running'", (time.time(), job_id, worker))
+
+    def complete(self, job_id, worker):
+        """Mark a job as done."""
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET state = 'done', error = NULL "
+                "WHERE id = ? AND state = 'running'", (job_id,))
+
+    def fail(self, job_id, worker, error, retry=True):
+        """Record a failed attempt. The job is put back in the queue,
+        unless it has been tried `max_attempts` times, or `retry` is
+        false."""
+        max_attempts = self.max_attempts if retry else 0
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET attempts = attempts + 1, error = ?, "
+                "state = CASE WHEN attempts + 1 >= ? THEN 'failed' "
+                "ELSE 'pending' END WHERE id = ? AND worker = ? "
+                "AND state = 'running'",
+                (error, max_attempts, job_id, worker))
+
+    def counts(self):
+        """Number of jobs in each state."""
+        with self._transaction() as db:
+            rows = db.execute(
+                "SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        counts = dict.fromkeys(['pending', 'running', 'done', 'failed'], 0)
+        counts.update(rows)
+        return counts
+
+    def errors(self):
+        """Dictionary of job IDs to error messages of failed jobs."""
+        with self._transaction() as db:
+            return dict(db.execute(
+                "SELECT id, error FROM jobs WHERE state = 'failed'"))
+
+
+class _Transaction(object):
+    """Context manager for an SQLite transaction that takes the write lock
+    right away, so that claiming a job is atomic."""
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, exc_value, exc_st):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+class DirectoryQueue(object):
+    """Job queue in a directory, for use on a shared filesystem. Every
+    job is a JSON file, that is moved between the subdirectories
+    `pending`, `running`, `done` and `failed` by atomic renames.
+
+    The name of a job file starts with a zero-padded sequence number,
+    given in the order of submission, followed by the job ID. Jobs are
+    claimed in the order of their names, which does not depend on the
+    resolution of file times on the shared filesystem.
+
+    The attributes `lease` and `max_attempts` are as for `SQLiteQueue`.
+    """
+    states = ['pending', 'running', 'done', 'failed']
+
+    def __init__(self, path, lease=600.0, max_attempts=3):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._claimed = {}
+        for state in self.states:
+            os.makedirs(os.path.join(path, state), exist_ok=True)
+
+    @staticmethod
+    def _name(job):
+        return '{:010d}-{}.json'.format(job['seq'], job['spec']['id'])
+
+    @staticmethod
+    def _job_id(name):
+        return name[:-5].split('-', 1)[1]
+
+    def _file(self, state, name):
+        return os.path.join(self.path, state, name)
+
+    def _write(self, state, job):
+        tmp = os.path.join(self.path, state,
+                           '.{}.tmp'.format(uuid.uuid4().hex))
+        with open(tmp, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp, self._file(state, self._name(job)))
+
+    def _read(self, state, name):
+        with open(self._file(state, name)) as f:
+            return json.load(f)
+
+    def _move(self, name, source, target):
+        try:
+            os.rename(self._file(source, name), self._file(target, name))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _names(self, state):
+        """Names of the job files in a state, in the order of submission."""
+        return sorted(
+            e.name for e in os.scandir(os.path.join(self.path, state))
+            if e.name.endswith('.json') and not e.name.startswith('.'))
+
+    def _find(self, state, job_id):
+        """Name of the file of a job, or `None` if it is not in `state`."""
+        name = self._claimed.get(job_id)
+        if name is not None:
+            return name
+        suffix = '-{}.json'.format(job_id)
+        for name in self._names(state):
+            if name.endswith(suffix):
+                return name
+        return None
+
+    def submit(self, specs):
+        names = [name for state in self.states for name in self._names(state)]
+        known = {self._job_id(name) for name in names}
+        seq = max((int(name.split('-', 1)[0]) for name in names),
+                  default=0)
+        for spec in specs:
+            if spec['id'] in known:
+                continue
+            seq += 1
+            known.add(spec['id'])
+            self._write('pending', {'spec': spec, 'seq': seq, 'attempts': 0})
+
+    def _requeue_stale(self):
+        """Count jobs whose lease has expired as a failed attempt, and put
+        them back in the queue, or fail them after `max_attempts`."""
+        now = time.time()
+        for e in os.scandir(os.path.join(self.path, 'running')):
+            try:
+                stale = e.stat().st_mtime < now - self.lease
+            except FileNotFoundError:
+                continue
+            if not stale or not e.name.endswith('.json') or \
+                    e.name.startswith('.'):
+                continue
+
+            # only the worker that renames the job first requeues it
+            tmp = os.path.join(self.path, 'running',
+                               '.{}.stale'.format(uuid.uuid4().hex))
+            try:
+                os.rename(e.path, tmp)
+            except FileNotFoundError:
+                continue
+            with open(tmp) as f:
+                job = json.load(f)
+            job['attempts'] += 1
+            job['error'] = 'Lease expired'
+            self._write('failed' if job['attempts'] >= self.max_attempts
+                        else 'pending', job)
+            os.unlink(tmp)
+
+    def claim(self, worker):
+        self._requeue_stale()
+        for name in self._names('pending'):
+            if not self._move(name, 'pending', 'running'):
+                continue        # another worker was first
+            try:
+                # the lease starts now, not when the job was submitted
+                os.utime(self._file('running', name))
+                spec = self._read('running', name)['spec']
+            except FileNotFoundError:
+                continue        # taken for stale in the meantime
+            self._claimed[spec['id']] = name
+            return spec
+        return None
+
+    def renew(self, job_id, worker):
+        name = self._find('running', job_id)
+        try:
+            if name is not None:
+                os.utime(self._file('running', name))
+        except FileNotFoundError:
+            pass
+
+    def complete(self, job_id, worker):
+        name = self._find('running', job_id)
+        self._claimed.pop(job_id, None)
+        if name is not None:
+            self._move(name, 'running', 'done')
+
+    def fail(self, job_id, worker, error, retry=True):
+        name = self._find('running', job_id)
+        self._claimed.pop(job_id, None)
+        if name is None:
+            return
+        try:
+            job = self._read('running', name)
+        except FileNotFoundError:
+            return
+        job['attempts'] += 1
+        job['error'] = error
+        self._write('running', job)
+        target = 'failed' if job['attempts'] >= self.max_attempts or \
+            not retry else 'pending'
+        self._move(name, 'running', target)
+
+    def counts(self):
+        return {state: len(self._names(state)) for state in self.states}
+
+    def errors(self):
+        return {self._job_id(name): self._read('failed', name).get('error')
+                for name in self._names('failed')}
+
+
+def result_path(results, job_id):
+    return os.path.join(results, job_id)
+
+
+def work(queue, results, worker=None, max_jobs=None, wait=0.0,
+         backend=None, history=None):
+    """Run jobs from a queue until it is empty.
+
+    :param queue:
+        `SQLiteQueue` or `DirectoryQueue`.
+
+    :param results:
+        Directory in which the results are written, one subdirectory
+        per job.
+
+    :param worker:
+        Name of this worker. Defaults to the host name and process ID.
+
+    :param max_jobs:
+        Stop after this many jobs.
+
+    :param wait:
+        If positive, wait this many seconds for new jobs when the queue
+        is empty, instead of stopping. Jobs held by other workers may
+        still come back when their lease expires.
+
+    :param backend:
+        Backend to run the jobs with. Defaults to `get_backend` for the
+        program of the job.
+
+    :param history:
+        Timing history file of a `CostModel`, to which the run times of
+        ELSCATA jobs are appended.
+
+    :return:
+        Number of jobs run.
+    """
+    worker = worker or '{}:{}'.format(socket.gethostname(), os.getpid())
+    os.makedirs(results, exist_ok=True)
+    cost_model = CostModel(history) if history is not None else None
+    n = 0
+
+    while max_jobs is None or n < max_jobs:
+        spec = queue.claim(worker)
+        if spec is None:
+            if wait > 0 and sum(queue.counts()[s]
+                                for s in ('pending', 'running')) > 0:
+                time.sleep(wait)
+                continue
+            break
+
+        done = threading.Event()
+
+        def renew_lease(job_id=spec['id']):
+            while not done.wait(queue.lease / 3):
+                queue.renew(job_id, worker)
+
+        heartbeat = threading.Thread(target=renew_lease, daemon=True)
+        heartbeat.start()
+        try:
+            path = result_path(results, spec['id'])
+            # a previous worker may have died after writing the result
+            if not os.path.exists(path):
+                b = backend or get_backend(program=spec['program'])
+                with collect() as stats:
+                    result = b.run(spec['input_deck'], spec['outputs'])
+                result.stats = stats
+                save_result(result, path)
+                if cost_model is not None and spec['program'] == 'elscata':
+                    cost_model.observe(
+                        settings_from_json(spec['settings']), result)
+        except Exception as error:
+            # a bad deck fails the same way every time
+            queue.fail(spec['id'], worker,
+                       '{}: {}'.format(type(error).__name__, error),
+                       retry=isinstance(error, ElsepaTimeout) or
+                       is_transient(error))
+        else:
+            queue.complete(spec['id'], worker)
+        finally:
+            done.set()
+            heartbeat.join()
+        n += 1
+
+    return n
+
+
+def _work_process(queue, results, kwargs):
+    work(queue, results, **kwargs)
+
+
+class Sweep(object):
+    """Driver of a distributed sweep.
+
+    .. py::attribute:: queue
+        (SQLiteQueue or DirectoryQueue) The job queue.
+
+    .. py::attribute:: results
+        (string) Directory holding the results.
+    """
+    def __init__(self, queue, results):
+        self.queue = queue
+        self.results = results
+        os.makedirs(results, exist_ok=True)
+
+    def submit(self, settings_iter, program='elscata', outputs=None,
+               cost_model=None):
+        """Put jobs in the queue. Jobs that were submitted before are not
+        added again, so a sweep can be resumed by submitting it anew.
+
+        :param cost_model:
+            Optional `CostModel`. If given, the jobs are queued longest
+            first, see `elsepa.planner`.
+
+        :return:
+            List of job IDs, in the order of `settings_iter`.
+        """
+        settings_list = list(settings_iter)
+        specs = [job_spec(s, program, outputs) for s in settings_list]
+        if cost_model is not None:
+            order = [i for i, _ in plan_jobs(settings_list, cost_model)]
+            self.queue.submit([specs[i] for i in order])
+        else:
+            self.queue.submit(specs)
+        return [s['id'] for s in specs]
+
+    def start_workers(self, n, **kwargs):
+        """Start `n` worker processes on this machine.
+
+        :param kwargs:
+            Passed on to `work`.
+
+        :return:
+            List of `multiprocessing.Process` objects.
+        """
+        processes = [multiprocessing.Process(
+            target=_work_process, args=(self.queue, self.results, kwargs))
+            for _ in range(n)]
+        for p in processes:
+            p.start()
+        return processes
+
+    def wait(self, poll=5.0, report=None):
+        """Wait until all jobs are done or failed.
+
+        :param report:
+            Function called with the counts of jobs in each state (see
+            `progress`) every `poll` seconds. Defaults to printing them
+            to standard error.
+
+        :return:
+            The final counts.
+        """
+        if report is None:
+            def report(counts):
+                print(format_progress(counts), file=sys.stderr)
+
+        while True:
+            counts = self.progress()
+            report(counts)
+            if counts['pending'] == 0 and counts['running'] == 0:
+                return counts
+            time.sleep(poll)
+
+    def progress(self):
+        """Number of jobs in each state: `pending`, `running`, `done` and
+        `failed`."""
+        return self.queue.counts()
+
+    def result(self, job_id):
+        """Load the result of a finished job, or `None` if it is not
+        available."""
+        path = result_path(self.results, job_id)
+        if not os.path.exists(path):
+            return None
+        return load_result(path)
+
+    def results_for(self, job_ids):
+        """Generator of `(job ID, result)` pairs, with `None` for jobs
+        that have not finished."""
+        for job_id in job_ids:
+            yield job_id, self.result(job_id)
+
+
+def format_progress(counts):
+    total = sum(counts.values())
+    return '{done}/{total} done, {running} running, {pending} pending, ' \
+           '{failed} failed'.format(total=total, **counts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m elsepa.sweep',
+        description='Work on a distributed ELSEPA sweep.')
+    commands = parser.add_subparsers(dest='command')
+
+    worker = commands.add_parser('worker', help='run jobs from a queue')
+    worker.add_argument('queue', help='SQLite database or queue directory')
+    worker.add_argument('results', help='directory to write results to')
+    worker.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of worker processes (default: 1)')
+    worker.add_argument('--wait', type=float, default=0.0,
+                        help='poll for new jobs instead of stopping')
+    worker.add_argument('--history',
+                        help='file to record run times in, for the cost '
+                             'model of elsepa.planner')
+
+    status = commands.add_parser('status', help='show progress')
+    status.add_argument('queue', help='SQLite database or queue directory')
+
+    args = parser.parse_args(argv)
+    if args.command == 'worker':
+        sweep = Sweep(open_queue(args.queue), args.results)
+        for p in sweep.start_workers(args.jobs, wait=args.wait,
+                                     history=args.history):
+            p.join()
+    elif args.command == 'status':
+        print(format_progress(open_queue(args.queue).counts()))
+    else:
+        parser.print_help()
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+from elsepa.backend import NativeBackend
+from cslib import (units, DataFrame)
+
+import numpy as np
+import os
+import pytest
+import stat
+import sys
+
+
+tcstable_text = """ #  Total cross sections (fake ELSCATA)
+ #
+ #  Energy     Total cs      1st tcs      2nd tcs
+ #   (eV)      (cm**2)       (cm**2)      (cm**2)
+ #------------------------------------------------
+  1.0000E+01  1.0000E-15  2.0000E-16  3.0000E-16
+  1.0000E+02  4.0000E-16  5.0000E-17  6.0000E-17
+"""
+
+# Fake ELSCATA: echoes its input and writes a fixed `tcstable`.
+fake_elscata_script = """cat > echo.txt
+cat > tcstable.dat << EOF
+{0}EOF
+cp tcstable.dat scfield.dat
+""".format(tcstable_text)
+
+# Fake ELSCATA in Python: writes a dcs file per energy and a tcstable, and
+# logs the energies it was asked for.
+fake_elscata_python = """#!{python}
+import sys
+import numpy as np
+
+energies = [float(l.split()[1]) for l in sys.stdin if l.startswith('EV')]
+with open({log!r}, 'a') as f:
+    f.write(' '.join(str(e) for e in energies) + '\\n')
+
+theta = np.linspace(0, 180, 31)
+for e in energies:
+    with open('dcs_' + '{{:.3e}}'.format(e).replace('.', 'p')
+              .replace('+', '') + '.dat', 'w') as f:
+        f.write(' #  DCS\\n #\\n #  Angle       DCS\\n'
+                ' #  (deg)    (cm**2/sr)\\n #-----------\\n')
+        for t in theta:
+            f.write('  {{:.6e}}  {{:.6e}}\\n'.format(
+                t, 1e-16 / e * np.exp(-t / 30)))
+
+with open('tcstable.dat', 'w') as f:
+    f.write(' #  TCS\\n #\\n #  Energy     Total cs\\n'
+            ' #   (eV)      (cm**2)\\n #-----------\\n')
+    for e in energies:
+        f.write('  {{:.6e}}  {{:.6e}}\\n'.format(e, 1e-14 / e))
+"""
+
+
+def write_executable(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+    return path
+
+
+@pytest.fixture
+def tcstable():
+    """Contents of the `tcstable.dat` written by the fake ELSCATA."""
+    return tcstable_text
+
+
+@pytest.fixture
+def make_executable(tmpdir):
+    """Factory writing a fake `elscata` shell script in `tmpdir`. Without
+    arguments, the script writes `tcstable` and `scfield`."""
+    def make(script=fake_elscata_script, name='elscata'):
+        return write_executable(os.path.join(str(tmpdir), name),
+                                '#!/bin/sh\n' + script)
+    return make
+
+
+@pytest.fixture
+def make_backend(tmpdir):
+    """Factory of a `NativeBackend` running a fake ELSCATA that writes a
+    `dcs_*` file per energy and a `tcstable`, and appends the energies of
+    every run to the file `log` in `tmpdir`."""
+    def make(**kwargs):
+        path = write_executable(
+            os.path.join(str(tmpdir), 'elscata'),
+            fake_elscata_python.format(
+                python=sys.executable,
+                log=os.path.join(str(tmpdir), 'log')))
+        return NativeBackend(path, **kwargs)
+    return make
+
+
+@pytest.fixture
+def make_result():
+    """Factory of a result with a random `tcstable` of `n` rows."""
+    def make(n):
+        data = np.zeros(n, dtype=[('E', float), ('sigma', float)])
+        data['E'] = np.linspace(10, 1000, n)
+        data['sigma'] = np.random.random(n)
+        return {'tcstable': DataFrame(
+            data, units=[units.eV, units.cm**2],
+            comments=['test', 'E sigma'])}
+    return make
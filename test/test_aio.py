@@ -0,0 +1,85 @@
+from elsepa.aio import (AsyncDockerContainer, elscata_async)
+from elsepa.backend import set_default_backend
+from elsepa.cache import ResultCache
+from cslib.settings import Settings
+from cslib import units
+
+import asyncio
+import numpy as np
+import os
+import threading
+
+
+class FakeContainer(object):
+    """Container whose creation blocks until `created` is set."""
+    entered = None
+    created = None
+    removed = []
+
+    def __init__(self, image, working_dir=None):
+        FakeContainer.entered.set()
+        FakeContainer.created.wait(5)
+
+    def remove(self, force=False):
+        FakeContainer.removed.append(threading.current_thread())
+
+
+def test_cancel_create(monkeypatch):
+    monkeypatch.setattr('elsepa.aio.DockerContainer', FakeContainer)
+    FakeContainer.entered = threading.Event()
+    FakeContainer.created = threading.Event()
+    FakeContainer.removed = []
+
+    async def main():
+        container = AsyncDockerContainer('elsepa')
+        task = asyncio.ensure_future(container.create())
+        while not FakeContainer.entered.is_set():
+            await asyncio.sleep(0.01)
+
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        assert container.container is None
+
+        # the container is removed once it exists, off the loop thread
+        FakeContainer.created.set()
+        for _ in range(500):
+            if FakeContainer.removed:
+                break
+            await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert len(FakeContainer.removed) == 1
+    assert FakeContainer.removed[0] is not threading.main_thread()
+
+
+def test_elscata_async(tmpdir, make_backend):
+    backend = make_backend()
+    cache = ResultCache(str(tmpdir.join('cache')))
+    settings = Settings(IZ=6, EV=np.array([10, 100]) * units.eV)
+
+    a = asyncio.run(elscata_async(settings, backend=backend, cache=cache))
+    b = asyncio.run(elscata_async(settings, backend=backend, cache=cache))
+
+    assert 'NELEC' not in settings
+    assert not a.stats.cached and b.stats.cached
+    assert np.asarray(a['tcstable']).tolist() == \
+        np.asarray(b['tcstable']).tolist()
+
+    with open(os.path.join(str(tmpdir), 'log')) as f:
+        assert f.read() == '10.0 100.0\n'
+
+
+def test_elscata_async_default_backend(tmpdir, make_backend):
+    set_default_backend(make_backend())
+    try:
+        settings = Settings(IZ=6, EV=np.array([10]) * units.eV)
+        result = asyncio.run(elscata_async(settings))
+    finally:
+        set_default_backend(None)
+
+    assert 'execute' in result.stats.stages
+    with open(os.path.join(str(tmpdir), 'log')) as f:
+        assert f.read() == '10.0\n'
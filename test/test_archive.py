@@ -0,0 +1,30 @@
+from elsepa.executable import (Archive, ChunkReader)
+
+import io
+import tarfile
+
+
+def test_archive_roundtrip():
+    buffer = Archive('w') \
+        .add_text_file('a.txt', "alpha\n") \
+        .add_text_file('b.txt', "bravo\n") \
+        .close().buffer
+
+    archive = Archive('r', buffer)
+    assert [info.name for info in archive] == ['a.txt', 'b.txt']
+    assert archive.get_text_file('b.txt') == "bravo\n"
+
+
+def test_chunk_reader_stream():
+    buffer = Archive('w') \
+        .add_text_file('a.txt', "alpha\n" * 1000) \
+        .add_text_file('b.txt', "bravo\n") \
+        .close().buffer
+    chunks = (buffer[i:i+100] for i in range(0, len(buffer), 100))
+
+    f = io.BufferedReader(ChunkReader(chunks))
+    with tarfile.open(fileobj=f, mode='r|') as tar:
+        contents = {info.name: tar.extractfile(info).read().decode()
+                    for info in tar}
+
+    assert contents == {'a.txt': "alpha\n" * 1000, 'b.txt': "bravo\n"}
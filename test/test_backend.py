@@ -0,0 +1,82 @@
+from elsepa.backend import (
+    NativeBackend, DockerBackend, collect_outputs_command, get_backend,
+    set_default_backend)
+from elsepa.cache import ResultCache
+from elsepa.generate_input import canonical_elscata_input
+from elsepa.run import elscata
+from cslib.settings import Settings
+from cslib import units
+
+import numpy as np
+
+
+def test_native_backend(make_executable):
+    backend = NativeBackend(make_executable())
+    result = backend.run("IZ     80\n")
+
+    assert set(result) == {'tcstable', 'scfield'}
+    data = np.asarray(result['tcstable'])
+    assert data.dtype.names == ('Energy', 'Total cs', '1st tcs', '2nd tcs')
+    assert list(data['Energy']) == [10.0, 100.0]
+    assert backend.identity().startswith('sha256:')
+
+
+def test_native_backend_outputs(make_executable):
+    backend = NativeBackend(make_executable())
+    result = backend.run("IZ     80\n", outputs=['tcs*'])
+    assert set(result) == {'tcstable'}
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.inspected = 0
+
+    def inspect_image(self, name):
+        self.inspected += 1
+        return {'Id': 'sha256:' + name}
+
+
+def test_docker_identity(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr('elsepa.executable._client', client)
+
+    for _ in range(3):
+        backend = DockerBackend('elsepa')
+        assert backend.identity() == 'sha256:elsepa'
+        assert backend.identity() == 'sha256:elsepa'
+    assert client.inspected == 1
+
+
+def test_collect_outputs_command():
+    assert collect_outputs_command([]) == collect_outputs_command(None)
+    assert '-name tcstable.dat' in collect_outputs_command(['tcstable'])
+
+
+def test_default_backend(make_executable):
+    elscata = NativeBackend(make_executable())
+    elscatm = NativeBackend(make_executable(name='elscatm'),
+                            program='elscatm')
+    set_default_backend(elscata)
+    set_default_backend(elscatm, program='elscatm')
+    try:
+        assert get_backend() is elscata
+        assert get_backend(program='elscatm') is elscatm
+    finally:
+        set_default_backend(None)
+        set_default_backend(None, program='elscatm')
+    assert isinstance(get_backend(program='elscatm'), DockerBackend)
+
+
+def test_cache_hits_inspect_once(monkeypatch, tmpdir, make_result):
+    client = FakeClient()
+    monkeypatch.setattr('elsepa.executable._client', client)
+    monkeypatch.delenv('ELSEPA_BACKEND', raising=False)
+
+    settings = Settings(IZ=80, EV=np.array([10, 100]) * units.eV)
+    cache = ResultCache(str(tmpdir))
+    cache.put(cache.key(canonical_elscata_input(settings), 'sha256:elsepa'),
+              make_result(2))
+
+    for _ in range(3):
+        assert elscata(settings, cache=cache).stats.cached
+    assert client.inspected == 1
@@ -0,0 +1,89 @@
+from elsepa.batch import elscata_many
+from elsepa.backend import NativeBackend
+from elsepa.errors import ElsepaError
+from elsepa.instrument import BatchStats
+from elsepa.planner import CostModel
+from cslib.settings import Settings
+from cslib import units
+
+import numpy as np
+import pytest
+
+
+# IZ 1 is slow, IZ 13 fails
+fake_elscata = """cat > echo.txt
+if grep -q '^IZ  *13 ' echo.txt; then echo 'bad atom'; exit 1; fi
+if grep -q '^IZ  *1 ' echo.txt; then sleep 0.5; fi
+cat > tcstable.dat << EOF
+{0}EOF
+"""
+
+
+def settings(iz):
+    return Settings(IZ=iz, EV=np.array([100]) * units.eV)
+
+
+def test_batch_errors(make_executable, tcstable):
+    backend = NativeBackend(make_executable(fake_elscata.format(tcstable)))
+    stats = BatchStats()
+    jobs = [settings(6), settings(13), Settings(IZ=8), settings(8)]
+
+    results = list(elscata_many(jobs, workers=2, backend=backend,
+                                stats=stats))
+    assert [r.index for r in results] == [0, 1, 2, 3]
+    assert [r.settings for r in results] == jobs
+
+    assert results[0].error is None and 'tcstable' in results[0].result
+    assert isinstance(results[1].error, ElsepaError)
+    assert results[1].error.output == 'bad atom\n'
+    assert results[2].error is not None     # no energies
+    assert results[2].result is None
+    assert results[3].error is None
+    assert stats.errors == 1 and len(stats.runs) == 2
+
+
+def test_batch_unordered(make_executable, tcstable):
+    backend = NativeBackend(make_executable(fake_elscata.format(tcstable)))
+    jobs = [settings(1), settings(6), settings(8)]
+
+    results = list(elscata_many(jobs, workers=2, ordered=False,
+                                backend=backend))
+    assert sorted(r.index for r in results) == [0, 1, 2]
+    assert results[-1].index == 0
+
+
+def test_batch_backpressure(make_backend):
+    backend = make_backend()
+    consumed = []
+
+    def generate():
+        for iz in range(1, 11):
+            consumed.append(iz)
+            yield settings(iz)
+
+    for r in elscata_many(generate(), workers=1, max_pending=2,
+                          backend=backend):
+        assert r.error is None
+        assert len(consumed) <= r.index + 2
+    assert len(consumed) == 10
+
+
+def test_batch_cost_model_errors(make_executable, tcstable):
+    backend = NativeBackend(make_executable(fake_elscata.format(tcstable)))
+    with pytest.raises(ValueError):
+        elscata_many([settings(6)], backend=backend, program='elscatm',
+                     cost_model=CostModel())
+
+    class BrokenModel(CostModel):
+        def observe(self, settings, result):
+            if settings['IZ'] == 6:
+                raise RuntimeError('cannot record')
+
+    # an error in the bookkeeping of one job does not stop the batch
+    stats = BatchStats()
+    results = sorted(elscata_many(
+        [settings(6), settings(8)], workers=2, backend=backend, stats=stats,
+        cost_model=BrokenModel()), key=lambda r: r.index)
+    assert isinstance(results[0].error, RuntimeError)
+    assert results[1].error is None
+    assert len(stats.runs) == 2
@@ -0,0 +1,95 @@
+from elsepa.backend import (run_elscata_batch, NativeBackend)
+from elsepa.errors import (ElsepaError, ElsepaTimeout)
+from elsepa.instrument import collect
+
+import io
+import os
+import subprocess
+import tarfile
+
+import numpy as np
+
+
+fake_elscata = """cat > echo.txt
+if grep -q FAIL echo.txt; then echo "it failed"; exit 3; fi
+if grep -q SLEEP echo.txt; then sleep 10; fi
+if grep -q NOTHING echo.txt; then exit 0; fi
+{ printf ' #  TCS\\n #\\n #  Energy     Total cs\\n #   (eV)      (cm**2)\\n'
+  printf ' #-----------\\n  %s  1.0E-16\\n' $(head -n 1 echo.txt)
+} > tcstable.dat
+echo dcs > dcs_1p000e02.dat
+"""
+
+
+class LocalDirectory(object):
+    """Stand-in for a Docker container, running commands in a local
+    directory, with `/opt/elsepa` replaced by `bin`."""
+    def __init__(self, path, bin):
+        self.path = path
+        self.bin = bin
+        self.calls = []
+
+    def put_archive(self, archive, path='.'):
+        self.calls.append('put_archive')
+        with tarfile.open(fileobj=io.BytesIO(archive.buffer)) as tar:
+            tar.extractall(os.path.join(self.path, path))
+
+    def sh(self, *cmds, check=False):
+        self.calls.append('sh')
+        cmd = ' && '.join(cmds).replace('/opt/elsepa', self.bin)
+        p = subprocess.run(['sh', '-c', cmd], cwd=self.path,
+                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        if check and p.returncode != 0:
+            raise subprocess.CalledProcessError(p.returncode, cmd, p.stdout)
+        return p.stdout
+
+    def stream_archive(self, path):
+        self.calls.append('stream_archive')
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w') as tar:
+            tar.add(os.path.join(self.path, path), arcname=path)
+        buf.seek(0)
+        with tarfile.open(fileobj=buf) as tar:
+            for info in tar:
+                yield info, tar.extractfile(info) if info.isfile() else None
+
+
+def make_directory(tmpdir, make_executable):
+    path = make_executable(fake_elscata)
+    return LocalDirectory(str(tmpdir.mkdir('work')), str(tmpdir)), path
+
+
+def test_run_batch(tmpdir, make_executable):
+    elsepa, _ = make_directory(tmpdir, make_executable)
+    decks = ['10\n', 'FAIL\n', '20\n', 'NOTHING\n', '30\n']
+
+    with collect() as stats:
+        results = run_elscata_batch(elsepa, decks, parallel=2)
+    assert elsepa.calls == ['put_archive', 'sh', 'stream_archive']
+    assert stats.bytes_received > 0
+
+    energies = [np.asarray(r['tcstable'])['Energy'][0]
+                for r, e in results if e is None]
+    assert energies == [10, 20, 30]
+    assert set(results[0][0]) == {'tcstable', 'dcs_1p000e02'}
+
+    error = results[1][1]
+    assert results[1][0] is None and isinstance(error, ElsepaError)
+    assert error.exit_code == 3 and error.output == 'it failed\n'
+    assert error.input_deck == 'FAIL\n'
+    assert results[3][1].exit_code == 1
+
+
+def test_run_batch_outputs(tmpdir, make_executable):
+    elsepa, _ = make_directory(tmpdir, make_executable)
+    results = run_elscata_batch(elsepa, ['10\n', 'SLEEP\n'],
+                                outputs=['tcs*'], timeout=0.5)
+    assert set(results[0][0]) == {'tcstable'}
+    assert isinstance(results[1][1], ElsepaTimeout)
+
+
+def test_native_run_batch(tmpdir, make_executable):
+    _, path = make_directory(tmpdir, make_executable)
+    results = NativeBackend(path).run_batch(['10\n', 'FAIL\n'], parallel=2)
+    assert np.asarray(results[0][0]['tcstable'])['Energy'][0] == 10
+    assert results[1][1].exit_code == 3
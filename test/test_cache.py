@@ -0,0 +1,43 @@
+from elsepa.cache import ResultCache
+
+import numpy as np
+import os
+
+
+def test_cache_roundtrip(tmpdir, make_result):
+    cache = ResultCache(str(tmpdir))
+    key = cache.key("IZ 80\n", "sha256:1234")
+    assert cache.get(key) is None
+
+    result = make_result(100)
+    cache.put(key, result)
+    assert key in cache
+
+    cached = cache.get(key)
+    assert np.all(np.asarray(cached['tcstable']) ==
+                  np.asarray(result['tcstable']))
+    assert cached['tcstable'].comments == ['test', 'E sigma']
+
+
+def test_cache_key():
+    assert ResultCache.key("a", "x") != ResultCache.key("a", "y")
+    assert ResultCache.key("a", "x") != ResultCache.key("b", "x")
+
+
+def test_cache_eviction(tmpdir, make_result):
+    cache = ResultCache(str(tmpdir), max_size=None)
+    for i in range(4):
+        key = cache.key(str(i), "image")
+        cache.put(key, make_result(1000))
+        t = 1000000 + i
+        os.utime(cache._filename(key), (t, t))
+
+    # reading entry 0 makes it the most recently used
+    cache.get(cache.key("0", "image"))
+    sizes = [e.stat().st_size for e in os.scandir(str(tmpdir))]
+    cache.max_size = sum(sizes) - 1
+    cache.evict()
+
+    assert cache.key("0", "image") in cache
+    assert cache.key("1", "image") not in cache
+    assert cache.key("2", "image") in cache
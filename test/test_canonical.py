@@ -0,0 +1,33 @@
+from elsepa.generate_input import canonical_elscata_input
+from elsepa.batch import elscata_many
+from cslib.settings import Settings
+from cslib import units
+
+import numpy as np
+import os
+
+
+def test_canonical_deck():
+    a = Settings(IZ=80, EV=np.array([100, 1000]) * units.eV)
+    b = Settings(IZ=80, NELEC=80, MNUCL=3, MCPOL=0,
+                 EV=np.array([0.1, 1]) * units.keV)
+    c = Settings(IZ=80, NELEC=78, EV=np.array([100, 1000]) * units.eV)
+
+    assert canonical_elscata_input(a) == canonical_elscata_input(b)
+    assert canonical_elscata_input(a) != canonical_elscata_input(c)
+    assert 'NELEC' not in a
+
+
+def test_batch_dedup(tmpdir, make_backend):
+    backend = make_backend()
+    settings = [Settings(IZ=80, EV=np.array([100]) * units.eV),
+                Settings(IZ=80, EV=np.array([0.1]) * units.keV),
+                Settings(IZ=80, NELEC=80, EV=np.array([100]) * units.eV)]
+
+    results = list(elscata_many(settings, backend=backend))
+    assert [r.index for r in results] == [0, 1, 2]
+    assert all(r.error is None for r in results)
+    assert results[0].result is results[2].result
+
+    with open(os.path.join(str(tmpdir), 'log')) as f:
+        assert f.read() == '100.0\n'
@@ -0,0 +1,46 @@
+from elsepa.generate_input import (
+    generate_elscata_input, Elscata_compiled)
+from cslib.settings import Settings
+from cslib import units
+
+import numpy as np
+import pytest
+
+
+def both(settings):
+    a = generate_elscata_input(Settings(settings), compiled=True)
+    b = generate_elscata_input(Settings(settings), compiled=False)
+    assert a == b
+    return a
+
+
+def test_compiled_identical():
+    cases = [
+        dict(IZ=80, EV=np.array([100]) * units.eV),
+        dict(IZ=79, NELEC=78, MUFFIN=1, RMUF=1.5e-8 * units.cm,
+             EV=np.logspace(1, 5, 40) * units.eV),
+        dict(IZ=6, MCPOL=2, VPOLA=1.76e-24 * units.cm**3, VPOLB=2.5,
+             MABS=1, VABSA=1.5, VABSD=2.0 * units.eV, IHEF=0,
+             EV=np.array([0.05, 1, 30]) * units.keV),
+        dict(IZ=1, IELEC=1, MEXCH=0, MELEC=3, MNUCL=1, IHEF=2.5,
+             EV=np.array([10, 20]) * units.eV),
+    ]
+    for s in cases:
+        assert Elscata_compiled.check(Settings(s))
+        both(s)
+
+
+def test_compiled_fallback():
+    # Values the flat checks do not know about go through `check_settings`
+    s = dict(IZ=80, VABSA=np.float64(1.5), EV=np.array([100]) * units.eV)
+    assert not Elscata_compiled.check(Settings(s))
+    assert 'VABSA   1.5 ' in both(s)
+
+    bad = Settings(IZ=80, MNUCL=7, EV=np.array([100]) * units.eV)
+    assert not Elscata_compiled.check(bad)
+    with pytest.raises(Exception):
+        generate_elscata_input(bad)
+
+    assert not Elscata_compiled.check(Settings(IZ=80))
+    assert not Elscata_compiled.check(
+        Settings(IZ=80, EV=np.array([100]) * units.m))
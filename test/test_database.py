@@ -0,0 +1,75 @@
+from elsepa.database import CrossSectionDatabase
+from cslib.settings import Settings
+from cslib import units
+
+import numpy as np
+import os
+import pytest
+
+
+def test_database_fill(tmpdir, make_backend):
+    backend = make_backend()
+    db = CrossSectionDatabase(os.path.join(str(tmpdir), 'db'), Settings(),
+                              dcs_column='DCS')
+
+    db.fill([80], np.array([10, 100]) * units.eV, backend=backend)
+    db.fill([80], np.array([10, 100, 1000]) * units.eV, backend=backend)
+
+    with open(os.path.join(str(tmpdir), 'log')) as f:
+        assert f.read().split('\n') == ['10.0 100.0', '1000.0', '']
+
+    assert db.elements() == [80]
+    assert list(db.energies(80)) == [10, 100, 1000]
+
+    # reopen from disk
+    db = CrossSectionDatabase(os.path.join(str(tmpdir), 'db'))
+    assert np.allclose(db.tcs(80, [10, 31.6227766, 1000]),
+                       [1e-15, 1e-14 / 31.6227766, 1e-17])
+    assert np.allclose(db.dcs(80, 100, [0, 30, 45]),
+                       1e-18 * np.exp(-np.array([0, 30, 45]) / 30))
+
+
+def test_database_sampling(tmpdir, make_backend):
+    backend = make_backend()
+    db = CrossSectionDatabase(str(tmpdir.join('db')), Settings(),
+                              dcs_column='DCS')
+    db.fill([1], np.array([10, 100]) * units.eV, backend=backend)
+
+    table = db.icdf_table(1, n=101)
+    assert table.shape == (2, 101)
+    assert table[0, 0] == 0 and table[0, -1] == 180
+    assert np.all(np.diff(table, axis=1) >= 0)
+
+    angles = db.sample_angle(1, np.full(1000, 30.0), np.random.random(1000))
+    assert np.all((angles >= 0) & (angles <= 180))
+
+
+def test_database_settings(tmpdir, make_backend):
+    path = str(tmpdir.join('db'))
+    with pytest.raises(ValueError):
+        CrossSectionDatabase(path)
+
+    db = CrossSectionDatabase(path, Settings(MCPOL=2, IZ=80),
+                              dcs_column='DCS')
+    assert 'IZ' not in db.settings
+
+    # settings are read back from disk, and must match when given
+    assert CrossSectionDatabase(path).settings['MCPOL'] == 2
+    CrossSectionDatabase(path, Settings(MCPOL=2))
+    with pytest.raises(ValueError):
+        CrossSectionDatabase(path, Settings(MCPOL=1))
+
+    # a database is filled by a single build of ELSCATA
+    db.fill([1], np.array([10]) * units.eV, backend=make_backend())
+    other = make_backend()
+    other._identity = 'sha256:other'
+    with pytest.raises(ValueError):
+        CrossSectionDatabase(path).fill(
+            [1], np.array([100]) * units.eV, backend=other)
+
+
+def test_database_outputs(tmpdir, make_backend):
+    db = CrossSectionDatabase(str(tmpdir.join('db')), Settings())
+    with pytest.raises(TypeError):
+        db.fill([1], np.array([10]) * units.eV, backend=make_backend(),
+                outputs=['tcstable'])
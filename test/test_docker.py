@@ -1,4 +1,12 @@
 from elsepa.executable import (DockerContainer, Archive)
+from elsepa.pool import (ContainerPool)
+from elsepa.aio import (AsyncDockerContainer)
+from elsepa.generate_input import generate_elscatm_input
+from cslib.settings import Settings
+from cslib import units
+
+import asyncio
+import numpy as np
 
 
 awk_program = """# usage: awk -f rot13.awk
@@ -49,3 +57,63 @@ def test_docker_rot13():
         m = c.get_archive('output.txt').get_text_file('output.txt')
 
         assert m.strip() == decoded
+
+
+def test_container_pool():
+    with ContainerPool('busybox', size=2, working_dir=None) as pool:
+        for i in range(4):
+            with pool.job() as c:
+                c.put_archive(
+                    Archive('w')
+                    .add_text_file('input.txt', message)
+                    .close())
+                c.sh('ls > output.txt')
+
+                m = c.get_archive('output.txt').get_text_file('output.txt')
+                assert m.split() == ['input.txt', 'output.txt']
+
+        assert len(pool._containers) == 2
+
+
+def test_docker_stream_archive():
+    with DockerContainer('busybox') as c:
+        c.put_archive(
+            Archive('w')
+            .add_text_file('out/a.txt', "alpha")
+            .add_text_file('out/b.txt', "bravo")
+            .close())
+
+        contents = {info.name: f.read().decode()
+                    for info, f in c.stream_archive('out') if f}
+
+        assert contents == {'out/a.txt': "alpha", 'out/b.txt': "bravo"}
+
+
+def test_async_docker_container():
+    async def hello():
+        async with AsyncDockerContainer('busybox') as c:
+            return await c.run(['/bin/sh', '-c', "echo 'Hello, World!'"])
+
+    m = asyncio.run(hello())
+    assert m.decode().strip() == "Hello, World!"
+
+
+def test_elscatm_deck_layout():
+    """The atoms in an ELSCATM deck are written like those of the `h2o.in`
+    example that comes with ELSEPA."""
+    with DockerContainer('elsepa', working_dir='/opt/elsepa') as c:
+        example = c.get_archive('/opt/elsepa/h2o.in') \
+            .get_text_file('h2o.in')
+
+    atoms = [l.split() for l in example.splitlines() if l.startswith('IZ')]
+    water = [(int(a[1]), np.array([float(x) for x in a[2:5]]) * units.cm)
+             for a in atoms]
+    deck = generate_elscatm_input(
+        Settings(ATOMS=water, EV=np.array([100]) * units.eV))
+
+    lines = [l.split() for l in deck.splitlines() if l.startswith('IZ')]
+    assert len(lines) == len(atoms)
+    for ours, theirs in zip(lines, atoms):
+        assert ours[1] == theirs[1]
+        assert np.allclose([float(x) for x in ours[2:5]],
+                           [float(x) for x in theirs[2:5]], rtol=1e-4)
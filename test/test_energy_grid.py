@@ -0,0 +1,37 @@
+from elsepa.energy_grid import (split_energies, merge_results)
+from cslib.settings import Settings
+from cslib import (units, DataFrame)
+
+import numpy as np
+
+
+def tcstable(energies):
+    data = np.zeros(len(energies), dtype=[('E', float), ('sigma', float)])
+    data['E'] = energies
+    data['sigma'] = 1 / data['E']
+    return DataFrame(data, units=[units.eV, units.cm**2],
+                     comments=['E sigma'])
+
+
+def test_split_energies():
+    s = Settings(IZ=80, EV=np.arange(1, 11) * units.eV)
+    parts = split_energies(s, 3)
+    assert len(parts) == 3
+    assert [len(p['EV']) for p in parts] == [4, 3, 3]
+    assert all(p['IZ'] == 80 for p in parts)
+    assert np.all(np.concatenate([p['EV'].magnitude for p in parts]) ==
+                  s['EV'].magnitude)
+
+    assert len(split_energies(s, 20)) == 10
+
+
+def test_merge_results():
+    a = {'dcs_1p000e01': 1, 'dcs_2p000e01': 2,
+         'tcstable': tcstable([10, 20]), 'scfield': 'a'}
+    b = {'dcs_3p000e01': 3, 'tcstable': tcstable([30]), 'scfield': 'b'}
+
+    merged = merge_results([a, b])
+    assert set(merged) == {'dcs_1p000e01', 'dcs_2p000e01', 'dcs_3p000e01',
+                           'tcstable', 'scfield'}
+    assert list(np.asarray(merged['tcstable'])['E']) == [10, 20, 30]
+    assert merged['scfield'] == 'b'
@@ -0,0 +1,58 @@
+from elsepa.backend import NativeBackend
+from elsepa.errors import (ElsepaError, ElsepaTimeout, RetryPolicy)
+
+import pytest
+
+
+def test_exit_code(make_executable):
+    backend = NativeBackend(make_executable(
+        "echo 'working'\necho 'NELEC   -1' >&2\nexit 2\n"))
+
+    with pytest.raises(ElsepaError) as info:
+        backend.run("IZ     80\n")
+
+    assert info.value.exit_code == 2
+    assert info.value.input_deck == "IZ     80\n"
+    assert info.value.tail(1) == 'NELEC   -1'
+
+
+def test_no_output(make_executable):
+    backend = NativeBackend(make_executable("echo 'STOP'\n"))
+
+    with pytest.raises(ElsepaError) as info:
+        backend.run("IZ     80\n")
+    assert info.value.exit_code == 0
+
+
+def test_timeout(make_executable):
+    backend = NativeBackend(make_executable("exec sleep 10\n"),
+                            timeout=0.2)
+
+    with pytest.raises(ElsepaTimeout):
+        backend.run("IZ     80\n")
+
+
+def test_retry_policy():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectionError("daemon went away")
+        return 'done'
+
+    assert RetryPolicy(attempts=3, delay=0).call(flaky) == 'done'
+
+    calls.clear()
+    with pytest.raises(ConnectionError):
+        RetryPolicy(attempts=2, delay=0).call(flaky)
+    assert len(calls) == 2
+
+    def broken():
+        calls.append(1)
+        raise ElsepaError('elscata', 1, '')
+
+    calls.clear()
+    with pytest.raises(ElsepaError):
+        RetryPolicy(attempts=3, delay=0).call(broken)
+    assert len(calls) == 1
@@ -0,0 +1,11 @@
+import subprocess
+import sys
+
+
+def test_import_without_docker():
+    """Importing the package, or running on the native backend, should
+    neither load `docker` nor contact the Docker daemon."""
+    code = "import sys, elsepa, elsepa.run, elsepa.batch\n" \
+           "elsepa.elscata\n" \
+           "assert 'docker' not in sys.modules\n"
+    subprocess.run([sys.executable, '-c', code], check=True)
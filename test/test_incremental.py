@@ -0,0 +1,40 @@
+from elsepa.incremental import EnergyGridStore
+from cslib.settings import Settings
+from cslib import units
+
+import numpy as np
+import os
+import pytest
+
+
+def test_incremental_refinement(tmpdir, make_backend):
+    backend = make_backend()
+    store = EnergyGridStore(os.path.join(str(tmpdir), 'store'))
+
+    s = Settings(IZ=80, MCPOL=2, EV=np.array([10, 1000]) * units.eV)
+    r1 = store.elscata(s, backend=backend)
+    assert set(r1) == {'tcstable', 'dcs_1p000e01', 'dcs_1p000e03'}
+
+    s['EV'] = np.array([1000, 100, 10, 20]) * units.eV
+    r2 = store.elscata(s, backend=backend)
+    assert list(np.asarray(r2['tcstable'])['Energy']) == [1000, 100, 10, 20]
+    assert len([n for n in r2 if n.startswith('dcs_')]) == 4
+
+    r3 = store.elscata(s, backend=backend)
+    assert r3.stats is None
+
+    with open(os.path.join(str(tmpdir), 'log')) as f:
+        assert f.read().split('\n') == ['10.0 1000.0', '20.0 100.0', '']
+
+    assert list(store.energies(s, backend)) == [10, 20, 100, 1000]
+
+    # a different potential model is stored separately
+    s['MCPOL'] = 0
+    assert len(store.energies(s, backend)) == 0
+
+
+def test_incremental_outputs(tmpdir, make_backend):
+    store = EnergyGridStore(str(tmpdir.join('store')))
+    s = Settings(IZ=80, EV=np.array([10]) * units.eV)
+    with pytest.raises(TypeError):
+        store.elscata(s, backend=make_backend(), outputs=['tcstable'])
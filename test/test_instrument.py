@@ -0,0 +1,45 @@
+from elsepa.backend import NativeBackend
+from elsepa.cache import ResultCache
+from elsepa.instrument import (
+    BatchStats, add_hook, remove_hook, collect)
+from elsepa.run import run_cached
+
+
+def test_run_stats(tmpdir, make_executable):
+    backend = NativeBackend(make_executable())
+    cache = ResultCache(str(tmpdir.mkdir('cache')))
+    seen = []
+
+    def hook(name, seconds, stats):
+        seen.append(name)
+
+    add_hook(hook)
+    try:
+        with collect() as stats:
+            result = run_cached(backend, "IZ     80\n", cache)
+        result['tcstable']
+    finally:
+        remove_hook(hook)
+
+    assert list(stats.stages) == [
+        'cache_lookup', 'put_archive', 'execute', 'get_archive', 'parse',
+        'cache_store']
+    assert stats.exit_codes == [0]
+    assert stats.bytes_sent == len("IZ     80\n")
+    assert stats.bytes_received > 0
+    assert not stats.cached
+    assert result.stats is stats
+    assert set(seen) == set(stats.stages)
+
+    with collect() as stats:
+        run_cached(backend, "IZ     80\n", cache)
+    assert stats.cached
+    assert list(stats.stages) == ['cache_lookup']
+
+    batch = BatchStats()
+    batch.add(result.stats)
+    batch.add(stats)
+    batch.add(None)
+    assert batch.summary()['cache_lookup']['count'] == 2
+    assert batch.errors == 1
+    assert '2 runs (1 cached), 1 errors' in batch.report()
@@ -0,0 +1,75 @@
+from elsepa.molecule import (composition, atomic_results, additive_tcstable)
+from elsepa.backend import NativeBackend
+from elsepa.result import ElsepaResult
+from elsepa.generate_input import canonical_elscatm_input
+from cslib.settings import Settings
+from cslib import units
+
+import numpy as np
+import os
+
+
+def fake_elscata(tmpdir, make_executable, tcstable):
+    """An `elscata` that logs its input deck and writes `tcstable`."""
+    return make_executable(
+        "grep '^IZ' >> {log}\n"
+        "cat > tcstable.dat << EOF\n{table}EOF\n".format(
+            log=os.path.join(str(tmpdir), 'log'), table=tcstable))
+
+
+def test_composition():
+    water = [(8, np.zeros(3) * units.cm), (1, np.ones(3) * units.cm),
+             (1, -np.ones(3) * units.cm)]
+    assert composition(water) == {8: 1, 1: 2}
+    assert composition(Settings(ATOMS=water)) == {8: 1, 1: 2}
+    assert composition({6: 1, 8: 2}) == {6: 1, 8: 2}
+
+
+def test_atomic_results_deduplicated(tmpdir, make_executable, tcstable):
+    backend = NativeBackend(fake_elscata(tmpdir, make_executable, tcstable))
+    settings = Settings(MCPOL=2, EV=np.array([10, 100]) * units.eV)
+    molecules = [{1: 2, 8: 1}, {1: 2, 6: 1}, {6: 1, 8: 2}]
+
+    atomic = atomic_results(molecules, settings, backend=backend,
+                            known={1: None})
+    assert sorted(atomic) == [1, 6, 8]
+
+    with open(os.path.join(str(tmpdir), 'log')) as f:
+        assert sorted(l.split()[1] for l in f) == ['6', '8']
+
+
+def test_additive_tcstable(tcstable):
+    atomic = {1: ElsepaResult({'tcstable': tcstable.encode()}),
+              8: ElsepaResult({'tcstable': tcstable.encode()})}
+    water = additive_tcstable({1: 2, 8: 1}, atomic)
+    data = np.asarray(water)
+
+    assert list(data['Energy']) == [10.0, 100.0]
+    assert np.allclose(data['Total cs'], [3e-15, 1.2e-15])
+
+
+water_deck = """\
+IZ     8    0.0000e+00  0.0000e+00  0.0000e+00  atomic number, coordinates (cm)
+IZ     1    7.5700e-09  5.8600e-09  0.0000e+00  atomic number, coordinates (cm)
+IZ     1   -7.5700e-09  5.8600e-09  0.0000e+00  atomic number, coordinates (cm)
+MNUCL   3          rho_n (1=P, 2=U, 3=F, 4 = Uu)
+MELEC   4          rho_e (1=TFM, 2=TFD, 3=DHFS, 4=DF, 5=file)
+IELEC  -1          -1=electron, +1=positron
+MEXCH   1          V_ex (0=none, 1=FM, 2=TF, 3=RT)
+MCPOL   0          V_cp (0=none, 1=B, 2=LDA)
+VPOLB  -1          b_pol parameter
+MABS    0          W_abs (0=none, 1=LDA)
+VABSA   2.0        absorption-potential strength, Aabs
+VABSD  -1.0        energy gap DELTA (eV)
+IHEF    1          high-E factorization (0=no, 1=yes, 2=Born)
+EV      1.0000e+02 output kinetic energies (eV)
+EV      1.0000e+03
+"""
+
+
+def test_elscatm_deck():
+    water = [(8, np.zeros(3) * units.cm),
+             (1, np.array([7.57e-9, 5.86e-9, 0]) * units.cm),
+             (1, np.array([-7.57e-9, 5.86e-9, 0]) * units.cm)]
+    settings = Settings(ATOMS=water, EV=np.array([100, 1000]) * units.eV)
+    assert canonical_elscatm_input(settings) == water_deck
@@ -0,0 +1,75 @@
+from elsepa.parse_output import (
+    parse_most_elscata_output, read_table, join_double_header, is_selected,
+    dcs_energy, header_schema)
+
+import numpy as np
+
+
+tcstable = """ #  Total cross sections
+ #
+ #  Energy     Total cs      1st tcs
+ #   (eV)      (cm**2)       (cm**2)
+ #--------------------------------------
+  1.0000E+01  1.0000E-15  2.0000E-16
+  1.0000E+02  4.0000E-16  5.0000E-17
+  1.0000E+03  7.0000E-17  8.0000E-18
+"""
+
+
+def test_join_double_header():
+    h = list(join_double_header(" Energy   Total cs",
+                                "  (eV)    (cm**2)"))
+    assert h == ["Energy (eV)", "Total cs (cm**2)"]
+
+    h = list(join_double_header("a    b", "   c"))
+    assert h == ["a ", " c", "b "]
+
+
+def test_header_schema():
+    lines = tcstable.split('\n')[2:4]
+    schema = header_schema(lines[0][2:], lines[1][2:])
+    assert schema is header_schema(lines[0][2:], lines[1][2:])
+    assert schema.names == ('Energy', 'Total cs', '1st tcs')
+    assert schema.dtype.names == schema.names
+    assert str(schema.units[0]) == 'electron_volt'
+
+    schema = header_schema('', 'x    y    x')
+    assert schema.names == ('x[0]', 'y', 'x[1]')
+
+
+def test_parse_most_elscata_output():
+    df = parse_most_elscata_output(tcstable.split('\n'))
+    data = np.asarray(df)
+
+    assert data.dtype.names == ('Energy', 'Total cs', '1st tcs')
+    assert list(data['Energy']) == [10.0, 100.0, 1000.0]
+    assert list(data['1st tcs']) == [2e-16, 5e-17, 8e-18]
+    assert df.comments[-1].strip() == "(eV)      (cm**2)       (cm**2)"
+
+
+def test_read_table():
+    lines = ["1 2 3", "4 5 6", ""]
+    assert read_table(lines, 3).tolist() == [[1, 2, 3], [4, 5, 6]]
+
+    # rows with the wrong number of values are skipped
+    lines = ["1 2 3", "4 5", "7 8 9"]
+    assert read_table(lines, 3).tolist() == [[1, 2, 3], [7, 8, 9]]
+
+    assert read_table([""], 3).shape == (0, 3)
+    assert read_table([], 3).shape == (0, 3)
+
+    # blocks are read one at a time from an iterator
+    lines = iter(["{0} {0}".format(i) for i in range(10)] + ["5"])
+    values = read_table(lines, 2, block_size=3)
+    assert values.tolist() == [[i, i] for i in range(10)]
+
+
+def test_is_selected():
+    assert is_selected('dcs_1p000e03', None)
+    assert is_selected('dcs_1p000e03', ['tcstable', 'dcs_*'])
+    assert not is_selected('scfield', ['tcstable', 'dcs_*'])
+
+
+def test_dcs_energy():
+    assert dcs_energy('dcs_1p000e03') == 1000.0
+    assert dcs_energy('dcs_2p500e-01') == 0.25
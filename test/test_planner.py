@@ -0,0 +1,81 @@
+from elsepa.planner import (
+    CostModel, energy_features, lpt_order, lpt_schedule, balanced_chunks)
+from elsepa.energy_grid import split_energies
+from elsepa.batch import elscata_many
+from cslib.settings import Settings
+from cslib import units
+
+import os
+
+import numpy as np
+
+
+def fake_time(settings):
+    """Run time of 0.1 s per run, plus a cost per energy growing with
+    log E and IZ, and doubled by the muffin-tin model."""
+    x = energy_features(settings)
+    return 0.1 + (0.01 * x[:, 0] + 0.02 * x[:, 1] + 0.001 * x[:, 2] +
+                  0.05 * x[:, 3]).sum()
+
+
+def random_settings(rng):
+    n = rng.randint(1, 10)
+    return Settings(IZ=int(rng.randint(1, 93)),
+                    MUFFIN=int(rng.randint(0, 2)),
+                    EV=np.sort(rng.uniform(10, 1e5, n)) * units.eV)
+
+
+def test_cost_model(tmpdir):
+    path = os.path.join(str(tmpdir), 'history')
+    model = CostModel(path, min_samples=20)
+    rng = np.random.RandomState(1)
+
+    s = random_settings(rng)
+    assert model.predict(s) == len(s['EV'])
+
+    for _ in range(40):
+        s = random_settings(rng)
+        model.record(s, fake_time(s))
+
+    s = random_settings(rng)
+    assert np.isclose(model.predict(s), fake_time(s))
+
+    # the history is kept on disk
+    model = CostModel(path)
+    assert len(model) == 40
+    assert np.isclose(model.predict(s), fake_time(s))
+
+
+def test_lpt():
+    costs = [1, 1, 1, 1, 2, 2, 3]
+    assert lpt_order(costs) == [6, 4, 5, 0, 1, 2, 3]
+
+    assignment, makespan = lpt_schedule(costs, 2)
+    assert makespan == 6
+    assert sorted(sum(assignment, [])) == list(range(7))
+
+
+def test_balanced_chunks():
+    costs = [1, 1, 1, 1, 1, 1, 6]
+    assert balanced_chunks(costs, 2) == [(0, 6), (6, 7)]
+    assert balanced_chunks([1] * 6, 3) == [(0, 2), (2, 4), (4, 6)]
+    assert balanced_chunks([], 3) == []
+
+    settings = Settings(IZ=80, EV=np.arange(1, 8) * units.keV)
+    parts = split_energies(settings, 2, costs)
+    assert [len(p['EV']) for p in parts] == [6, 1]
+    assert [len(p['EV']) for p in split_energies(settings, 2)] == [4, 3]
+
+
+def test_elscata_many_planned(tmpdir, make_backend):
+    backend = make_backend()
+    model = CostModel(min_samples=100)
+    settings = [Settings(IZ=80, EV=np.array([100]) * units.eV),
+                Settings(IZ=80, EV=np.array([100, 200, 300]) * units.eV),
+                Settings(IZ=79, EV=np.array([10, 20]) * units.eV)]
+
+    results = list(elscata_many(settings, workers=1, backend=backend,
+                                cost_model=model))
+    assert [r.index for r in results] == [1, 2, 0]
+    assert all(r.settings is settings[r.index] for r in results)
+    assert len(model) == 3
@@ -0,0 +1,154 @@
+from elsepa.pool import ContainerPool
+from elsepa.errors import ElsepaError
+
+import pytest
+import threading
+import time
+
+
+class FakeContainer(object):
+    """Stand-in for `DockerContainer`, recording the commands it runs."""
+    created = []
+    fail_create = False
+    failures = 0        # number of creations still to fail
+
+    def __init__(self, image, working_dir=None, **kwargs):
+        if FakeContainer.fail_create or FakeContainer.failures:
+            FakeContainer.failures = max(0, FakeContainer.failures - 1)
+            raise ConnectionError("cannot create container")
+        self.commands = []
+        self.running = False
+        self.removed = False
+        FakeContainer.created.append(self)
+
+    def sh(self, *cmds, check=False):
+        if not self.running:
+            raise ConnectionError("container is gone")
+        self.commands.append(' && '.join(cmds))
+        return b''
+
+    def start(self):
+        self.running = True
+
+    def kill(self):
+        self.running = False
+
+    def is_running(self):
+        return self.running
+
+    def remove(self, force=False):
+        if self.running:
+            raise ConnectionError("cannot remove a running container")
+        self.removed = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    FakeContainer.created = []
+    FakeContainer.fail_create = False
+    FakeContainer.failures = 0
+    monkeypatch.setattr('elsepa.pool.DockerContainer', FakeContainer)
+    with ContainerPool('elsepa', size=1) as pool:
+        yield pool
+
+
+def test_pool_keeps_container_after_job_error(pool):
+    with pytest.raises(ElsepaError):
+        with pool.job() as scratch:
+            raise ElsepaError('elscata', 1, 'bad deck')
+
+    with pool.job() as scratch:
+        assert scratch.container is FakeContainer.created[0]
+    assert len(FakeContainer.created) == 1
+    # the scratch directory of the failed job was removed
+    assert FakeContainer.created[0].commands[1].startswith('rm -rf ')
+
+
+def test_pool_recycles_after_docker_error(pool):
+    with pytest.raises(ConnectionError):
+        with pool.job():
+            raise ConnectionError("daemon went away")
+
+    first, second = FakeContainer.created
+    assert first.removed and not second.removed
+
+    with pool.job():
+        second.kill()
+    assert len(FakeContainer.created) == 3
+    assert second.removed
+
+
+def test_pool_acquire(pool):
+    with pool.job() as a:
+        assert a.path.startswith(pool.scratch_root + '/')
+    with pool.job() as b:
+        assert b.container is a.container and b.path != a.path
+    assert FakeContainer.created[0].commands == [
+        'mkdir -p ' + a.path, 'rm -rf ' + a.path,
+        'mkdir -p ' + b.path, 'rm -rf ' + b.path]
+
+
+def test_pool_discard_errors(pool):
+    container = FakeContainer.created[0]
+    container.kill = lambda: None     # kill fails silently, remove raises
+    pool._discard(container)
+    assert not container.removed and pool._containers == []
+
+
+def test_pool_failed_recycle(pool):
+    FakeContainer.fail_create = True
+    with pytest.raises(ConnectionError):
+        with pool.job():
+            raise ConnectionError("daemon went away")
+    # the dead container is not handed out again
+    assert pool._idle.empty() and pool._containers == []
+
+    with pytest.raises(ConnectionError):
+        with pool.job():
+            pass
+
+    FakeContainer.fail_create = False
+    with pool.job() as scratch:
+        assert scratch.container is FakeContainer.created[-1]
+    assert FakeContainer.created[0].removed
+    assert pool._idle.qsize() == 1
+
+
+def test_pool_failed_start(monkeypatch):
+    FakeContainer.created = []
+    FakeContainer.fail_create = False
+    monkeypatch.setattr('elsepa.pool.DockerContainer', FakeContainer)
+
+    def start(self):
+        if len(FakeContainer.created) == 3:
+            raise ConnectionError("cannot start container")
+        self.running = True
+    monkeypatch.setattr(FakeContainer, 'start', start)
+
+    with pytest.raises(ConnectionError):
+        with ContainerPool('elsepa', size=3):
+            pass
+    # the containers that did start are not left running
+    assert all(c.removed for c in FakeContainer.created)
+
+
+def test_pool_waiter_replenishes(pool):
+    pool.wait_interval = 0.05
+    waiter = []
+
+    def wait_for_container():
+        with pool.job() as scratch:
+            waiter.append(scratch.container)
+
+    with pytest.raises(ConnectionError):
+        with pool.job():
+            thread = threading.Thread(target=wait_for_container)
+            thread.start()
+            time.sleep(0.1)             # the thread waits for our container
+            FakeContainer.failures = 1  # which cannot be replaced
+            raise ConnectionError("daemon went away")
+
+    thread.join(5)
+    assert not thread.is_alive()
+    assert waiter == [FakeContainer.created[-1]]
+    assert len(FakeContainer.created) == 2
@@ -0,0 +1,40 @@
+from elsepa.result import ElsepaResult
+
+import numpy as np
+
+
+tcstable = b""" #  Total cross sections
+ #
+ #  Energy     Total cs
+ #   (eV)      (cm**2)
+ #--------------------------
+  1.0000E+01  1.0000E-15
+  1.0000E+02  4.0000E-16
+"""
+
+
+def test_lazy_parsing():
+    result = ElsepaResult({'tcstable': tcstable, 'input': b"IZ     80\n"})
+
+    assert list(result) == ['tcstable']
+    assert 'tcstable' in result and 'input' not in result
+    assert not result.is_parsed('tcstable')
+    assert result.raw('input') == "IZ     80\n"
+
+    data = np.asarray(result['tcstable'])
+    assert list(data['Energy']) == [10.0, 100.0]
+    assert result.is_parsed('tcstable')
+    assert result['tcstable'] is result['tcstable']
+    assert result.raw('tcstable') == tcstable.decode()
+
+    result.release('tcstable')
+    assert 'tcstable' not in result
+
+
+def test_update():
+    a = ElsepaResult({'tcstable': tcstable})
+    b = ElsepaResult({'dcs_1p000e01': tcstable})
+    a.update(b)
+
+    assert set(a) == {'tcstable', 'dcs_1p000e01'}
+    assert not a.is_parsed('dcs_1p000e01')
@@ -0,0 +1,108 @@
+from elsepa.scheduler import (Scheduler, available_cpus, available_memory)
+from elsepa.executable import DockerContainer
+from elsepa.backend import NativeBackend
+from elsepa.batch import elscata_many
+from cslib.settings import Settings
+from cslib import units
+
+import threading
+import time
+
+import numpy as np
+
+
+def test_available_resources():
+    assert len(available_cpus()) >= 1
+    memory = available_memory()
+    assert memory is None or memory > 0
+
+
+def test_scheduler_admission():
+    scheduler = Scheduler(cpus=[2, 5], memory=3000, memory_per_job=1000)
+    assert scheduler.capacity == 2
+
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def job():
+        with scheduler.job() as allocation:
+            assert allocation.cpu in (2, 5)
+            with lock:
+                running.append(allocation.cpu)
+                peak.append(len(running))
+            time.sleep(0.02)
+            with lock:
+                running.remove(allocation.cpu)
+
+    threads = [threading.Thread(target=job) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert max(peak) == 2
+    u = scheduler.utilization()
+    assert u.jobs == 6 and u.peak == 2
+    assert sum(u.busy.values()) >= 6 * 0.02
+    assert '6 jobs on 2 cores' in scheduler.report()
+
+
+def test_scheduler_memory():
+    scheduler = Scheduler(cpus=[0, 1, 2], memory=2000, memory_per_job=1000)
+    assert scheduler.capacity == 2
+
+    a = scheduler.acquire()
+    b = scheduler.acquire(memory=500)
+    admitted = threading.Event()
+
+    def big_job():
+        with scheduler.job(memory=1000):
+            admitted.set()
+
+    t = threading.Thread(target=big_job)
+    t.start()
+    assert not admitted.wait(0.05)
+    scheduler.release(a)
+    assert admitted.wait(1)
+    t.join()
+    scheduler.release(b)
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.calls = []
+
+    def create_host_config(self, **kwargs):
+        self.calls.append(('create_host_config', kwargs))
+        return kwargs
+
+    def create_container(self, **kwargs):
+        self.calls.append(('create_container', kwargs))
+        return {'Id': 'fake'}
+
+
+def test_container_limits(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr('elsepa.executable._client', client)
+
+    DockerContainer('elsepa')
+    assert 'host_config' not in client.calls[-1][1]
+
+    DockerContainer('elsepa', cpuset='3', mem_limit=2**20)
+    assert client.calls[-2] == ('create_host_config',
+                                {'cpuset_cpus': '3', 'mem_limit': 2**20})
+    assert client.calls[-1][1]['host_config']['cpuset_cpus'] == '3'
+
+
+def test_native_scheduler(make_executable):
+    scheduler = Scheduler(cpus=[0], memory=None)
+    backend = NativeBackend(make_executable(), scheduler=scheduler)
+    settings = [Settings(IZ=z, EV=np.array([100]) * units.eV)
+                for z in (1, 2, 3)]
+
+    results = list(elscata_many(settings, workers=3, backend=backend))
+    assert all(r.error is None for r in results)
+    u = scheduler.utilization()
+    assert u.jobs == 3 and u.peak == 1
+    assert 'scheduler_wait' in results[0].result.stats.stages
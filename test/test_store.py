@@ -0,0 +1,27 @@
+from elsepa.storage import (save_result, load_result)
+
+import numpy as np
+import os
+
+
+def test_store_roundtrip(tmpdir, make_result):
+    path = os.path.join(str(tmpdir), 'result')
+    result = make_result(100)
+    save_result(result, path)
+
+    loaded = load_result(path)
+    assert list(loaded) == ['tcstable']
+    assert np.all(np.asarray(loaded['tcstable']) ==
+                  np.asarray(result['tcstable']))
+    assert loaded['tcstable'].comments == ['test', 'E sigma']
+    # memory mapped read only
+    assert not loaded['tcstable'].flags.writeable
+
+
+def test_store_replace(tmpdir, make_result):
+    path = os.path.join(str(tmpdir), 'result')
+    save_result(make_result(10), path)
+    save_result(make_result(20), path)
+
+    assert len(load_result(path, mmap_mode=None)['tcstable']) == 20
+    assert os.listdir(str(tmpdir)) == ['result']
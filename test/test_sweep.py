@@ -0,0 +1,128 @@
+from elsepa.sweep import (
+    Sweep, SQLiteQueue, DirectoryQueue, job_spec, settings_to_json,
+    settings_from_json, work)
+from elsepa.backend import (NativeBackend, set_default_backend)
+from cslib.settings import Settings
+from cslib import units
+
+import json
+import numpy as np
+import os
+import pytest
+import time
+
+
+def sweep_settings():
+    return [Settings(IZ=iz, EV=np.array([10, 100]) * units.eV)
+            for iz in (1, 6, 8)]
+
+
+def test_settings_json():
+    s = Settings(IZ=80, VABSD=-1.0 * units.eV,
+                 EV=np.array([10, 100]) * units.eV)
+    t = settings_from_json(json.loads(json.dumps(settings_to_json(s))))
+    assert t['IZ'] == 80
+    assert list(t['EV'].to(units.eV).magnitude) == [10, 100]
+    assert job_spec(s)['id'] == job_spec(t)['id']
+
+
+@pytest.mark.parametrize('make_queue', [
+    lambda path: SQLiteQueue(os.path.join(path, 'queue.db')),
+    lambda path: DirectoryQueue(os.path.join(path, 'queue'))])
+def test_sweep(tmpdir, make_queue, make_backend):
+    set_default_backend(make_backend())
+    try:
+        queue = make_queue(str(tmpdir))
+        sweep = Sweep(queue, os.path.join(str(tmpdir), 'results'))
+        ids = sweep.submit(sweep_settings())
+        assert sweep.progress()['pending'] == 3
+
+        # a worker that stops after one job, as if it crashed
+        assert work(queue, sweep.results, max_jobs=1) == 1
+
+        # resubmitting does not add jobs, nor rerun finished ones
+        assert sweep.submit(sweep_settings()) == ids
+        assert sweep.progress() == {
+            'pending': 2, 'running': 0, 'done': 1, 'failed': 0}
+
+        for p in sweep.start_workers(2):
+            p.join()
+        assert sweep.wait(report=lambda counts: None)['done'] == 3
+
+        results = dict(sweep.results_for(ids))
+        assert all(r is not None for r in results.values())
+        assert len(results[ids[0]]['tcstable']) == 2
+    finally:
+        set_default_backend(None)
+
+    with open(os.path.join(str(tmpdir), 'log')) as f:
+        assert len(f.read().split('\n')) == 4
+
+
+@pytest.mark.parametrize('make_queue', [
+    lambda path, **kw: SQLiteQueue(os.path.join(path, 'queue.db'), **kw),
+    lambda path, **kw: DirectoryQueue(os.path.join(path, 'queue'), **kw)])
+def test_queue_stale_lease(tmpdir, make_queue):
+    queue = make_queue(str(tmpdir), lease=0.2, max_attempts=2)
+    spec = job_spec(sweep_settings()[0])
+    queue.submit([spec])
+
+    # the first worker dies while running the job
+    assert queue.claim('a')['id'] == spec['id']
+    assert queue.claim('b') is None
+
+    # once its lease has expired, another worker takes the job over
+    time.sleep(0.3)
+    assert queue.claim('b')['id'] == spec['id']
+
+    # a job that keeps killing its workers fails after max_attempts
+    time.sleep(0.3)
+    assert queue.claim('c') is None
+    assert queue.counts() == {
+        'pending': 0, 'running': 0, 'done': 0, 'failed': 1}
+    assert 'expired' in queue.errors()[spec['id']]
+
+
+def test_directory_queue_order(tmpdir, monkeypatch):
+    queue = DirectoryQueue(str(tmpdir.join('queue')))
+    specs = [job_spec(s) for s in sweep_settings()]
+    specs.sort(key=lambda spec: spec['id'], reverse=True)
+    queue.submit(specs)
+
+    # file times are equal on a filesystem with coarse timestamps
+    pending = os.path.join(queue.path, 'pending')
+    for name in os.listdir(pending):
+        os.utime(os.path.join(pending, name), (1e9, 1e9))
+
+    # another worker claims the first job while we look at the queue
+    scandir = os.scandir
+
+    def racing_scandir(path):
+        entries = list(scandir(path))
+        if path == pending:
+            name = min(e.name for e in entries if e.name[0] != '.')
+            queue._move(name, 'pending', 'running')
+            os.utime(queue._file('running', name))
+        return iter(entries)
+
+    monkeypatch.setattr('elsepa.sweep.os.scandir', racing_scandir)
+    assert queue.claim('b')['id'] == specs[1]['id']
+    monkeypatch.undo()
+    assert queue.claim('c')['id'] == specs[2]['id']
+
+
+@pytest.mark.parametrize('make_queue', [
+    lambda path: SQLiteQueue(os.path.join(path, 'queue.db')),
+    lambda path: DirectoryQueue(os.path.join(path, 'queue'))])
+def test_failed_job_not_retried(tmpdir, make_queue, make_executable):
+    log = os.path.join(str(tmpdir), 'runs')
+    backend = NativeBackend(make_executable(
+        "echo run >> {}\necho 'bad deck'; exit 1\n".format(log)))
+    queue = make_queue(str(tmpdir))
+    queue.submit([job_spec(sweep_settings()[0])])
+
+    assert work(queue, str(tmpdir.join('results')), backend=backend) == 1
+    assert queue.counts()['failed'] == 1
+    assert list(queue.errors().values())[0].startswith('ElsepaError')
+    with open(log) as f:
+        assert f.read() == 'run\n'